@@ -1,10 +1,25 @@
-from browser_use import Agent, ChatOpenAI, ChatGoogle, ChatAnthropic, Browser
+from browser_use import Browser
+from browser_use.browser.events import SaveStorageStateEvent
 from dotenv import load_dotenv
 from boto3 import client
 import os
 import json
 import logging
+import shutil
+import tempfile
 from db_operations import get_latest_successful_run_by_version
+from checkpoints import load_checkpoint, create_checkpoint_hook
+from progress import StepProgressRecorder
+from storage_state import load_project_storage_state, save_project_storage_state, LoggedOutDetector
+from network_profile import createNetworkInterceptor
+from vision import createVisionPayloadReducer
+from budget import get_budget, RunBudget
+from llm_router import HedgedChatModel, LLM_BACKUP_MODELS, LLM_HEDGE_AFTER_SECONDS
+from rate_limiter import rateLimited, save_rate_limit_report
+from browser_profile import get_browser_options
+from warmup import get_prewarmed_browser_options, wait_for_prewarmed_browser, mark_startup, save_startup_report
+from prompt_cache import PromptCacheRecorder
+from web_vitals import createWebVitalsRecorder
 
 load_dotenv()
 
@@ -14,11 +29,30 @@ logger = logging.getLogger(__name__)
 
 
 save_video_path = os.path.dirname(os.path.abspath(__file__)) + '/video'
-print(save_video_path)
-browser = Browser(
-    window_size={'width': 1280, 'height': 800},
-    record_video_dir=save_video_path
-)
+
+def createBrowser(**browser_options):
+    """
+    Create a browser session with the worker's execution profile and video recording
+
+    Args:
+        **browser_options: Extra `Browser` options, e.g. `storage_state` or `keep_alive`
+
+    Returns:
+        Browser: The browser session, launched when the agent starts
+    """
+    return Browser(
+        record_video_dir=save_video_path,
+        **{**get_browser_options(), **get_prewarmed_browser_options(), **browser_options}
+    )
+
+# Created on first use, so importing the worker does not build a browser it may never need
+browser = None
+
+def getBrowser():
+    global browser
+    if browser is None:
+        browser = createBrowser()
+    return browser
 
 # Initialize S3 client
 s3_client = client(
@@ -28,70 +62,144 @@ s3_client = client(
     region_name=os.getenv('AWS_REGION', 'us-east-1')
 )
 
-def getLLM(task):
-    modelProvider = task["modelProvider"]
-    modelSlug = task["modelSlug"]
-    
+def getChatModel(modelProvider, modelSlug):
+    # Provider SDKs are imported on first use, a worker only needs the ones its message names
     if modelProvider.lower() == "openai":
-        return ChatOpenAI(model=modelSlug)
+        from browser_use.llm.openai.chat import ChatOpenAI
+        llm = ChatOpenAI(model=modelSlug)
     elif modelProvider.lower() == "google":
-        return ChatGoogle(model=modelSlug)
+        from browser_use.llm.google.chat import ChatGoogle
+        llm = ChatGoogle(model=modelSlug)
     elif modelProvider.lower() == "anthropic":
-        return ChatAnthropic(model=modelSlug)
+        from browser_use.llm.anthropic.chat import ChatAnthropic
+        llm = ChatAnthropic(model=modelSlug)
+    elif modelProvider.lower() == "fake":
+        from fake_llm import getFakeChatModel
+        return getFakeChatModel(modelSlug)
     else:
         raise ValueError(f"Unsupported model provider: {modelProvider}")
+    # Concurrent runs queue for the model's request and token capacity instead of hitting 429s
+    return rateLimited(llm)
 
 
-def load_json_from_s3(test_run_slug):
+def getLLM(task):
+    llm = getChatModel(task["modelProvider"], task["modelSlug"])
+
+    # With backup models, slow or failing requests are hedged or retried on the next model
+    backup_models = task.get("backupModels") or LLM_BACKUP_MODELS
+    if not backup_models:
+        return llm
+    backups = [getChatModel(backup["modelProvider"], backup["modelSlug"]) for backup in backup_models]
+    return HedgedChatModel([llm] + backups, hedge_after_seconds=float(task.get("hedgeAfterSeconds") or LLM_HEDGE_AFTER_SECONDS))
+
+
+def load_json_from_s3_key(s3_key):
     """
-    Load the JSON file from S3 for a given test run slug
-    
+    Load and parse a JSON file from S3
+
     Args:
-        test_run_slug (str): The slug identifier of the test run
-    
+        s3_key (str): The key of the JSON file in the bucket
+
     Returns:
-        dict or None: The JSON data if found and valid, None otherwise
+        dict or list or None: The JSON data if found and valid, None otherwise
     """
     try:
         bucket_name = os.getenv('S3_BUCKET_NAME', 'flow-tester')
-        s3_key = f"test-runs/{test_run_slug}/run.json"
-        
+
         logger.info(f"Attempting to load JSON from S3: s3://{bucket_name}/{s3_key}")
-        
+
         # Download the file from S3
         response = s3_client.get_object(Bucket=bucket_name, Key=s3_key)
         file_content = response['Body'].read().decode('utf-8')
-        
+
         # Parse JSON
-        json_data = json.loads(file_content)
-        logger.info(f"Successfully loaded JSON for test run: {test_run_slug}")
-        
-        return json_data
-        
+        return json.loads(file_content)
+
     except s3_client.exceptions.NoSuchKey:
-        logger.warning(f"No JSON file found in S3 for test run: {test_run_slug}")
+        logger.warning(f"No JSON file found in S3: {s3_key}")
         return None
     except json.JSONDecodeError as e:
-        logger.error(f"Invalid JSON format for test run {test_run_slug}: {e}")
+        logger.error(f"Invalid JSON format in {s3_key}: {e}")
         return None
     except Exception as e:
-        logger.error(f"Error loading JSON from S3 for test run {test_run_slug}: {e}")
+        logger.error(f"Error loading JSON from S3 {s3_key}: {e}")
+        return None
+
+
+def load_json_from_s3(test_run_slug):
+    """
+    Load the JSON file from S3 for a given test run slug
+    
+    Args:
+        test_run_slug (str): The slug identifier of the test run
+    
+    Returns:
+        dict or None: The JSON data if found and valid, None otherwise
+    """
+    json_data = load_json_from_s3_key(f"test-runs/{test_run_slug}/run.json")
+    if json_data is not None:
+        logger.info(f"Successfully loaded JSON for test run: {test_run_slug}")
+    return json_data
+
+
+def load_run_index_from_s3(test_run_slug):
+    """
+    Load the lightweight index manifest of a test run (step count, per-step status, timings and screenshot keys)
+
+    Args:
+        test_run_slug (str): The slug identifier of the test run
+
+    Returns:
+        dict or None: The index data if found and valid, None otherwise
+    """
+    return load_json_from_s3_key(f"test-runs/{test_run_slug}/index.json")
+
+
+def load_run_steps_from_s3(test_run_slug, start_step=1, end_step=None, run_index=None):
+    """
+    Load the detail objects of a range of steps, fetching only the chunks that cover the range
+
+    Args:
+        test_run_slug (str): The slug identifier of the test run
+        start_step (int): First step to load (1-based, inclusive)
+        end_step (int): Last step to load (inclusive), defaults to the last step of the run
+        run_index (dict): Already loaded index manifest, loaded from S3 if not given
+
+    Returns:
+        list or None: The step details in order if the index was found, None otherwise
+    """
+    if run_index is None:
+        run_index = load_run_index_from_s3(test_run_slug)
+    if not run_index:
         return None
 
+    if end_step is None:
+        end_step = run_index['number_of_steps']
+    chunk_size = run_index['chunk_size']
+
+    steps = []
+    for chunk in range((start_step - 1) // chunk_size, (end_step - 1) // chunk_size + 1):
+        chunk_steps = load_json_from_s3_key(f"test-runs/{test_run_slug}/steps/{chunk}.json") or []
+        steps.extend(step for step in chunk_steps if start_step <= step['step'] <= end_step)
+    return steps
+
 
-def get_successful_run_data(test_version_slug):
+def get_successful_run_data(test_version_slug, run_info=None):
     """
     Get the latest successful run data for a test version, including the JSON from S3
     
     Args:
         test_version_slug (str): The slug identifier of the test version
+        run_info (dict): The version's latest successful run, if the caller already looked it up
+            (e.g. in a batch with `get_latest_successful_runs_by_versions`)
     
     Returns:
         dict or None: Complete run data with JSON content if found, None otherwise
     """
     try:
         # Get the latest successful run from database
-        run_info = get_latest_successful_run_by_version(test_version_slug)
+        if run_info is None:
+            run_info = get_latest_successful_run_by_version(test_version_slug)
         
         if not run_info:
             logger.info(f"No successful run found for test version: {test_version_slug}")
@@ -167,38 +275,155 @@ def prepareInitialActions(actions):
     return prepared_actions
     
 
-async def processTask(message):
+async def openProjectBrowser(organization_slug, project_slug, load_snapshot=True):
+    """
+    Create a browser that starts from the project's authenticated storage state snapshot, if there is one
+
+    Args:
+        organization_slug (str): The slug identifier of the organization
+        project_slug (str): The slug identifier of the project
+        load_snapshot (bool): Start from the snapshot, the project's login test starts logged out
+
+    Returns:
+        tuple: The browser, the local storage state file it syncs with and whether a snapshot was loaded
+    """
+    storage_state = load_project_storage_state(organization_slug, project_slug) if load_snapshot else None
+    state_dir = tempfile.mkdtemp(prefix='storage-state-')
+    storage_state_path = os.path.join(state_dir, 'storage_state.json')
+    if storage_state:
+        with open(storage_state_path, 'w') as file:
+            json.dump(storage_state, file)
+
+    # Kept alive so the storage state can still be captured after the agent finishes
+    project_browser = createBrowser(storage_state=storage_state_path, user_data_dir=None, keep_alive=True)
+    return project_browser, storage_state_path, storage_state is not None
+
+
+async def updateProjectStorageState(message, project_browser, storage_state_path, result):
+    """
+    Capture the storage state after the project's login test succeeded, which creates or refreshes
+    the snapshot the project's other tests start from. Other runs only write the snapshot after they
+    started logged out and logged in again, a test that ends logged out must not replace it.
+
+    Args:
+        message (dict): The test run message, its `storageStateMode` is 'capture' or a logged out 'use'
+        project_browser (Browser): The browser the run used
+        storage_state_path (str): The local storage state file of the browser
+        result (AgentHistoryList): The result of the run
+    """
+    organization_slug = message['organizationSlug']
+    project_slug = message['projectSlug']
+    if not result.is_done() or result.is_successful() is False:
+        logger.warning(f"Test run {message['testRunSlug']} did not succeed, keeping the storage state of project {project_slug}")
+        return
+
+    await project_browser.event_bus.dispatch(SaveStorageStateEvent(path=storage_state_path))
+    if os.path.exists(storage_state_path):
+        with open(storage_state_path) as file:
+            save_project_storage_state(organization_slug, project_slug, json.load(file))
+
+
+async def processTask(message, task_browser=None):
+    # Imported on first use, the agent modules take a second to load (the pre-warm phase loads them during the first poll)
+    from browser_use import Agent
     task = message['task']
-    # testVersionSlug = message['testVersionSlug']
-    
-    # # Get previous successful run data
-    # previous_run_data = get_successful_run_data(testVersionSlug)
-    
-    # if previous_run_data:
-    #     logger.info(f"Found previous successful run data for version: {testVersionSlug}")
-        
-    #     # You can now use the previous_run_data in your task
-    #     # previous_run_data contains:
-    #     # - run_info: database information about the run (slug, results_url, model, etc.)
-    #     # - run_data: the complete JSON data from S3 (screenshots, actions, results, etc.)
-        
-    #     # Example: You could modify the task based on previous run data
-    #     # task_with_context = f"{task}\n\nPrevious successful run info:\n{json.dumps(previous_run_data['run_info'], indent=2)}"
-        
-    #     # For now, we'll just log that we have the data
-    #     # logger.info(f"Previous run had {len()} screenshots")
-    # else:
-    #     logger.info(f"No previous successful run found for version: {testVersionSlug}")
-    
+    # A pre-warmed browser is only handed out once it is up
+    await wait_for_prewarmed_browser()
+
+    # Resume from the last checkpoint if this message was redelivered after an interrupted run
+    testRunSlug = message['testRunSlug']
+    checkpoint = load_checkpoint(testRunSlug)
+    initial_actions = None
+    replayed_actions_count = 0
+    if checkpoint and checkpoint.get('model_actions'):
+        initial_actions = prepareInitialActions(checkpoint['model_actions'])
+        # prepareInitialActions inserts a wait between every two replayed actions
+        replayed_actions_count = (len(initial_actions) + 1) // 2
+        logger.info(f"Resuming test run {testRunSlug} by replaying {replayed_actions_count} checkpointed actions")
+        last_urls = [url for url in checkpoint.get('urls', []) if url]
+        task = f"{task}\n\nNote: this run was interrupted and the first {checkpoint.get('number_of_steps')} steps were already performed and replayed"
+        if last_urls:
+            task = f"{task}, the browser is currently at {last_urls[-1]}"
+        task = f"{task}. Continue the task from this point."
+
+    # Tests opt in to the project's storage state: 'use' starts logged in from the snapshot and 'capture',
+    # the project's login test, saves it. Skipped when the caller (e.g. a suite) brings its own browser
+    project_browser = None
+    logged_out_detector = None
+    storage_state_mode = message.get('storageStateMode')
+    if task_browser is None and storage_state_mode in ('use', 'capture') and message.get('organizationSlug') and message.get('projectSlug'):
+        project_browser, storage_state_path, had_snapshot = await openProjectBrowser(
+            message['organizationSlug'], message['projectSlug'], load_snapshot=storage_state_mode == 'use'
+        )
+        task_browser = project_browser
+        if storage_state_mode == 'use':
+            logged_out_detector = LoggedOutDetector(message['organizationSlug'], message['projectSlug'], had_snapshot)
+
+    run_browser = task_browser or getBrowser()
+    network_interceptor = createNetworkInterceptor(message)
+    if network_interceptor:
+        network_interceptor.attach(run_browser)
+
     llm = getLLM(message)
-    # model_actions = prepareInitialActions(previous_run_data['run_data'].get('model_actions', []))
     agent = Agent(
         task=task,
         llm=llm,
-        browser=browser,
+        browser=run_browser,
         calculate_cost=True,
-        # initial_actions=model_actions
+        initial_actions=initial_actions
+    )
+    if isinstance(llm, HedgedChatModel):
+        llm.install(agent)
+    # browser_use keeps the system prompt identical across steps and marks it for Anthropic's cache
+    prompt_cache_recorder = PromptCacheRecorder()
+    prompt_cache_recorder.install(agent)
+    vision_reducer = createVisionPayloadReducer(message)
+    if vision_reducer:
+        vision_reducer.install(agent)
+    checkpoint_hook = create_checkpoint_hook(
+        testRunSlug,
+        resumed_from=checkpoint if initial_actions else None,
+        replayed_actions_count=replayed_actions_count
     )
-    result = await agent.run()
+    progress_recorder = StepProgressRecorder(testRunSlug)
+    run_budget = RunBudget(get_budget(message))
+    web_vitals_recorder = createWebVitalsRecorder(message)
+
+    async def on_step_start(agent):
+        mark_startup("first_agent_step")
+
+    async def on_step_end(agent):
+        await checkpoint_hook(agent)
+        await progress_recorder.on_step_end(agent)
+        await run_budget.on_step_end(agent)
+        if web_vitals_recorder:
+            await web_vitals_recorder.on_step_end(agent)
+        if logged_out_detector:
+            await logged_out_detector.on_step_end(agent)
+
+    result = None
+    try:
+        result = await run_budget.run(agent, on_step_start=on_step_start, on_step_end=on_step_end)
+        # A 'use' run that started logged out logged in again, so it refreshes the snapshot like the login test
+        if project_browser and (storage_state_mode == 'capture' or (logged_out_detector and logged_out_detector.logged_out)):
+            await updateProjectStorageState(message, project_browser, storage_state_path, result)
+    finally:
+        progress_recorder.close()
+        run_budget.save_report(testRunSlug)
+        if web_vitals_recorder:
+            web_vitals_recorder.save_report(testRunSlug)
+        if network_interceptor:
+            network_interceptor.detach()
+            network_interceptor.save_report(testRunSlug)
+        if vision_reducer:
+            vision_reducer.save_report(testRunSlug, result)
+        if isinstance(llm, HedgedChatModel):
+            llm.save_report(testRunSlug)
+        save_rate_limit_report(testRunSlug, llm)
+        prompt_cache_recorder.save_report(f"test-runs/{testRunSlug}")
+        save_startup_report(testRunSlug)
+        if project_browser:
+            await project_browser.kill()
+            shutil.rmtree(os.path.dirname(storage_state_path), ignore_errors=True)
     return result
 
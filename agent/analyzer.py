@@ -1,10 +1,16 @@
-from browser_use import Agent, ChatOpenAI, ChatGoogle, ChatAnthropic, Browser
+from browser_use import Browser
 from dotenv import load_dotenv
 from boto3 import client
 import os
 import json
 import logging
+import functools
 from db_operations import get_latest_successful_run_by_version
+from budget import get_budget, RunBudget
+from browser_profile import get_browser_options
+from warmup import get_prewarmed_browser_options, wait_for_prewarmed_browser
+from prompt_cache import PromptCacheRecorder
+from rate_limiter import rateLimited
 from pydantic import BaseModel
 
 class TestCase(BaseModel):
@@ -25,9 +31,14 @@ logger = logging.getLogger(__name__)
 
 save_conversation_path = os.path.dirname(os.path.abspath(__file__)) + '/log'
 
-browser = Browser(
-    window_size={'width': 1280, 'height': 800},
-)
+# Created on first use, so importing the worker does not build a browser it may never need
+browser = None
+
+def getBrowser():
+    global browser
+    if browser is None:
+        browser = Browser(**get_browser_options(), **get_prewarmed_browser_options())
+    return browser
 
 # Initialize S3 client
 s3_client = client(
@@ -41,33 +52,54 @@ def getLLM(task):
     modelProvider = task["modelProvider"]
     modelSlug = task["modelSlug"]
     
+    # Provider SDKs are imported on first use, a worker only needs the ones its message names
     if modelProvider.lower() == "openai":
-        return ChatOpenAI(model=modelSlug)
+        from browser_use.llm.openai.chat import ChatOpenAI
+        llm = ChatOpenAI(model=modelSlug)
     elif modelProvider.lower() == "google":
-        return ChatGoogle(model=modelSlug)
+        from browser_use.llm.google.chat import ChatGoogle
+        llm = ChatGoogle(model=modelSlug)
     elif modelProvider.lower() == "anthropic":
-        return ChatAnthropic(model=modelSlug)
+        from browser_use.llm.anthropic.chat import ChatAnthropic
+        llm = ChatAnthropic(model=modelSlug)
     else:
         raise ValueError(f"Unsupported model provider: {modelProvider}")
+    # Analyses share the providers' rate limits with test runs
+    return rateLimited(llm)
     
 
-def getAnalysisTemplate(): 
+# Read once per worker, the template does not change while it runs
+@functools.cache
+def getAnalysisTemplate():
     with open(f"{os.path.dirname(os.path.abspath(__file__))}/prompts/analyze-website.md", 'r') as file:
-        content = file.read()  # Read entire file
-        return(content)
+        return file.read()
 
 async def processAnalysis(message):
+    from browser_use import Agent
     organization_domain = message['organizationDomain']
-    task = getAnalysisTemplate() + ' \n\n ## Website to Analyze \n ' + organization_domain
+    # The template goes in the system prompt, which is the same for every step and every analysis,
+    # so providers serve it from their prompt cache; only the website is in the task
+    task = 'Analyze the website below following the website analysis instructions. \n\n ## Website to Analyze \n ' + organization_domain
     
     llm = getLLM(message)
+    await wait_for_prewarmed_browser()
     agent = Agent(
         task=task,
         llm=llm,
-        browser=browser,
+        browser=getBrowser(),
         calculate_cost=True,
-        output_model_schema=TestCases
+        output_model_schema=TestCases,
+        extend_system_message=getAnalysisTemplate()
     )
-    result = await agent.run()
+    prompt_cache_recorder = PromptCacheRecorder()
+    prompt_cache_recorder.install(agent)
+    run_budget = RunBudget(get_budget(message))
+    try:
+        result = await run_budget.run(agent, on_step_end=run_budget.on_step_end)
+    finally:
+        if message.get('analysisSlug'):
+            prompt_cache_recorder.save_report(f"analyses/{message['analysisSlug']}")
+            run_budget.save_analysis_report(message['analysisSlug'])
+    if run_budget.exceeded:
+        logger.warning(f"Analysis of {organization_domain} stopped: {run_budget.get_failure_reason()}")
     return result
-
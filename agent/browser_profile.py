@@ -0,0 +1,56 @@
+from dotenv import load_dotenv
+import os
+
+load_dotenv()
+
+# Config
+# "headed" runs Chromium on the Xvfb display started by scripts/startup.sh, "headless" needs no display
+BROWSER_MODE = os.getenv('BROWSER_MODE', 'headed')
+BROWSER_LOW_RESOURCE = os.getenv('BROWSER_LOW_RESOURCE', 'false').lower() == 'true'
+BROWSER_RENDERER_PROCESS_LIMIT = int(os.getenv('BROWSER_RENDERER_PROCESS_LIMIT', '2'))
+BROWSER_JS_HEAP_MB = int(os.getenv('BROWSER_JS_HEAP_MB', '512'))
+
+WINDOW_SIZE = {'width': 1280, 'height': 800}
+
+# Added to browser_use's defaults, which already disable background networking, timer
+# throttling and renderer backgrounding
+LOW_RESOURCE_CHROMIUM_ARGS = [
+    # Workers have no GPU, skip the GPU process and its software fallback
+    '--disable-gpu',
+    '--disable-software-rasterizer',
+    '--disable-accelerated-2d-canvas',
+    '--disable-accelerated-video-decode',
+    # Bound the number of renderers, same-site tabs and frames share one
+    f'--renderer-process-limit={BROWSER_RENDERER_PROCESS_LIMIT}',
+    '--process-per-site',
+    f'--js-flags=--max-old-space-size={BROWSER_JS_HEAP_MB}',
+    '--aggressive-cache-discard',
+    '--mute-audio',
+    '--disable-notifications',
+]
+
+
+def get_browser_options(mode=None, low_resource=None):
+    """
+    Get the `Browser` options of the worker's execution profile
+
+    Args:
+        mode (str): "headed" or "headless", defaults to BROWSER_MODE
+        low_resource (bool): Add the low-resource Chromium flags, defaults to BROWSER_LOW_RESOURCE
+
+    Returns:
+        dict: Options to pass to `Browser`
+    """
+    mode = mode or BROWSER_MODE
+    low_resource = BROWSER_LOW_RESOURCE if low_resource is None else low_resource
+
+    options = {}
+    if mode == 'headless':
+        # Headless sizes the page through the viewport, there is no window
+        options['headless'] = True
+        options['viewport'] = WINDOW_SIZE
+    else:
+        options['window_size'] = WINDOW_SIZE
+    if low_resource:
+        options['args'] = LOW_RESOURCE_CHROMIUM_ARGS
+    return options
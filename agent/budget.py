@@ -0,0 +1,195 @@
+from boto3 import client
+from dotenv import load_dotenv
+import os
+import json
+import time
+import asyncio
+import logging
+from db_operations import update_test_run_failure_reason, update_analysis_failure_reason
+
+load_dotenv()
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Config, a limit of 0 turns that budget off
+S3_BUCKET_NAME = os.getenv('S3_BUCKET_NAME', 'flow-tester')
+RUN_MAX_STEPS = int(os.getenv('RUN_MAX_STEPS', '100'))
+RUN_MAX_SECONDS = int(os.getenv('RUN_MAX_SECONDS', '1800'))
+RUN_MAX_TOKENS = int(os.getenv('RUN_MAX_TOKENS', '0'))
+RUN_MAX_COST = float(os.getenv('RUN_MAX_COST', '0'))
+# How long a step still in flight at the wall-clock limit may take to end before the run is cancelled
+RUN_STOP_GRACE_SECONDS = float(os.getenv('RUN_STOP_GRACE_SECONDS', '30'))
+
+# Initialize S3 client
+s3_client = client(
+    's3',
+    aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+    aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+    region_name=os.getenv('AWS_REGION', 'us-east-1')
+)
+
+
+def load_project_budget(organization_slug, project_slug):
+    """
+    Load the budget overrides of a project from S3
+
+    Args:
+        organization_slug (str): The slug identifier of the organization
+        project_slug (str): The slug identifier of the project
+
+    Returns:
+        dict: The project's budget keys, empty if the project has none
+    """
+    try:
+        response = s3_client.get_object(
+            Bucket=S3_BUCKET_NAME,
+            Key=f"projects/{organization_slug}/{project_slug}/budget.json"
+        )
+        return json.loads(response['Body'].read().decode('utf-8'))
+    except s3_client.exceptions.NoSuchKey:
+        return {}
+    except Exception as e:
+        logger.error(f"Error loading budget of project {project_slug}: {e}")
+        return {}
+
+
+def get_budget(message):
+    """
+    Resolve the budget of a run: worker defaults, overridden by the project's budget,
+    overridden by the message's `budget`
+
+    Args:
+        message (dict): The task message
+
+    Returns:
+        dict: `maxSteps`, `maxSeconds`, `maxTokens` and `maxCost`
+    """
+    budget = {
+        "maxSteps": RUN_MAX_STEPS,
+        "maxSeconds": RUN_MAX_SECONDS,
+        "maxTokens": RUN_MAX_TOKENS,
+        "maxCost": RUN_MAX_COST,
+    }
+    if message.get('organizationSlug') and message.get('projectSlug'):
+        budget.update(load_project_budget(message['organizationSlug'], message['projectSlug']))
+    budget.update(message.get('budget') or {})
+    return budget
+
+
+class RunBudget:
+    """
+    Stops an agent at the next step boundary once it has used up its steps, wall-clock time,
+    tokens or dollars. The agent finishes its run normally, so the partial history is returned
+    and saved like any other unfinished run. Started through `run`, the wall-clock limit also
+    holds within a step: a hung LLM call or page load is cancelled shortly after the limit.
+    """
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.max_steps = int(budget.get('maxSteps') or 0)
+        self.start_time = time.time()
+        self.exceeded = None
+        self.usage = {"steps": 0, "seconds": 0, "tokens": 0, "cost": 0}
+
+    def get_max_steps(self):
+        # `agent.run` always needs a step limit, without a budget it keeps its own default
+        return self.max_steps or 100
+
+    async def run(self, agent, **run_options):
+        """
+        Run the agent within the budget. At the wall-clock limit the agent is stopped like at a step
+        boundary, a step that is still running RUN_STOP_GRACE_SECONDS later is cancelled.
+
+        Args:
+            agent (Agent): The agent to run, `on_step_end` should call this budget's `on_step_end`
+            **run_options: Other `agent.run` options, e.g. `on_step_start`
+
+        Returns:
+            AgentHistoryList: The history of the run, partial if it was cancelled
+        """
+        max_seconds = float(self.budget.get('maxSeconds') or 0)
+        if not max_seconds:
+            return await agent.run(max_steps=self.get_max_steps(), **run_options)
+
+        remaining_seconds = max(max_seconds - (time.time() - self.start_time), 0)
+        stop_timer = asyncio.get_running_loop().call_later(remaining_seconds, self.stop_at_deadline, agent)
+        try:
+            return await asyncio.wait_for(
+                agent.run(max_steps=self.get_max_steps(), **run_options),
+                timeout=remaining_seconds + RUN_STOP_GRACE_SECONDS
+            )
+        except asyncio.TimeoutError:
+            self.exceeded = "max_seconds"
+            self.usage["seconds"] = time.time() - self.start_time
+            logger.warning(f"Run did not stop within {RUN_STOP_GRACE_SECONDS:g}s of its max_seconds budget, cancelled it "
+                           f"after {self.usage['seconds']:.1f}s")
+            return agent.history
+        finally:
+            stop_timer.cancel()
+
+    def stop_at_deadline(self, agent):
+        if self.exceeded or agent.history.is_done():
+            return
+        self.exceeded = "max_seconds"
+        self.usage["seconds"] = time.time() - self.start_time
+        logger.warning(f"Run exceeded its max_seconds budget during step {agent.state.n_steps}, stopping")
+        agent.stop()
+
+    async def update_usage(self, agent):
+        usage = await agent.token_cost_service.get_usage_summary()
+        self.usage = {
+            "steps": agent.state.n_steps - 1,
+            "seconds": time.time() - self.start_time,
+            "tokens": usage.total_tokens,
+            "cost": usage.total_cost,
+        }
+
+    def find_exceeded_budget(self):
+        if self.max_steps and self.usage["steps"] >= self.max_steps:
+            return "max_steps"
+        if self.budget.get('maxSeconds') and self.usage["seconds"] >= float(self.budget['maxSeconds']):
+            return "max_seconds"
+        if self.budget.get('maxTokens') and self.usage["tokens"] >= int(self.budget['maxTokens']):
+            return "max_tokens"
+        if self.budget.get('maxCost') and self.usage["cost"] >= float(self.budget['maxCost']):
+            return "max_cost"
+        return None
+
+    async def on_step_end(self, agent):
+        await self.update_usage(agent)
+        if self.exceeded or agent.history.is_done():
+            return
+        self.exceeded = self.find_exceeded_budget()
+        if self.exceeded:
+            logger.warning(f"Run exceeded its {self.exceeded} budget after {self.usage['steps']} steps, "
+                           f"{self.usage['seconds']:.1f}s, {self.usage['tokens']} tokens and ${self.usage['cost']:.4f}, stopping")
+            agent.stop()
+
+    def get_failure_reason(self):
+        return f"budget_exceeded:{self.exceeded}" if self.exceeded else None
+
+    def save_report(self, test_run_slug):
+        """Save the run's budget and usage, and record the failure reason if a budget stopped it"""
+        self.put_report(f"test-runs/{test_run_slug}")
+        if self.exceeded:
+            update_test_run_failure_reason(test_run_slug, self.get_failure_reason())
+
+    def save_analysis_report(self, analysis_slug):
+        """Save the analysis' budget and usage, and record the failure reason if a budget stopped it"""
+        self.put_report(f"analyses/{analysis_slug}")
+        if self.exceeded:
+            update_analysis_failure_reason(analysis_slug, self.get_failure_reason())
+
+    def put_report(self, prefix):
+        report = {"budget": self.budget, "usage": self.usage, "failure_reason": self.get_failure_reason()}
+        try:
+            s3_client.put_object(
+                Bucket=S3_BUCKET_NAME,
+                Key=f"{prefix}/budget.json",
+                Body=json.dumps(report),
+                ContentType='application/json',
+            )
+        except Exception as e:
+            logger.error(f"Error saving budget report to {prefix}: {e}")
@@ -0,0 +1,179 @@
+from boto3 import client
+from dotenv import load_dotenv
+import os
+import json
+import base64
+import logging
+
+load_dotenv()
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Config
+S3_BUCKET_NAME = os.getenv('S3_BUCKET_NAME', 'flow-tester')
+CHECKPOINT_EVERY_N_STEPS = int(os.getenv('CHECKPOINT_EVERY_N_STEPS', '3'))
+
+# Initialize S3 client
+s3_client = client(
+    's3',
+    aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+    aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+    region_name=os.getenv('AWS_REGION', 'us-east-1')
+)
+
+
+def get_checkpoint_prefix(test_run_slug):
+    return f"test-runs/{test_run_slug}/checkpoint"
+
+
+def build_checkpoint(history, resumed_from=None, replayed_actions_count=0):
+    """
+    Build a compact checkpoint document from the agent history collected so far
+
+    Args:
+        history (AgentHistoryList): The history of the running agent
+        resumed_from (dict): The checkpoint this run was resumed from, if any
+        replayed_actions_count (int): Number of checkpointed actions replayed from `resumed_from`, without
+            the waits `prepareInitialActions` inserts between them
+
+    Returns:
+        dict: Checkpoint data with the actions and URLs of every completed step
+    """
+    history_actions = history.model_actions()
+    if replayed_actions_count:
+        # The replay is recorded as the first history step, with a wait between every two replayed actions,
+        # keep the original actions from `resumed_from` instead
+        history_actions = history_actions[2 * replayed_actions_count - 1:]
+
+    model_actions = []
+    for action in history_actions:
+        # The interacted element is a DOM snapshot, only the action itself is needed for replay
+        model_actions.append({key: value for key, value in action.items() if key != 'interacted_element'})
+
+    number_of_steps = history.number_of_steps()
+    urls = history.urls()
+    if resumed_from:
+        model_actions = resumed_from.get('model_actions', []) + model_actions
+        # The replay is a single history step on top of the steps it replayed
+        number_of_steps = resumed_from.get('number_of_steps', 0) + number_of_steps - 1
+        urls = resumed_from.get('urls', []) + urls
+
+    return {
+        "number_of_steps": number_of_steps,
+        "model_actions": model_actions,
+        "urls": urls,
+    }
+
+
+def save_checkpoint(test_run_slug, history, resumed_from=None, replayed_actions_count=0):
+    """
+    Save the agent history checkpoint and the last screenshot of a test run to S3
+
+    Args:
+        test_run_slug (str): The slug identifier of the test run
+        history (AgentHistoryList): The history of the running agent
+        resumed_from (dict): The checkpoint this run was resumed from, if any
+        replayed_actions_count (int): Number of checkpointed actions replayed from `resumed_from`
+
+    Returns:
+        bool: True if the checkpoint was saved, False otherwise
+    """
+    prefix = get_checkpoint_prefix(test_run_slug)
+    try:
+        checkpoint = build_checkpoint(history, resumed_from, replayed_actions_count)
+
+        last_screenshot = history.screenshots(n_last=1)
+        if last_screenshot and last_screenshot[0]:
+            screenshot_key = f"{prefix}/last-screenshot.png"
+            s3_client.put_object(
+                Bucket=S3_BUCKET_NAME,
+                Key=screenshot_key,
+                Body=base64.b64decode(last_screenshot[0]),
+                ContentType='image/png',
+            )
+            checkpoint["last_screenshot"] = screenshot_key
+
+        s3_client.put_object(
+            Bucket=S3_BUCKET_NAME,
+            Key=f"{prefix}/checkpoint.json",
+            Body=json.dumps(checkpoint, default=str),
+            ContentType='application/json',
+        )
+        logger.info(f"Saved checkpoint for test run {test_run_slug} at step {checkpoint['number_of_steps']}")
+        return True
+
+    except Exception as e:
+        logger.error(f"Error saving checkpoint for test run {test_run_slug}: {e}")
+        return False
+
+
+def load_checkpoint(test_run_slug):
+    """
+    Load the checkpoint of an interrupted test run from S3
+
+    Args:
+        test_run_slug (str): The slug identifier of the test run
+
+    Returns:
+        dict or None: The checkpoint data if found, None otherwise
+    """
+    try:
+        response = s3_client.get_object(
+            Bucket=S3_BUCKET_NAME,
+            Key=f"{get_checkpoint_prefix(test_run_slug)}/checkpoint.json"
+        )
+        checkpoint = json.loads(response['Body'].read().decode('utf-8'))
+        logger.info(f"Found checkpoint for test run {test_run_slug} at step {checkpoint.get('number_of_steps')}")
+        return checkpoint
+
+    except s3_client.exceptions.NoSuchKey:
+        return None
+    except Exception as e:
+        logger.error(f"Error loading checkpoint for test run {test_run_slug}: {e}")
+        return None
+
+
+def delete_checkpoint(test_run_slug):
+    """
+    Delete the checkpoint of a test run once its final results are saved
+
+    Args:
+        test_run_slug (str): The slug identifier of the test run
+    """
+    prefix = get_checkpoint_prefix(test_run_slug)
+    try:
+        s3_client.delete_objects(
+            Bucket=S3_BUCKET_NAME,
+            Delete={
+                'Objects': [
+                    {'Key': f"{prefix}/checkpoint.json"},
+                    {'Key': f"{prefix}/last-screenshot.png"},
+                ],
+                'Quiet': True,
+            }
+        )
+    except Exception as e:
+        logger.error(f"Error deleting checkpoint for test run {test_run_slug}: {e}")
+
+
+def create_checkpoint_hook(test_run_slug, resumed_from=None, replayed_actions_count=0, every_n_steps=CHECKPOINT_EVERY_N_STEPS):
+    """
+    Create an `on_step_end` hook that checkpoints the agent history every N steps
+
+    Args:
+        test_run_slug (str): The slug identifier of the test run
+        resumed_from (dict): The checkpoint this run was resumed from, if any
+        replayed_actions_count (int): Number of checkpointed actions replayed from `resumed_from`
+        every_n_steps (int): How many steps to run between checkpoints
+
+    Returns:
+        Callable: Async hook to pass to `agent.run(on_step_end=...)`
+    """
+    async def on_step_end(agent):
+        number_of_steps = agent.history.number_of_steps()
+        if every_n_steps > 0 and number_of_steps % every_n_steps == 0:
+            save_checkpoint(test_run_slug, agent.history, resumed_from, replayed_actions_count)
+
+    return on_step_end
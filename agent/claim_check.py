@@ -0,0 +1,83 @@
+from boto3 import client
+from dotenv import load_dotenv
+import os
+import json
+import gzip
+import uuid
+import logging
+
+load_dotenv()
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Config
+S3_BUCKET_NAME = os.getenv('S3_BUCKET_NAME', 'flow-tester')
+# Messages larger than this are stored compressed in S3 and queued as a claim check, SQS rejects bodies over 256KB
+QUEUE_INLINE_MAX_BYTES = int(os.getenv('QUEUE_INLINE_MAX_BYTES', '65536'))
+# Payloads stay until the bucket's lifecycle rule expires them, a redelivered message still needs its payload
+CLAIM_CHECK_PREFIX = 'queue-payloads'
+# Kept inline in claim checks, the scheduler and the worker read them before the payload is fetched
+ROUTING_FIELDS = ['taskType', 'testRunSlug', 'analysisSlug', 'suiteRunSlug', 'organizationSlug', 'organizationDomain', 'projectSlug']
+
+# Initialize S3 client
+s3_client = client(
+    's3',
+    aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+    aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+    region_name=os.getenv('AWS_REGION', 'us-east-1')
+)
+
+
+def encode_message_body(message, inline_max_bytes=QUEUE_INLINE_MAX_BYTES):
+    """
+    Serialize a queue message, replacing it with a claim check to a gzipped copy in S3 when it is too large
+
+    Args:
+        message (dict): The queue message
+        inline_max_bytes (int): Largest body sent inline
+
+    Returns:
+        str: The SQS message body
+    """
+    body = json.dumps(message)
+    size = len(body.encode('utf-8'))
+    if size <= inline_max_bytes:
+        return body
+
+    key = f"{CLAIM_CHECK_PREFIX}/{uuid.uuid4()}.json.gz"
+    s3_client.put_object(
+        Bucket=S3_BUCKET_NAME,
+        Key=key,
+        Body=gzip.compress(body.encode('utf-8')),
+        ContentType='application/json',
+        ContentEncoding='gzip',
+    )
+    return json.dumps({
+        **{field: message[field] for field in ROUTING_FIELDS if field in message},
+        "claimCheck": {"bucket": S3_BUCKET_NAME, "key": key, "encoding": "gzip", "size": size},
+    })
+
+
+def decode_message_body(body):
+    """
+    Get the full body of a queue message, fetching and decompressing its payload if it is a claim check
+
+    Args:
+        body (str): The SQS message body
+
+    Returns:
+        str: The body of the full message
+    """
+    message = json.loads(body)
+    claim_check = message.get('claimCheck')
+    if not claim_check:
+        return body
+
+    response = s3_client.get_object(Bucket=claim_check.get('bucket', S3_BUCKET_NAME), Key=claim_check['key'])
+    payload = response['Body'].read()
+    if claim_check.get('encoding') == 'gzip':
+        payload = gzip.decompress(payload)
+    logger.info(f"Fetched {claim_check['size']} byte message payload from {claim_check['key']}")
+    return payload.decode('utf-8')
@@ -3,11 +3,21 @@ import asyncio
 import time
 from agent import processTask
 from analyzer import processAnalysis
+from suite import processSuite
+import os
 import json
 import base64
-from db_operations import update_test_run_to_running, update_test_run_to_failed, update_test_run_to_succeeded, update_analysis_to_running, update_analysis_to_failed, update_analysis_to_succeeded
+from db_operations import claim_test_run, get_latest_successful_run_by_version, update_test_run_to_running, update_test_run_to_failed, update_test_run_to_succeeded, update_analysis_to_running, update_analysis_to_failed, update_analysis_to_succeeded
+from checkpoints import delete_checkpoint
+from reuse import decide_reuse, save_reuse_decision, copy_reused_results
+from scheduler import Scheduler, EMPTY, CAPPED
+from visual_diff import save_visual_diff
+from warmup import prewarm_worker, mark_startup
+from memory import memory_monitor
+from claim_check import decode_message_body
 import random
 import string
+import threading
 
 # Generate random string of letters and digits
 def generate_random_string(length):
@@ -19,8 +29,18 @@ s3 = client('s3')
 
 # Config
 S3_BUCKET_NAME='flow-tester'
+STEP_CHUNK_SIZE = 10
 QUEUE_URL = 'https://sqs.us-west-2.amazonaws.com/746664778706/flow-tester-test-runs-queue'
 REGION = 'us-west-2'
+# Queues the worker schedules across, e.g. '[{"url": "...", "weight": 2}, {"url": "...", "weight": 1}]'
+SCHEDULER_QUEUES = json.loads(os.getenv('SCHEDULER_QUEUES', 'null')) or [{"url": QUEUE_URL, "weight": 1}]
+# Messages one worker process runs before it exits, it also exits early when its memory keeps growing
+WORKER_MAX_JOBS = int(os.getenv('WORKER_MAX_JOBS', '1'))
+# How long a worker waits before polling again when every queued message is of an organization at its cap
+WORKER_CAPPED_BACKOFF_SECONDS = float(os.getenv('WORKER_CAPPED_BACKOFF_SECONDS', '15'))
+
+# Set when the worker is asked to stop, e.g. on SIGTERM under the supervisor: it finishes its message and takes no more
+draining = threading.Event()
 
 
 # Initialize SQS client
@@ -159,12 +179,139 @@ def save_result_data(slug, result):
         ContentType='application/json',
     )
 
-def save_result(slug, result):
+def get_step_status(history_item):
+    if any(action_result.error for action_result in history_item.result):
+        return "failed"
+    if any(action_result.is_done for action_result in history_item.result):
+        return "done"
+    return "succeeded"
+
+def save_result_steps(slug, result):
+    """
+    Save the run as a lightweight index manifest plus chunked per-step detail objects,
+    so readers can show the run before downloading every step.
+    """
+    screenshots = map_screenshots_to_paths(slug, result.screenshots())
+    step_index = []
+    step_details = []
+    for idx, history_item in enumerate(result.history, start=1):
+        model_output = history_item.model_output
+        metadata = history_item.metadata
+        chunk = (idx - 1) // STEP_CHUNK_SIZE
+        action_names = [next(iter(action.model_dump(exclude_none=True)), None) for action in model_output.action] if model_output else []
+
+        step_index.append({
+            "step": idx,
+            "chunk": chunk,
+            "status": get_step_status(history_item),
+            "action_names": action_names,
+            "url": history_item.state.url,
+            "memory": model_output.memory if model_output else None,
+            "duration_seconds": metadata.duration_seconds if metadata else None,
+            "screenshot": screenshots[idx - 1],
+        })
+        step_details.append({
+            "step": idx,
+            "model_output": model_output,
+            "results": history_item.result,
+            "url": history_item.state.url,
+            "title": history_item.state.title,
+            "step_start_time": metadata.step_start_time if metadata else None,
+            "step_end_time": metadata.step_end_time if metadata else None,
+        })
+
+    for chunk_start in range(0, len(step_details), STEP_CHUNK_SIZE):
+        chunk_json = json.dumps(step_details[chunk_start:chunk_start + STEP_CHUNK_SIZE], cls=SafeJSONEncoder)
+        s3.put_object(
+            Bucket=S3_BUCKET_NAME,
+            Key=f"test-runs/{slug}/steps/{chunk_start // STEP_CHUNK_SIZE}.json",
+            Body=chunk_json,
+            ContentType='application/json',
+        )
+
+    # Written last, so a present index always points at complete step chunks
+    index_data = {
+        "number_of_steps": len(step_index),
+        "chunk_size": STEP_CHUNK_SIZE,
+        "is_done": result.is_done(),
+        "is_successful": result.is_successful(),
+        "total_duration_seconds": result.total_duration_seconds(),
+        "final_result": result.final_result(),
+        "steps": step_index,
+    }
+    s3.put_object(
+        Bucket=S3_BUCKET_NAME,
+        Key=f"test-runs/{slug}/index.json",
+        Body=json.dumps(index_data, cls=SafeJSONEncoder),
+        ContentType='application/json',
+    )
+
+def save_result(slug, result, message=None, baseline_run=None):
     save_result_screenshots(slug, result)
+    if message:
+        save_visual_diff(slug, baseline_run, result, masks=message.get('visualDiffMasks'))
     save_result_data(slug, result)
+    save_result_steps(slug, result)
+    # The final results supersede the checkpoint of an interrupted run
+    delete_checkpoint(slug)
+
+def is_result_failed(result):
+    """
+    A run failed if the agent never finished, or its final `done` action or result reports no success,
+    e.g. when its last step exceeded a performance budget
+    """
+    if result.is_done() is False or result.is_successful() is False:
+        return True
+    model_actions = result.model_actions()
+    if model_actions and isinstance(model_actions, list):
+        last_action = model_actions[-1]
+        if isinstance(last_action, dict):
+            done_prop = last_action.get("done")
+            if isinstance(done_prop, dict) and done_prop.get("success") is False:
+                return True
+    return False
+
+def report_test_run_result(slug, result, message=None, baseline_run=None):
+    """Save the results of a finished test run and update its status, returns True if it failed"""
+    save_result(slug, result, message, baseline_run)
+    mark_failed = is_result_failed(result)
+
+    if mark_failed:
+        print(f"Task failed, updating test run {slug} status to 'failed'")
+        if update_test_run_to_failed(slug):
+            print(f"Successfully updated test run {slug} status to 'failed'")
+        else:
+            print(f"Failed to update test run {slug} status to 'failed'")
+    else:
+        print(f"Task completed successfully, updating test run {slug} status to 'succeeded'")
+        if update_test_run_to_succeeded(slug):
+            print(f"Successfully updated test run {slug} status to 'succeeded'")
+        else:
+            print(f"Failed to update test run {slug} status to 'succeeded'")
+    return mark_failed
+
+def report_test_run_error(slug, error):
+    # Update status to 'failed' if task failed
+    print(f"Task failed with error: {error}")
+    print(f"Updating test run {slug} status to 'failed'")
+    if update_test_run_to_failed(slug):
+        print(f"Successfully updated test run {slug} status to 'failed'")
+    else:
+        print(f"Failed to update test run {slug} status to 'failed'")
+
+def save_suite_report(suite_run_slug, suite_report):
+    s3.put_object(
+        Bucket=S3_BUCKET_NAME,
+        Key=f"suite-runs/{suite_run_slug}/suite.json",
+        Body=json.dumps(suite_report, indent=2),
+        ContentType='application/json',
+    )
 
 def process_message(body):
     """Process a task and update test run status."""
+    mark_startup("message_received")
+    # Large messages arrive as a claim check to their payload in S3
+    body = decode_message_body(body)
     print(f"Processing message: {body}")
     message = json.loads(body)
     type = message['taskType']
@@ -222,52 +369,95 @@ def process_message(body):
     if type == "test-run":
         slug = message['testRunSlug']
         
-        # Update test run status to 'running' when processing starts
+        # Update test run status to 'running' when processing starts, unless the run already finished or
+        # the reaper requeued it after this message was sent, then another message runs it
         print(f"Updating test run {slug} status to 'running'")
-        if update_test_run_to_running(slug):
+        claimed = claim_test_run(slug, int(message.get('reapCount') or 0))
+        if claimed is False:
+            print(f"Test run {slug} is finished or was requeued, skipping this message")
+            return
+        if claimed:
             print(f"Successfully updated test run {slug} status to 'running'")
         else:
             print(f"Failed to update test run {slug} status to 'running'")
         
+        # Looked up once, both the reuse decision and the visual diff compare against it
+        baseline_run = get_latest_successful_run_by_version(message['testVersionSlug']) if message.get('testVersionSlug') else None
+
+        # Skip the browser and LLM entirely when a recent succeeded run of this version
+        # started from an unchanged page
+        decision_start_time = time.time()
+        reuse_decision = decide_reuse(message, baseline_run)
+        reuse_decision["decision_seconds"] = time.time() - decision_start_time
+        print(f"Reuse decision for test run {slug}: {reuse_decision['reason']}")
+        if reuse_decision["reused"]:
+            copy_reused_results(slug, reuse_decision)
+            save_reuse_decision(slug, reuse_decision)
+            print(f"Reused test run {reuse_decision['reused_from']}, saved {reuse_decision['time_saved_seconds']:.1f}s, updating test run {slug} status to 'succeeded'")
+            if update_test_run_to_succeeded(slug):
+                print(f"Successfully updated test run {slug} status to 'succeeded'")
+            else:
+                print(f"Failed to update test run {slug} status to 'succeeded'")
+            return
+        
         try:
             result = asyncio.run(processTask(message))
-            save_result(slug, result)
-            is_done = result.is_done()
-            model_actions = result.model_actions()
+            report_test_run_result(slug, result, message, baseline_run)
+            save_reuse_decision(slug, reuse_decision)
+            print("Task complete.")
+        except Exception as e:
+            report_test_run_error(slug, e)
+            raise e
 
-            mark_failed = False
-            if is_done is False:
-                mark_failed = True
-            elif model_actions and isinstance(model_actions, list):
-                last_action = model_actions[-1]
-                if isinstance(last_action, dict):
-                    done_prop = last_action.get("done")
-                    if isinstance(done_prop, dict) and done_prop.get("success") is False:
-                        mark_failed = True
+    if type == "suite-run":
+        for test in message['tests']:
+            if not update_test_run_to_running(test['testRunSlug']):
+                print(f"Failed to update test run {test['testRunSlug']} status to 'running'")
 
-            if mark_failed:
-                print(f"Task failed, updating test run {slug} status to 'failed'")
-                if update_test_run_to_failed(slug):
-                    print(f"Successfully updated test run {slug} status to 'failed'")
-                else:
-                    print(f"Failed to update test run {slug} status to 'failed'")
-            else:
-                print(f"Task completed successfully, updating test run {slug} status to 'succeeded'")
-                if update_test_run_to_succeeded(slug):
-                    print(f"Successfully updated test run {slug} status to 'succeeded'")
-                else:
-                    print(f"Failed to update test run {slug} status to 'succeeded'")
+        reported_slugs = set()
 
-            print("Task complete.")
+        def on_test_started(test_message):
+            # The reaper may have requeued a test that waited long enough, its own message runs it then
+            if claim_test_run(test_message['testRunSlug'], int(test_message.get('reapCount') or 0)) is False:
+                print(f"Test run {test_message['testRunSlug']} is finished or was requeued, skipping it in the suite")
+                reported_slugs.add(test_message['testRunSlug'])
+                return False
+            return True
+
+        def on_test_finished(test_message, result, baseline_run):
+            reported_slugs.add(test_message['testRunSlug'])
+            return report_test_run_result(test_message['testRunSlug'], result, test_message, baseline_run)
+
+        def on_test_error(test_message, error):
+            reported_slugs.add(test_message['testRunSlug'])
+            report_test_run_error(test_message['testRunSlug'], error)
+
+        try:
+            suite_report = asyncio.run(processSuite(message, on_test_started=on_test_started, on_test_finished=on_test_finished, on_test_error=on_test_error))
         except Exception as e:
-            # Update status to 'failed' if task failed
-            print(f"Task failed with error: {e}")
-            print(f"Updating test run {slug} status to 'failed'")
-            if update_test_run_to_failed(slug):
-                print(f"Successfully updated test run {slug} status to 'failed'")
-            else:
-                print(f"Failed to update test run {slug} status to 'failed'")
+            # Every test was marked running up front, the ones the suite never got to would stay running
+            for test in message['tests']:
+                if test['testRunSlug'] not in reported_slugs:
+                    report_test_run_error(test['testRunSlug'], e)
             raise e
+        save_suite_report(message.get('suiteRunSlug') or generate_random_string(16), suite_report)
+        print(f"Suite complete: {len(suite_report['tests'])} tests, {suite_report['failed_tests']} failed, "
+              f"{suite_report['wall_clock_seconds']:.1f}s wall-clock ({suite_report['sum_test_seconds']:.1f}s of test time)")
+
+def get_artifacts_prefix(message):
+    type = message.get('taskType')
+    if type == "website-analysis":
+        return f"analyses/{message['analysisSlug']}"
+    if type == "suite-run" and message.get('suiteRunSlug'):
+        return f"suite-runs/{message['suiteRunSlug']}"
+    if type == "test-run":
+        return f"test-runs/{message['testRunSlug']}"
+    return f"workers/{os.getpid()}"
+
+def process_tracked_message(body):
+    """Process a message with memory accounting around it, when MEMORY_MONITOR is enabled"""
+    with memory_monitor.track(get_artifacts_prefix(json.loads(body))):
+        process_message(body)
 
 def testAnalyzer(): 
     message = { "organizationDomain": "target.com", "modelSlug": "gpt-5-mini", "modelProvider": "openai" } 
@@ -275,34 +465,51 @@ def testAnalyzer():
     analysis_url = save_analysis("booking", result)
     create_new_analysis(3, analysis_url)
 
-def worker():
-    response = sqs.receive_message(
-        QueueUrl=QUEUE_URL,
-        MaxNumberOfMessages=1
-    )
+def worker(on_job_finished=None):
+    """
+    Process messages until WORKER_MAX_JOBS are done, the queues are empty or the worker is draining.
+    Messages held back by organization caps are not an empty queue, the worker waits and polls again.
 
-    messages = response.get('Messages', [])
-    if not messages:
-        print("No messages found. Waiting...")
+    Args:
+        on_job_finished (Callable): Called with the duration and success of each message, e.g. by the supervisor
 
-    for message in messages:
-        # attempts = 0
-        receipt_handle = message['ReceiptHandle']
-        body = message['Body']
+    Returns:
+        int: Number of messages processed
+    """
+    mark_startup("imports")
+    # Chromium launches while the scheduler polls for the first message
+    prewarm_worker()
+    # Picks fairly across organizations and task types instead of taking the oldest message
+    scheduler = Scheduler(sqs, SCHEDULER_QUEUES)
 
+    def process(body):
+        start_time = time.time()
+        succeeded = False
         try:
-            print("Received message, marking as 'In Progress'")
-            process_message(body)
+            process_tracked_message(body)
+            succeeded = True
+        finally:
+            if on_job_finished:
+                on_job_finished(time.time() - start_time, succeeded)
 
-            # Delete only after successful processing
-            sqs.delete_message(
-                QueueUrl=QUEUE_URL,
-                ReceiptHandle=receipt_handle
-            )
-            print("Message deleted from queue (marked as Done).")
-
-        except Exception as e:
-            print(f"Error processing message: {e}")
+    processed = 0
+    while processed < WORKER_MAX_JOBS:
+        if draining.is_set():
+            print("Draining, not taking more messages.")
+            break
+        outcome = scheduler.run_once(process)
+        if outcome == EMPTY:
+            print("No messages found. Waiting...")
+            break
+        if outcome == CAPPED:
+            # Exiting would look idle, and the instance could shut down with the capped messages still queued
+            draining.wait(WORKER_CAPPED_BACKOFF_SECONDS)
+            continue
+        processed += 1
+        if memory_monitor.recycle:
+            print("Memory kept growing across jobs, exiting so the worker is recycled.")
+            break
+    return processed
 
 if __name__ == "__main__":
     worker()
@@ -1,6 +1,7 @@
 import os
 import psycopg2
 from psycopg2 import sql
+from psycopg2.extras import execute_values
 from urllib.parse import urlparse
 import logging
 
@@ -84,6 +85,45 @@ class AnalysisDB:
                 self.connection.rollback()
             return False
     
+    def update_analysis_failure_reason(self, analysis_slug, failure_reason):
+        """
+        Record why an analysis failed when it did not simply fail its task, e.g. a budget was exceeded
+        
+        Args:
+            analysis_slug (str): The slug identifier of the analysis
+            failure_reason (str): The failure reason, e.g. 'budget_exceeded:max_seconds'
+        
+        Returns:
+            bool: True if update was successful, False otherwise
+        """
+        if not self.connection:
+            if not self.connect():
+                return False
+        
+        try:
+            with self.connection.cursor() as cursor:
+                update_query = sql.SQL("""
+                    UPDATE organizations_analyses 
+                    SET failure_reason = %s, updated_at = CURRENT_TIMESTAMP 
+                    WHERE slug = %s AND deleted_at IS NULL
+                """)
+                
+                cursor.execute(update_query, (failure_reason, analysis_slug))
+                
+                if cursor.rowcount == 0:
+                    logger.warning(f"No analysis found with slug: {analysis_slug}")
+                    return False
+                
+                self.connection.commit()
+                logger.info(f"Recorded failure reason '{failure_reason}' for analysis {analysis_slug}")
+                return True
+                
+        except Exception as e:
+            logger.error(f"Error updating analysis failure reason: {e}")
+            if self.connection:
+                self.connection.rollback()
+            return False
+    
     def get_analysis_status(self, analysis_slug):
         """
         Get the current status of an analysis by its slug
@@ -192,6 +232,45 @@ class TestRunDB:
                 self.connection.rollback()
             return False
     
+    def update_test_run_failure_reason(self, test_run_slug, failure_reason):
+        """
+        Record why a test run failed when it did not simply fail its test, e.g. a budget was exceeded
+        
+        Args:
+            test_run_slug (str): The slug identifier of the test run
+            failure_reason (str): The failure reason, e.g. 'budget_exceeded:max_steps'
+        
+        Returns:
+            bool: True if update was successful, False otherwise
+        """
+        if not self.connection:
+            if not self.connect():
+                return False
+        
+        try:
+            with self.connection.cursor() as cursor:
+                update_query = sql.SQL("""
+                    UPDATE tests_runs 
+                    SET failure_reason = %s, updated_at = CURRENT_TIMESTAMP 
+                    WHERE slug = %s AND deleted_at IS NULL
+                """)
+                
+                cursor.execute(update_query, (failure_reason, test_run_slug))
+                
+                if cursor.rowcount == 0:
+                    logger.warning(f"No test run found with slug: {test_run_slug}")
+                    return False
+                
+                self.connection.commit()
+                logger.info(f"Recorded failure reason '{failure_reason}' for test run {test_run_slug}")
+                return True
+                
+        except Exception as e:
+            logger.error(f"Error updating test run failure reason: {e}")
+            if self.connection:
+                self.connection.rollback()
+            return False
+    
     def get_test_run_status(self, test_run_slug):
         """
         Get the current status of a test run by its slug
@@ -226,6 +305,384 @@ class TestRunDB:
             logger.error(f"Error getting test run status: {e}")
             return None
 
+    def insert_test_run_steps(self, test_run_slug, steps):
+        """
+        Insert a batch of step progress records for a test run in a single statement
+        
+        Args:
+            test_run_slug (str): The slug identifier of the test run
+            steps (list): Dicts with step_number, action_name, url, duration_seconds and screenshot_key
+        
+        Returns:
+            bool: True if the insert was successful, False otherwise
+        """
+        if not steps:
+            return True
+        
+        if not self.connection:
+            if not self.connect():
+                return False
+        
+        try:
+            with self.connection.cursor() as cursor:
+                # Redelivered runs rewrite their steps, so conflicting rows are updated in place
+                insert_query = """
+                    INSERT INTO tests_runs_steps 
+                        (run_id, step_number, action_name, url, duration_seconds, screenshot_key, created_at)
+                    SELECT tr.id, v.step_number, v.action_name, v.url, v.duration_seconds, v.screenshot_key, CURRENT_TIMESTAMP
+                    FROM (VALUES %s) AS v (run_slug, step_number, action_name, url, duration_seconds, screenshot_key)
+                    JOIN tests_runs tr ON tr.slug = v.run_slug AND tr.deleted_at IS NULL
+                    ON CONFLICT (run_id, step_number) DO UPDATE SET 
+                        action_name = EXCLUDED.action_name,
+                        url = EXCLUDED.url,
+                        duration_seconds = EXCLUDED.duration_seconds,
+                        screenshot_key = EXCLUDED.screenshot_key
+                """
+                
+                values = [
+                    (test_run_slug, step['step_number'], step['action_name'], step['url'], step['duration_seconds'], step['screenshot_key'])
+                    for step in steps
+                ]
+                execute_values(
+                    cursor,
+                    insert_query,
+                    values,
+                    template="(%s, %s::integer, %s, %s, %s::double precision, %s)",
+                    page_size=len(values)
+                )
+                
+                self.connection.commit()
+                logger.info(f"Inserted {len(steps)} progress steps for test run {test_run_slug}")
+                return True
+                
+        except Exception as e:
+            logger.error(f"Error inserting test run steps: {e}")
+            if self.connection:
+                self.connection.rollback()
+            return False
+    
+    def get_test_run_steps_after(self, test_run_slug, after_step=0):
+        """
+        Get the step progress records of a test run after a given step number
+        
+        Args:
+            test_run_slug (str): The slug identifier of the test run
+            after_step (int): Only steps with a greater step number are returned
+        
+        Returns:
+            list or None: Step records ordered by step number, None on error
+        """
+        if not self.connection:
+            if not self.connect():
+                return None
+        
+        try:
+            with self.connection.cursor() as cursor:
+                select_query = sql.SQL("""
+                    SELECT s.step_number, s.action_name, s.url, s.duration_seconds, s.screenshot_key, s.created_at
+                    FROM tests_runs_steps s
+                    JOIN tests_runs tr ON s.run_id = tr.id
+                    WHERE tr.slug = %s AND s.step_number > %s AND tr.deleted_at IS NULL
+                    ORDER BY s.step_number
+                """)
+                
+                cursor.execute(select_query, (test_run_slug, after_step))
+                return [
+                    {
+                        'step_number': row[0],
+                        'action_name': row[1],
+                        'url': row[2],
+                        'duration_seconds': row[3],
+                        'screenshot_key': row[4],
+                        'created_at': row[5]
+                    }
+                    for row in cursor.fetchall()
+                ]
+                    
+        except Exception as e:
+            logger.error(f"Error getting test run steps: {e}")
+            return None
+
+class RateLimitDB:
+    def __init__(self):
+        self.connection = None
+        self.db_url = DB_URL
+        
+        if not self.db_url:
+            raise ValueError("DB_URL environment variable is required")
+            
+    def connect(self):
+        """Establish database connection"""
+        try:
+            # Parse the database URL
+            parsed_url = urlparse(self.db_url)
+            
+            self.connection = psycopg2.connect(
+                host=parsed_url.hostname,
+                port=parsed_url.port,
+                database=parsed_url.path[1:],  # Remove leading slash
+                user=parsed_url.username,
+                password=parsed_url.password
+            )
+            logger.info("Successfully connected to PostgreSQL database")
+            return True
+        except Exception as e:
+            logger.error(f"Error connecting to database: {e}")
+            return False
+    
+    def disconnect(self):
+        """Close database connection"""
+        if self.connection:
+            self.connection.close()
+            logger.info("Database connection closed")
+    
+    def reserve_capacity(self, bucket_key, capacity, refill_per_second, amount):
+        """
+        Take capacity from a token bucket shared by every worker, refilling it for the time
+        since its last use. The level may go negative, which reserves capacity ahead.
+        
+        Args:
+            bucket_key (str): The bucket, e.g. 'openai/gpt-4.1:tpm'
+            capacity (float): The most the bucket holds
+            refill_per_second (float): How fast the bucket refills
+            amount (float): The capacity to take, negative to give back
+        
+        Returns:
+            float or None: The bucket level after the reservation, None on error
+        """
+        if not self.connection:
+            if not self.connect():
+                return None
+        
+        try:
+            with self.connection.cursor() as cursor:
+                # The upsert locks the bucket row, so concurrent reservations are applied one after another
+                cursor.execute("""
+                    INSERT INTO llm_rate_limit_buckets (bucket_key, level, updated_at)
+                    VALUES (%s, %s - %s, clock_timestamp())
+                    ON CONFLICT (bucket_key) DO UPDATE SET
+                        level = LEAST(
+                            %s,
+                            llm_rate_limit_buckets.level
+                                + EXTRACT(EPOCH FROM clock_timestamp() - llm_rate_limit_buckets.updated_at) * %s
+                        ) - %s,
+                        updated_at = clock_timestamp()
+                    RETURNING level
+                """, (bucket_key, capacity, amount, capacity, refill_per_second, amount))
+                level = cursor.fetchone()[0]
+                self.connection.commit()
+                return level
+                
+        except Exception as e:
+            logger.error(f"Error reserving rate limit capacity: {e}")
+            if self.connection:
+                self.connection.rollback()
+            return None
+
+class SchedulerDB:
+    def __init__(self):
+        self.connection = None
+        self.db_url = DB_URL
+        
+        if not self.db_url:
+            raise ValueError("DB_URL environment variable is required")
+            
+    def connect(self):
+        """Establish database connection"""
+        try:
+            # Parse the database URL
+            parsed_url = urlparse(self.db_url)
+            
+            self.connection = psycopg2.connect(
+                host=parsed_url.hostname,
+                port=parsed_url.port,
+                database=parsed_url.path[1:],  # Remove leading slash
+                user=parsed_url.username,
+                password=parsed_url.password
+            )
+            logger.info("Successfully connected to PostgreSQL database")
+            return True
+        except Exception as e:
+            logger.error(f"Error connecting to database: {e}")
+            return False
+    
+    def disconnect(self):
+        """Close database connection"""
+        if self.connection:
+            self.connection.close()
+            logger.info("Database connection closed")
+    
+    def get_flows(self, flow_keys):
+        """
+        Get the virtual time of scheduling flows (organization and task type pairs)
+        
+        Args:
+            flow_keys (list): The flow keys, e.g. 'acme:test-run'
+        
+        Returns:
+            tuple or None: (virtual time by flow key, the virtual time new and idle flows
+                start from), None on error
+        """
+        if not self.connection:
+            if not self.connect():
+                return None
+        
+        try:
+            with self.connection.cursor() as cursor:
+                cursor.execute("""
+                    SELECT flow_key, virtual_time FROM scheduler_flows WHERE flow_key = ANY(%s)
+                """, (list(flow_keys),))
+                virtual_times = dict(cursor.fetchall())
+                
+                # Flows active in the last hour set the floor, so idle flows cannot bank credit
+                cursor.execute("""
+                    SELECT COALESCE(MIN(virtual_time), 0) FROM scheduler_flows
+                    WHERE updated_at > CURRENT_TIMESTAMP - INTERVAL '1 hour'
+                """)
+                floor = cursor.fetchone()[0]
+                return virtual_times, floor
+                
+        except Exception as e:
+            logger.error(f"Error getting scheduler flows: {e}")
+            if self.connection:
+                self.connection.rollback()
+            return None
+    
+    def get_running_counts(self, organizations, running_ttl_seconds):
+        """
+        Count the messages each organization has in progress on any worker
+        
+        Args:
+            organizations (list): The organization keys
+            running_ttl_seconds (int): Ignore messages started longer ago, their worker is presumed dead
+        
+        Returns:
+            dict or None: Running message counts by organization, None on error
+        """
+        if not self.connection:
+            if not self.connect():
+                return None
+        
+        try:
+            with self.connection.cursor() as cursor:
+                cursor.execute("""
+                    SELECT organization, COUNT(*) FROM scheduler_running
+                    WHERE organization = ANY(%s)
+                        AND started_at > CURRENT_TIMESTAMP - %s * INTERVAL '1 second'
+                    GROUP BY organization
+                """, (list(organizations), running_ttl_seconds))
+                return dict(cursor.fetchall())
+                
+        except Exception as e:
+            logger.error(f"Error getting scheduler running counts: {e}")
+            if self.connection:
+                self.connection.rollback()
+            return None
+
+    def get_running_messages(self, running_ttl_seconds):
+        """
+        Get the messages in progress on any worker
+
+        Args:
+            running_ttl_seconds (int): Ignore messages started longer ago, their worker is presumed dead
+
+        Returns:
+            dict or None: Start times by SQS message id, None on error
+        """
+        if not self.connection:
+            if not self.connect():
+                return None
+
+        try:
+            with self.connection.cursor() as cursor:
+                cursor.execute("""
+                    SELECT message_id, started_at FROM scheduler_running
+                    WHERE started_at > CURRENT_TIMESTAMP - %s * INTERVAL '1 second'
+                """, (running_ttl_seconds,))
+                return dict(cursor.fetchall())
+
+        except Exception as e:
+            logger.error(f"Error getting scheduler running messages: {e}")
+            if self.connection:
+                self.connection.rollback()
+            return None
+
+    def start_message(self, message_id, organization, flow_key, wait_seconds):
+        """
+        Record a message as running and add its queue wait to its flow
+        
+        Args:
+            message_id (str): The SQS message id
+            organization (str): The organization key
+            flow_key (str): The flow key
+            wait_seconds (float): How long the message waited in the queue
+        
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        if not self.connection:
+            if not self.connect():
+                return False
+        
+        try:
+            with self.connection.cursor() as cursor:
+                cursor.execute("""
+                    INSERT INTO scheduler_running (message_id, organization, flow_key, started_at)
+                    VALUES (%s, %s, %s, CURRENT_TIMESTAMP)
+                    ON CONFLICT (message_id) DO UPDATE SET started_at = CURRENT_TIMESTAMP
+                """, (message_id, organization, flow_key))
+                cursor.execute("""
+                    INSERT INTO scheduler_flows (flow_key, virtual_time, started_count, total_wait_seconds, max_wait_seconds, updated_at)
+                    VALUES (%s, 0, 1, %s, %s, CURRENT_TIMESTAMP)
+                    ON CONFLICT (flow_key) DO UPDATE SET
+                        started_count = scheduler_flows.started_count + 1,
+                        total_wait_seconds = scheduler_flows.total_wait_seconds + EXCLUDED.total_wait_seconds,
+                        max_wait_seconds = GREATEST(scheduler_flows.max_wait_seconds, EXCLUDED.max_wait_seconds),
+                        updated_at = CURRENT_TIMESTAMP
+                """, (flow_key, wait_seconds, wait_seconds))
+                self.connection.commit()
+                return True
+                
+        except Exception as e:
+            logger.error(f"Error starting scheduler message: {e}")
+            if self.connection:
+                self.connection.rollback()
+            return False
+    
+    def finish_message(self, message_id, flow_key, virtual_cost, floor):
+        """
+        Remove a message from the running set and charge its flow for the work done
+        
+        Args:
+            message_id (str): The SQS message id
+            flow_key (str): The flow key
+            virtual_cost (float): The processing time divided by the flow's weight
+            floor (float): The virtual time idle flows catch up to
+        
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        if not self.connection:
+            if not self.connect():
+                return False
+        
+        try:
+            with self.connection.cursor() as cursor:
+                cursor.execute("DELETE FROM scheduler_running WHERE message_id = %s", (message_id,))
+                cursor.execute("""
+                    UPDATE scheduler_flows
+                    SET virtual_time = GREATEST(virtual_time, %s) + %s, updated_at = CURRENT_TIMESTAMP
+                    WHERE flow_key = %s
+                """, (floor, virtual_cost, flow_key))
+                self.connection.commit()
+                return True
+                
+        except Exception as e:
+            logger.error(f"Error finishing scheduler message: {e}")
+            if self.connection:
+                self.connection.rollback()
+            return False
+
 def update_test_run_to_running(test_run_slug):
     """
     Convenience function to update a test run status to 'running'
@@ -274,6 +731,40 @@ def update_test_run_to_succeeded(test_run_slug):
     finally:
         db.disconnect()
 
+def update_test_run_failure_reason(test_run_slug, failure_reason):
+    """
+    Convenience function to record the failure reason of a test run
+    
+    Args:
+        test_run_slug (str): The slug identifier of the test run
+        failure_reason (str): The failure reason
+    
+    Returns:
+        bool: True if update was successful, False otherwise
+    """
+    db = TestRunDB()
+    try:
+        return db.update_test_run_failure_reason(test_run_slug, failure_reason)
+    finally:
+        db.disconnect()
+
+def get_test_run_steps_after(test_run_slug, after_step=0):
+    """
+    Convenience function to get the step progress records of a test run after a given step number
+    
+    Args:
+        test_run_slug (str): The slug identifier of the test run
+        after_step (int): Only steps with a greater step number are returned
+    
+    Returns:
+        list or None: Step records ordered by step number, None on error
+    """
+    db = TestRunDB()
+    try:
+        return db.get_test_run_steps_after(test_run_slug, after_step)
+    finally:
+        db.disconnect()
+
 def create_new_analysis(organization_id, analysis_url):
     db = TestRunDB()
     try:
@@ -353,6 +844,23 @@ def update_analysis_to_succeeded(analysis_slug):
     finally:
         db.disconnect()
 
+def update_analysis_failure_reason(analysis_slug, failure_reason):
+    """
+    Convenience function to record the failure reason of an analysis
+    
+    Args:
+        analysis_slug (str): The slug identifier of the analysis
+        failure_reason (str): The failure reason
+    
+    Returns:
+        bool: True if update was successful, False otherwise
+    """
+    db = AnalysisDB()
+    try:
+        return db.update_analysis_failure_reason(analysis_slug, failure_reason)
+    finally:
+        db.disconnect()
+
 def update_analysis_to_pending(analysis_slug):
     """
     Convenience function to update an analysis status to 'pending'
@@ -441,4 +949,369 @@ def get_latest_successful_run_by_version(test_version_slug):
         logger.error(f"Error getting latest successful run: {e}")
         return None
     finally:
-        db.disconnect()
\ No newline at end of file
+        db.disconnect()
+
+def get_latest_successful_runs_by_versions(test_version_slugs, connection=None):
+    """
+    Get the latest successful test run for many test version slugs in a single query
+    
+    Args:
+        test_version_slugs (list): The slug identifiers of the test versions
+        connection: An open database connection to reuse, a new one is opened if not given
+    
+    Returns:
+        dict or None: Test run details keyed by test version slug (versions without a
+            successful run are left out), None on error
+    """
+    if not test_version_slugs:
+        return {}
+    
+    db = None
+    if connection is None:
+        db = TestRunDB()
+        if not db.connect():
+            return None
+        connection = db.connection
+    
+    try:
+        with connection.cursor() as cursor:
+            # DISTINCT ON keeps the first row per version in ORDER BY order, which the
+            # (version_id, status, updated_at DESC) index returns without sorting
+            select_query = sql.SQL("""
+                SELECT DISTINCT ON (tr.version_id)
+                    tv.slug,
+                    tr.slug, 
+                    tr.results_url,
+                    tr.model_slug,
+                    tr.model_provider,
+                    tr.created_at,
+                    tr.updated_at
+                FROM tests_runs tr
+                JOIN tests_versions tv ON tr.version_id = tv.id
+                WHERE tv.slug = ANY(%s)
+                    AND tr.status = 'succeeded' 
+                    AND tr.deleted_at IS NULL 
+                    AND tv.deleted_at IS NULL
+                ORDER BY tr.version_id, tr.updated_at DESC
+            """)
+            
+            cursor.execute(select_query, (list(test_version_slugs),))
+            
+            return {
+                row[0]: {
+                    'slug': row[1],
+                    'results_url': row[2],
+                    'model_slug': row[3],
+                    'model_provider': row[4],
+                    'created_at': row[5],
+                    'updated_at': row[6]
+                }
+                for row in cursor.fetchall()
+            }
+                
+    except Exception as e:
+        logger.error(f"Error getting latest successful runs: {e}")
+        return None
+    finally:
+        if db:
+            db.disconnect()
+
+def get_finished_test_runs(updated_after=None):
+    """
+    Get the succeeded and failed test runs with their test and version, for run history analytics
+
+    Args:
+        updated_after (datetime): Only return runs finished after this time, all runs if not given
+
+    Returns:
+        list or None: Test run details ordered by id, None on error
+    """
+    db = TestRunDB()
+    try:
+        if not db.connect():
+            return None
+
+        with db.connection.cursor() as cursor:
+            select_query = sql.SQL("""
+                SELECT
+                    tr.id,
+                    tr.slug,
+                    tr.status,
+                    tr.failure_reason,
+                    tr.model_slug,
+                    tr.created_at,
+                    tr.updated_at,
+                    tv.slug,
+                    t.slug
+                FROM tests_runs tr
+                JOIN tests_versions tv ON tr.version_id = tv.id
+                JOIN tests t ON tv.test_id = t.id
+                WHERE tr.status IN ('succeeded', 'failed')
+                    AND tr.deleted_at IS NULL
+                    AND (%s IS NULL OR tr.updated_at > %s)
+                ORDER BY tr.id
+            """)
+
+            cursor.execute(select_query, (updated_after, updated_after))
+
+            return [
+                {
+                    'id': row[0],
+                    'slug': row[1],
+                    'status': row[2],
+                    'failure_reason': row[3],
+                    'model_slug': row[4],
+                    'created_at': row[5],
+                    'updated_at': row[6],
+                    'version_slug': row[7],
+                    'test_slug': row[8]
+                }
+                for row in cursor.fetchall()
+            ]
+
+    except Exception as e:
+        logger.error(f"Error getting finished test runs: {e}")
+        return None
+    finally:
+        db.disconnect()
+
+def reap_stale_test_runs(running_timeout_seconds, pending_timeout_seconds, max_requeues, limit):
+    """
+    Take back test runs whose worker stopped updating them, in one statement: runs reaped
+    fewer than `max_requeues` times go back to pending to be requeued, the rest are failed
+
+    Args:
+        running_timeout_seconds (int): Runs running without an update for longer are stale
+        pending_timeout_seconds (int): Runs pending without an update for longer are stale
+        max_requeues (int): Times a run is requeued before it is failed
+        limit (int): Most runs reaped at once, the oldest first
+
+    Returns:
+        list or None: Reaped runs with the fields of their queue message, None on error
+    """
+    db = TestRunDB()
+    try:
+        if not db.connect():
+            return None
+
+        with db.connection.cursor() as cursor:
+            # SKIP LOCKED lets several reapers run without taking the same runs
+            reap_query = sql.SQL("""
+                WITH stale AS (
+                    SELECT
+                        tr.id,
+                        tr.status AS previous_status,
+                        tr.created_at,
+                        tr.model_slug,
+                        tr.model_provider,
+                        tv.slug AS version_slug,
+                        tv.description,
+                        tv.storage_state_mode,
+                        tv.performance_budget,
+                        t.slug AS test_slug,
+                        p.slug AS project_slug,
+                        o.slug AS organization_slug,
+                        u.email
+                    FROM tests_runs tr
+                    JOIN tests_versions tv ON tr.version_id = tv.id
+                    JOIN tests t ON tv.test_id = t.id
+                    JOIN projects p ON t.project_id = p.id
+                    JOIN organizations o ON p.organization_id = o.id
+                    LEFT JOIN users u ON tr.created_by_user_id = u.id
+                    WHERE tr.deleted_at IS NULL
+                        AND (
+                            (tr.status = 'running' AND tr.updated_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 second')
+                            OR (tr.status = 'pending' AND tr.updated_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 second')
+                        )
+                    ORDER BY tr.updated_at
+                    LIMIT %s
+                    FOR UPDATE OF tr SKIP LOCKED
+                )
+                UPDATE tests_runs tr
+                SET
+                    status = CASE WHEN tr.reap_count < %s THEN 'pending' ELSE 'failed' END,
+                    failure_reason = CASE WHEN tr.reap_count < %s THEN tr.failure_reason ELSE 'stale:' || tr.status END,
+                    reap_count = tr.reap_count + 1,
+                    updated_at = CURRENT_TIMESTAMP
+                FROM stale
+                WHERE tr.id = stale.id
+                RETURNING
+                    tr.slug,
+                    tr.status,
+                    tr.reap_count,
+                    stale.previous_status,
+                    stale.created_at,
+                    stale.model_slug,
+                    stale.model_provider,
+                    stale.version_slug,
+                    stale.description,
+                    stale.test_slug,
+                    stale.project_slug,
+                    stale.organization_slug,
+                    stale.email,
+                    stale.storage_state_mode,
+                    stale.performance_budget
+            """)
+
+            cursor.execute(reap_query, (running_timeout_seconds, pending_timeout_seconds, limit, max_requeues, max_requeues))
+            reaped = [
+                {
+                    'slug': row[0],
+                    'status': row[1],
+                    'reap_count': row[2],
+                    'previous_status': row[3],
+                    'created_at': row[4],
+                    'model_slug': row[5],
+                    'model_provider': row[6],
+                    'version_slug': row[7],
+                    'description': row[8],
+                    'test_slug': row[9],
+                    'project_slug': row[10],
+                    'organization_slug': row[11],
+                    'user_email': row[12],
+                    'storage_state_mode': row[13],
+                    'performance_budget': row[14]
+                }
+                for row in cursor.fetchall()
+            ]
+            db.connection.commit()
+            return reaped
+
+    except Exception as e:
+        logger.error(f"Error reaping stale test runs: {e}")
+        if db.connection:
+            db.connection.rollback()
+        return None
+    finally:
+        db.disconnect()
+
+def fail_test_runs(test_run_slugs, failure_reason):
+    """
+    Mark several test runs failed with a reason, in one statement
+
+    Args:
+        test_run_slugs (list): The slug identifiers of the test runs
+        failure_reason (str): The failure reason, e.g. 'stale:requeue_failed'
+
+    Returns:
+        int or None: Number of test runs updated, None on error
+    """
+    db = TestRunDB()
+    try:
+        if not db.connect():
+            return None
+
+        with db.connection.cursor() as cursor:
+            update_query = sql.SQL("""
+                UPDATE tests_runs
+                SET status = 'failed', failure_reason = %s, updated_at = CURRENT_TIMESTAMP
+                WHERE slug = ANY(%s) AND deleted_at IS NULL
+            """)
+
+            cursor.execute(update_query, (failure_reason, list(test_run_slugs)))
+            db.connection.commit()
+            return cursor.rowcount
+
+    except Exception as e:
+        logger.error(f"Error failing test runs: {e}")
+        if db.connection:
+            db.connection.rollback()
+        return None
+    finally:
+        db.disconnect()
+
+def create_pending_test_runs(test_runs):
+    """
+    Insert pending test runs in one statement, each on the version of its message or else of the
+    run it was copied from, e.g. for replayed load test messages that need a run to claim
+
+    Args:
+        test_runs (list): Dicts with the new `slug`, the `source_slug` it was copied from and the
+            `version_slug`, `model_slug` and `model_provider` of its message, each may be None
+
+    Returns:
+        list or None: Slugs of the inserted test runs, without those whose version was not found, None on error
+    """
+    if not test_runs:
+        return []
+
+    db = TestRunDB()
+    try:
+        if not db.connect():
+            return None
+
+        with db.connection.cursor() as cursor:
+            insert_query = """
+                INSERT INTO tests_runs
+                    (slug, status, model_slug, model_provider, version_id, created_by_user_id, created_at, updated_at)
+                SELECT
+                    v.slug,
+                    'pending',
+                    COALESCE(v.model_slug, source.model_slug),
+                    COALESCE(v.model_provider, source.model_provider),
+                    tv.id,
+                    COALESCE(source.created_by_user_id, tv.created_by_user_id),
+                    CURRENT_TIMESTAMP,
+                    CURRENT_TIMESTAMP
+                FROM (VALUES %s) AS v (slug, source_slug, version_slug, model_slug, model_provider)
+                LEFT JOIN tests_runs source ON source.slug = v.source_slug AND source.deleted_at IS NULL
+                JOIN tests_versions tv ON tv.deleted_at IS NULL
+                    AND tv.id = COALESCE((SELECT id FROM tests_versions WHERE slug = v.version_slug AND deleted_at IS NULL), source.version_id)
+                RETURNING slug
+            """
+
+            values = [
+                (test_run['slug'], test_run.get('source_slug'), test_run.get('version_slug'), test_run.get('model_slug'), test_run.get('model_provider'))
+                for test_run in test_runs
+            ]
+            rows = execute_values(cursor, insert_query, values, page_size=len(values), fetch=True)
+            db.connection.commit()
+            return [row[0] for row in rows]
+
+    except Exception as e:
+        logger.error(f"Error creating pending test runs: {e}")
+        if db.connection:
+            db.connection.rollback()
+        return None
+    finally:
+        db.disconnect()
+
+def claim_test_run(test_run_slug, reap_count=0):
+    """
+    Mark a test run running when its message is the one that should run it: the run is not
+    finished yet and was not requeued by the reaper after this message was sent
+
+    Args:
+        test_run_slug (str): The slug identifier of the test run
+        reap_count (int): The `reapCount` of the message, 0 for messages the reaper did not send
+
+    Returns:
+        bool or None: True if the run was claimed, False if it must be skipped, None on error
+    """
+    db = TestRunDB()
+    try:
+        if not db.connect():
+            return None
+
+        with db.connection.cursor() as cursor:
+            # Also refreshes updated_at, so the reaper does not take a run that just started
+            claim_query = sql.SQL("""
+                UPDATE tests_runs
+                SET status = 'running', updated_at = CURRENT_TIMESTAMP
+                WHERE slug = %s
+                    AND deleted_at IS NULL
+                    AND status IN ('pending', 'running')
+                    AND reap_count <= %s
+            """)
+
+            cursor.execute(claim_query, (test_run_slug, reap_count))
+            db.connection.commit()
+            return cursor.rowcount > 0
+
+    except Exception as e:
+        logger.error(f"Error claiming test run {test_run_slug}: {e}")
+        if db.connection:
+            db.connection.rollback()
+        return None
+    finally:
+        db.disconnect()
@@ -0,0 +1,91 @@
+from browser_use.llm.views import ChatInvokeCompletion, ChatInvokeUsage
+from dotenv import load_dotenv
+import os
+import math
+import random
+import asyncio
+import logging
+
+load_dotenv()
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Config
+# Runs whose message names the `fake` model provider are refused unless this is set, e.g. on load test fleets
+ALLOW_FAKE_LLM = os.getenv('ALLOW_FAKE_LLM', 'false').lower() == 'true'
+# Steps before the fake model reports the run done, every earlier step scrolls the page
+FAKE_LLM_STEPS = int(os.getenv('FAKE_LLM_STEPS', '5'))
+# Response latency is log-normal with this median and 95th percentile
+FAKE_LLM_LATENCY_SECONDS = float(os.getenv('FAKE_LLM_LATENCY_SECONDS', '2'))
+FAKE_LLM_LATENCY_P95_SECONDS = float(os.getenv('FAKE_LLM_LATENCY_P95_SECONDS', '6'))
+FAKE_LLM_PROMPT_TOKENS = 4000
+FAKE_LLM_COMPLETION_TOKENS = 150
+
+
+def sample_latency(median, p95):
+    """Log-normal sample with the given median and 95th percentile"""
+    sigma = math.log(p95 / median) / 1.645 if p95 > median else 0
+    return random.lognormvariate(math.log(median), sigma)
+
+
+class FakeChatModel:
+    """
+    Chat model that answers without calling a provider: it waits a realistic latency, scrolls
+    for FAKE_LLM_STEPS - 1 steps and then reports the run done. Load tests use it to put real
+    browsers and workers under load without paying for, or being rate limited by, the LLM.
+    """
+
+    _verified_api_keys = True
+
+    def __init__(self, model):
+        self.model = model
+        self.steps = 0
+
+    @property
+    def provider(self):
+        return 'fake'
+
+    @property
+    def name(self):
+        return self.model
+
+    @property
+    def model_name(self):
+        return self.model
+
+    async def ainvoke(self, messages, output_format=None):
+        await asyncio.sleep(sample_latency(FAKE_LLM_LATENCY_SECONDS, FAKE_LLM_LATENCY_P95_SECONDS))
+        usage = ChatInvokeUsage(
+            prompt_tokens=FAKE_LLM_PROMPT_TOKENS,
+            prompt_cached_tokens=None,
+            prompt_cache_creation_tokens=None,
+            prompt_image_tokens=None,
+            completion_tokens=FAKE_LLM_COMPLETION_TOKENS,
+            total_tokens=FAKE_LLM_PROMPT_TOKENS + FAKE_LLM_COMPLETION_TOKENS,
+        )
+        if output_format is None:
+            # Page extraction and other free-text calls
+            return ChatInvokeCompletion(completion="No content extracted by the fake model.", usage=usage)
+
+        self.steps += 1
+        if self.steps < FAKE_LLM_STEPS:
+            action = {"scroll": {"down": True, "num_pages": 1}}
+            next_goal = "Scroll down the page"
+        else:
+            action = {"done": {"text": f"Fake model finished after {self.steps} steps", "success": True}}
+            next_goal = "Report the run done"
+        completion = output_format.model_validate({
+            "evaluation_previous_goal": "Success",
+            "memory": f"Step {self.steps} of {FAKE_LLM_STEPS}",
+            "next_goal": next_goal,
+            "action": [action],
+        })
+        return ChatInvokeCompletion(completion=completion, usage=usage)
+
+
+def getFakeChatModel(modelSlug):
+    if not ALLOW_FAKE_LLM:
+        raise ValueError("The fake model provider is only available on workers with ALLOW_FAKE_LLM=true")
+    return FakeChatModel(modelSlug)
@@ -0,0 +1,221 @@
+from browser_use.llm.exceptions import ModelProviderError
+from boto3 import client
+from dotenv import load_dotenv
+import os
+import json
+import time
+import asyncio
+import logging
+
+load_dotenv()
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Config
+S3_BUCKET_NAME = os.getenv('S3_BUCKET_NAME', 'flow-tester')
+# Backups for runs whose message has no `backupModels`, e.g. '[{"modelProvider": "google", "modelSlug": "gemini-2.5-flash"}]'
+LLM_BACKUP_MODELS = json.loads(os.getenv('LLM_BACKUP_MODELS', '[]'))
+# Start the next model when a request is still running after this long, 0 only falls back on errors
+LLM_HEDGE_AFTER_SECONDS = float(os.getenv('LLM_HEDGE_AFTER_SECONDS', '0'))
+CIRCUIT_BREAKER_FAILURES = int(os.getenv('CIRCUIT_BREAKER_FAILURES', '3'))
+CIRCUIT_BREAKER_COOLDOWN_SECONDS = float(os.getenv('CIRCUIT_BREAKER_COOLDOWN_SECONDS', '60'))
+
+# Initialize S3 client
+s3_client = client(
+    's3',
+    aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+    aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+    region_name=os.getenv('AWS_REGION', 'us-east-1')
+)
+
+
+def is_retryable_error(error):
+    """Rate limits and server errors are worth another provider, bad requests are not"""
+    return isinstance(error, ModelProviderError) and (error.status_code == 429 or error.status_code >= 500)
+
+
+class CircuitBreaker:
+    """
+    Skips a provider for a cooldown after consecutive retryable failures, then lets one
+    request through to probe whether it has recovered
+    """
+
+    def __init__(self, failure_threshold=CIRCUIT_BREAKER_FAILURES, cooldown_seconds=CIRCUIT_BREAKER_COOLDOWN_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.consecutive_failures = 0
+        self.opened_at = None
+
+    def is_open(self):
+        if self.opened_at is None:
+            return False
+        if time.time() - self.opened_at >= self.cooldown_seconds:
+            # Half-open: the next request decides whether the breaker closes or opens again
+            self.opened_at = None
+            self.consecutive_failures = self.failure_threshold - 1
+            return False
+        return True
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= self.failure_threshold:
+            self.opened_at = time.time()
+
+
+# Shared by every run in this worker process, a degraded provider is skipped by all of them
+circuit_breakers = {}
+
+
+def get_circuit_breaker(provider):
+    if provider not in circuit_breakers:
+        circuit_breakers[provider] = CircuitBreaker()
+    return circuit_breakers[provider]
+
+
+class HedgedChatModel:
+    """
+    Chat model that sends each request to the primary model and, when it is slower than
+    `hedge_after_seconds`, also to the next backup, using whichever answers first. Rate
+    limits and server errors fall back to the next model right away, and providers whose
+    circuit breaker is open are skipped.
+    """
+
+    _verified_api_keys = False
+
+    def __init__(self, llms, hedge_after_seconds=LLM_HEDGE_AFTER_SECONDS):
+        self.llms = llms
+        self.hedge_after_seconds = hedge_after_seconds
+        self.model = llms[0].model
+        self.agent = None
+        self.calls = []
+
+    @property
+    def provider(self):
+        return self.llms[0].provider
+
+    @property
+    def name(self):
+        return self.llms[0].name
+
+    @property
+    def model_name(self):
+        return self.model
+
+    def install(self, agent):
+        """
+        Track usage per model that actually served, instead of under the primary model. The agent
+        registered this wrapper with its token cost service too, that tracking is removed so each
+        answer is counted once, and under the model whose price applies.
+        """
+        self.agent = agent
+        vars(self).pop('ainvoke', None)
+        for llm in self.llms:
+            agent.token_cost_service.register_llm(llm)
+
+    def get_candidates(self):
+        candidates = [llm for llm in self.llms if not get_circuit_breaker(llm.provider).is_open()]
+        # With every breaker open, trying is still better than failing the step outright
+        return candidates or list(self.llms)
+
+    async def ainvoke(self, messages, output_format=None):
+        start_time = time.time()
+        candidates = self.get_candidates()
+        call = {
+            "step": self.agent.state.n_steps if self.agent else None,
+            "requested_model": self.model,
+            "served_by": None,
+            "hedged": False,
+            "errors": [],
+        }
+
+        pending = {}
+        next_candidate = 0
+        result = None
+        last_error = None
+        try:
+            while pending or next_candidate < len(candidates):
+                if not pending:
+                    llm = candidates[next_candidate]
+                    next_candidate += 1
+                    pending[asyncio.create_task(llm.ainvoke(messages, output_format))] = llm
+
+                can_hedge = self.hedge_after_seconds > 0 and next_candidate < len(candidates) and not call["hedged"]
+                done, _ = await asyncio.wait(
+                    pending.keys(),
+                    timeout=self.hedge_after_seconds if can_hedge else None,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    llm = candidates[next_candidate]
+                    next_candidate += 1
+                    call["hedged"] = True
+                    logger.info(f"No answer after {self.hedge_after_seconds}s, hedging with {llm.model}")
+                    pending[asyncio.create_task(llm.ainvoke(messages, output_format))] = llm
+                    continue
+
+                # A hedged answer and a non-retryable error can finish together, the answer wins
+                fatal_error = None
+                for task in done:
+                    llm = pending.pop(task)
+                    breaker = get_circuit_breaker(llm.provider)
+                    error = task.exception()
+                    if error is None:
+                        breaker.record_success()
+                        if result is None:
+                            result = task.result()
+                            call["served_by"] = {"provider": llm.provider, "model": llm.model}
+                        continue
+                    if not is_retryable_error(error):
+                        fatal_error = error
+                        continue
+                    breaker.record_failure()
+                    last_error = error
+                    call["errors"].append({"provider": llm.provider, "model": llm.model, "status_code": error.status_code})
+                    logger.warning(f"{llm.model} failed with status {error.status_code}, falling back")
+                if result is not None:
+                    break
+                if fatal_error is not None:
+                    raise fatal_error
+        finally:
+            for task in pending:
+                task.cancel()
+            call["latency_seconds"] = time.time() - start_time
+            self.calls.append(call)
+
+        if result is None:
+            raise last_error
+        # The answer keeps its usage, callers that read it (budgets, the prompt cache report) see the real tokens.
+        # A hedge that lost was cancelled before it returned usage, the provider does not report its spend
+        return result
+
+    def save_report(self, test_run_slug):
+        """Save which model served each call and its latency"""
+        latencies = sorted(call["latency_seconds"] for call in self.calls)
+        served_by = {}
+        for call in self.calls:
+            key = call["served_by"]["model"] if call["served_by"] else "failed"
+            served_by[key] = served_by.get(key, 0) + 1
+        report = {
+            "models": [{"provider": llm.provider, "model": llm.model} for llm in self.llms],
+            "hedge_after_seconds": self.hedge_after_seconds,
+            "served_by": served_by,
+            "hedged_calls": sum(1 for call in self.calls if call["hedged"]),
+            "p50_latency_seconds": latencies[len(latencies) // 2] if latencies else None,
+            "p99_latency_seconds": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else None,
+            "calls": self.calls,
+        }
+        try:
+            s3_client.put_object(
+                Bucket=S3_BUCKET_NAME,
+                Key=f"test-runs/{test_run_slug}/llm.json",
+                Body=json.dumps(report),
+                ContentType='application/json',
+            )
+        except Exception as e:
+            logger.error(f"Error saving LLM report for test run {test_run_slug}: {e}")
@@ -0,0 +1,180 @@
+from boto3 import client
+from dotenv import load_dotenv
+from contextlib import contextmanager
+import os
+import gc
+import json
+import time
+import logging
+import resource
+import threading
+import tracemalloc
+import psutil
+
+load_dotenv()
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Config
+S3_BUCKET_NAME = os.getenv('S3_BUCKET_NAME', 'flow-tester')
+MEMORY_MONITOR = os.getenv('MEMORY_MONITOR', 'false').lower() == 'true'
+# Python allocation tracing slows every allocation down, so it has its own switch
+MEMORY_TRACEMALLOC = os.getenv('MEMORY_TRACEMALLOC', 'false').lower() == 'true'
+MEMORY_SAMPLE_SECONDS = float(os.getenv('MEMORY_SAMPLE_SECONDS', '1'))
+# Growth of the worker's RSS over the last N jobs that logs a warning, and that recycles the worker
+MEMORY_GROWTH_WINDOW_JOBS = int(os.getenv('MEMORY_GROWTH_WINDOW_JOBS', '5'))
+MEMORY_GROWTH_WARNING_MB = float(os.getenv('MEMORY_GROWTH_WARNING_MB', '200'))
+MEMORY_GROWTH_RECYCLE_MB = float(os.getenv('MEMORY_GROWTH_RECYCLE_MB', '500'))
+TOP_ALLOCATORS = 10
+MB = 1024 * 1024
+
+# Initialize S3 client
+s3_client = client(
+    's3',
+    aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+    aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+    region_name=os.getenv('AWS_REGION', 'us-east-1')
+)
+
+
+def get_module_name(filename):
+    """Top-level package of a source file, e.g. `browser_use` for .../site-packages/browser_use/agent/service.py"""
+    parts = filename.replace('\\', '/').split('/')
+    for marker in ('site-packages', 'dist-packages'):
+        if marker in parts:
+            return parts[parts.index(marker) + 1].removesuffix('.py')
+    if os.path.dirname(os.path.abspath(filename)) == os.path.dirname(os.path.abspath(__file__)):
+        return os.path.basename(filename).removesuffix('.py')
+    return 'stdlib' if 'python3' in filename else filename
+
+
+def get_browser_processes():
+    # Chromium and its renderers are children of the worker, browser_use launches them as subprocesses
+    processes = []
+    for process in psutil.Process().children(recursive=True):
+        try:
+            if 'chrom' in process.name().lower():
+                processes.append(process)
+        except psutil.NoSuchProcess:
+            pass
+    return processes
+
+
+def get_rss(processes):
+    total = 0
+    for process in processes:
+        try:
+            total += process.memory_info().rss
+        except psutil.NoSuchProcess:
+            pass
+    return total
+
+
+class MemoryMonitor:
+    """
+    Measures the worker's memory around each job and watches its growth across jobs, so a
+    worker that keeps leaking (screenshots held by old results, browsers that were never
+    killed, SDK clients) is recycled before it runs out of memory
+    """
+
+    def __init__(self):
+        self.process = psutil.Process()
+        self.jobs = []
+        self.recycle = False
+
+    def sample(self, stop_event, peaks):
+        while not stop_event.wait(MEMORY_SAMPLE_SECONDS):
+            peaks["rss"] = max(peaks["rss"], self.process.memory_info().rss)
+            peaks["browser_rss"] = max(peaks["browser_rss"], get_rss(get_browser_processes()))
+
+    @contextmanager
+    def track(self, artifacts_prefix):
+        """
+        Measure the job run inside the block and save the report as `{artifacts_prefix}/memory.json`
+
+        Args:
+            artifacts_prefix (str): Where the job keeps its artifacts, e.g. `test-runs/<slug>`
+        """
+        if not MEMORY_MONITOR:
+            yield
+            return
+
+        gc.collect()
+        if MEMORY_TRACEMALLOC and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        snapshot_before = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+        rss_before = self.process.memory_info().rss
+        peak_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        peaks = {"rss": rss_before, "browser_rss": 0}
+        stop_event = threading.Event()
+        sampler = threading.Thread(target=self.sample, args=(stop_event, peaks), daemon=True)
+        sampler.start()
+        start_time = time.time()
+        try:
+            yield
+        finally:
+            stop_event.set()
+            sampler.join()
+            self.finish_job(artifacts_prefix, start_time, rss_before, peak_before, peaks, snapshot_before)
+
+    def get_top_allocators(self, snapshot_before):
+        """Python memory allocated during the job and still held after it, by top-level module"""
+        if snapshot_before is None:
+            return None
+        by_module = {}
+        for stat in tracemalloc.take_snapshot().compare_to(snapshot_before, 'filename'):
+            module = get_module_name(stat.traceback[0].filename)
+            by_module[module] = by_module.get(module, 0) + stat.size_diff
+        top = sorted(by_module.items(), key=lambda item: item[1], reverse=True)[:TOP_ALLOCATORS]
+        return [{"module": module, "size_diff_mb": size_diff / MB} for module, size_diff in top]
+
+    def get_growth(self):
+        """RSS growth over the last MEMORY_GROWTH_WINDOW_JOBS jobs, None until there are that many"""
+        if len(self.jobs) < MEMORY_GROWTH_WINDOW_JOBS:
+            return None
+        window = self.jobs[-MEMORY_GROWTH_WINDOW_JOBS:]
+        return window[-1]["rss_after_mb"] - window[0]["rss_before_mb"]
+
+    def finish_job(self, artifacts_prefix, start_time, rss_before, peak_before, peaks, snapshot_before):
+        gc.collect()
+        browser_processes = get_browser_processes()
+        job = {
+            "job": len(self.jobs) + 1,
+            "duration_seconds": time.time() - start_time,
+            "rss_before_mb": rss_before / MB,
+            "rss_after_mb": self.process.memory_info().rss / MB,
+            "sampled_peak_rss_mb": peaks["rss"] / MB,
+            "process_peak_rss_before_mb": peak_before / MB,
+            "process_peak_rss_after_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 / MB,
+            "browser_peak_rss_mb": peaks["browser_rss"] / MB,
+            # Browsers still running after the job are leaked, every job kills the ones it started
+            "browser_processes_after": len(browser_processes),
+            "browser_rss_after_mb": get_rss(browser_processes) / MB,
+            "top_allocators": self.get_top_allocators(snapshot_before),
+        }
+        self.jobs.append(job)
+
+        growth = self.get_growth()
+        job["growth_mb"] = growth
+        job["growth_window_jobs"] = MEMORY_GROWTH_WINDOW_JOBS
+        if growth is not None and growth >= MEMORY_GROWTH_RECYCLE_MB:
+            self.recycle = True
+            logger.warning(f"Worker memory grew {growth:.0f}MB over the last {MEMORY_GROWTH_WINDOW_JOBS} jobs, recycling the worker")
+        elif growth is not None and growth >= MEMORY_GROWTH_WARNING_MB:
+            logger.warning(f"Worker memory grew {growth:.0f}MB over the last {MEMORY_GROWTH_WINDOW_JOBS} jobs")
+        job["recycle"] = self.recycle
+
+        try:
+            s3_client.put_object(
+                Bucket=S3_BUCKET_NAME,
+                Key=f"{artifacts_prefix}/memory.json",
+                Body=json.dumps(job),
+                ContentType='application/json',
+            )
+        except Exception as e:
+            logger.error(f"Error saving memory report to {artifacts_prefix}: {e}")
+
+
+memory_monitor = MemoryMonitor()
@@ -0,0 +1,311 @@
+from browser_use.browser.events import BrowserConnectedEvent
+from boto3 import client
+from dotenv import load_dotenv
+import os
+import json
+import time
+import base64
+import asyncio
+import hashlib
+import inspect
+import logging
+
+load_dotenv()
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Config
+S3_BUCKET_NAME = os.getenv('S3_BUCKET_NAME', 'flow-tester')
+# Default profile for runs whose message has no `networkProfile`, e.g. '{"blockTrackers": true}'
+NETWORK_PROFILE = json.loads(os.getenv('NETWORK_PROFILE', 'null'))
+STATIC_CACHE_DIR = os.getenv('STATIC_CACHE_DIR', os.path.dirname(os.path.abspath(__file__)) + '/asset-cache')
+STATIC_CACHE_TTL_SECONDS = int(os.getenv('STATIC_CACHE_TTL_SECONDS', '3600'))
+STATIC_CACHE_MAX_ASSET_BYTES = 5 * 1024 * 1024
+
+TRACKER_DOMAINS = [
+    'google-analytics.com',
+    'googletagmanager.com',
+    'doubleclick.net',
+    'googlesyndication.com',
+    'googleadservices.com',
+    'connect.facebook.net',
+    'hotjar.com',
+    'segment.com',
+    'segment.io',
+    'mixpanel.com',
+    'amplitude.com',
+    'fullstory.com',
+    'clarity.ms',
+    'bat.bing.com',
+    'ads-twitter.com',
+    'analytics.tiktok.com',
+    'intercom.io',
+    'newrelic.com',
+    'nr-data.net',
+    'sentry.io',
+]
+
+# CDP resource types whose responses are shared across runs through the static asset cache
+CACHEABLE_RESOURCE_TYPES = ['Stylesheet', 'Script', 'Font', 'Image']
+
+# Initialize S3 client
+s3_client = client(
+    's3',
+    aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+    aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+    region_name=os.getenv('AWS_REGION', 'us-east-1')
+)
+
+
+class NetworkInterceptor:
+    """
+    Applies a network profile to a browser session over CDP: blocks tracker and other listed
+    domains in the browser itself, fails requests of blocked resource types (e.g. Media, Font)
+    and serves static assets from a cache shared by every run on this worker.
+
+    Profile keys (all optional):
+        blockTrackers (bool): Block the built-in list of analytics and ad domains
+        blockedDomains (list): Extra domains to block
+        blockedResourceTypes (list): CDP resource types to block, e.g. ["Media", "Font"]
+        cacheStaticAssets (bool): Serve stylesheets, scripts, fonts and images from the worker cache
+    """
+
+    def __init__(self, profile):
+        self.blocked_domains = list(profile.get('blockedDomains', []))
+        if profile.get('blockTrackers'):
+            self.blocked_domains += TRACKER_DOMAINS
+        self.blocked_resource_types = list(profile.get('blockedResourceTypes', []))
+        self.cache_static_assets = bool(profile.get('cacheStaticAssets'))
+        self.cdp_client = None
+        self.previous_handlers = {}
+        self.stats = {
+            "profile": profile,
+            "blocked_requests": 0,
+            "blocked_by_resource_type": {},
+            "cache_hits": 0,
+            "cache_stores": 0,
+            "bytes_saved": 0,
+        }
+        if self.cache_static_assets:
+            os.makedirs(STATIC_CACHE_DIR, exist_ok=True)
+
+    def attach(self, browser_session):
+        """Install the profile on every page of the browser session once it connects"""
+        self.browser_session = browser_session
+        browser_session.event_bus.on(BrowserConnectedEvent, self.on_browser_connected)
+
+    def detach(self):
+        """Stop installing the profile, the worker's shared browser would otherwise collect one handler per run"""
+        handlers = self.browser_session.event_bus.handlers.get(BrowserConnectedEvent.__name__, [])
+        if self.on_browser_connected in handlers:
+            handlers.remove(self.on_browser_connected)
+        # Hand the CDP events back to the handlers browser_use registered before this run
+        if self.cdp_client:
+            registry = self.cdp_client._event_registry
+            for method, previous in self.previous_handlers.items():
+                if previous:
+                    registry.register(method, previous)
+                else:
+                    registry.unregister(method)
+            self.previous_handlers = {}
+
+    def register_handler(self, method, handler, chain=True):
+        """
+        Register a CDP event handler. The CDP client keeps one handler per event, so the one registered
+        before (e.g. browser_use's target tracking) is called first instead of being replaced
+        """
+        registry = self.cdp_client._event_registry
+        previous = registry._handlers.get(method)
+        self.previous_handlers.setdefault(method, previous)
+        if not chain or not previous:
+            registry.register(method, handler)
+            return
+
+        async def chained_handler(event, session_id=None):
+            try:
+                result = previous(event, session_id)
+                if inspect.isawaitable(result):
+                    await result
+            finally:
+                handler(event, session_id)
+
+        registry.register(method, chained_handler)
+
+    async def on_browser_connected(self, event):
+        self.cdp_client = self.browser_session.cdp_client
+        self.register_handler('Target.attachedToTarget', self.on_attached_to_target)
+        self.register_handler('Network.loadingFailed', self.on_loading_failed)
+        # Every paused request must be resolved exactly once. This handler continues whatever it does not
+        # block or serve from the cache, which is all browser_use's proxy auth handler does, so it replaces it
+        self.register_handler('Fetch.requestPaused', self.on_request_paused, chain=False)
+
+        targets = await self.cdp_client.send.Target.getTargets()
+        for target in targets['targetInfos']:
+            if target['type'] == 'page':
+                attached = await self.cdp_client.send.Target.attachToTarget(
+                    params={'targetId': target['targetId'], 'flatten': True}
+                )
+                await self.enable_session(attached['sessionId'])
+
+    def on_attached_to_target(self, event, session_id=None):
+        # New tabs and popups are auto-attached by the browser session
+        if event['targetInfo']['type'] == 'page':
+            asyncio.create_task(self.enable_session(event['sessionId']))
+
+    async def enable_session(self, session_id):
+        try:
+            await self.cdp_client.send.Network.enable(session_id=session_id)
+            if self.blocked_domains:
+                # Blocked inside the browser, these requests never pause or reach the network
+                await self.cdp_client.send.Network.setBlockedURLs(
+                    params={'urls': [pattern for domain in self.blocked_domains for pattern in (f"*://{domain}/*", f"*://*.{domain}/*")]},
+                    session_id=session_id
+                )
+
+            patterns = [{'resourceType': resource_type, 'requestStage': 'Request'} for resource_type in self.blocked_resource_types]
+            if self.cache_static_assets:
+                for resource_type in CACHEABLE_RESOURCE_TYPES:
+                    patterns.append({'resourceType': resource_type, 'requestStage': 'Request'})
+                    patterns.append({'resourceType': resource_type, 'requestStage': 'Response'})
+            if patterns:
+                # Fetch.enable replaces the session's earlier settings, keep answering proxy auth challenges
+                handle_auth_requests = 'Fetch.authRequired' in self.cdp_client._event_registry.get_registered_methods()
+                await self.cdp_client.send.Fetch.enable(
+                    params={'patterns': patterns, 'handleAuthRequests': handle_auth_requests},
+                    session_id=session_id
+                )
+        except Exception as e:
+            logger.debug(f"Could not apply network profile to session {session_id}: {e}")
+
+    def on_loading_failed(self, event, session_id=None):
+        # Requests blocked by setBlockedURLs fail with the 'inspector' reason
+        if event.get('blockedReason') == 'inspector':
+            self.count_blocked(event.get('type', 'Other'))
+
+    def count_blocked(self, resource_type):
+        self.stats["blocked_requests"] += 1
+        by_type = self.stats["blocked_by_resource_type"]
+        by_type[resource_type] = by_type.get(resource_type, 0) + 1
+
+    def on_request_paused(self, event, session_id=None):
+        asyncio.create_task(self.handle_request_paused(event, session_id))
+
+    async def handle_request_paused(self, event, session_id):
+        request_id = event['requestId']
+        resource_type = event.get('resourceType')
+        try:
+            if 'responseStatusCode' in event:
+                # Response stage, only reached by cacheable assets that were not in the cache
+                if event['responseStatusCode'] == 200:
+                    await self.store_in_cache(event, session_id)
+                await self.cdp_client.send.Fetch.continueRequest(params={'requestId': request_id}, session_id=session_id)
+                return
+
+            if resource_type in self.blocked_resource_types:
+                self.count_blocked(resource_type)
+                await self.cdp_client.send.Fetch.failRequest(
+                    params={'requestId': request_id, 'errorReason': 'BlockedByClient'},
+                    session_id=session_id
+                )
+                return
+
+            cached = self.load_from_cache(event['request'])
+            if cached:
+                headers, body = cached
+                self.stats["cache_hits"] += 1
+                self.stats["bytes_saved"] += len(body)
+                await self.cdp_client.send.Fetch.fulfillRequest(
+                    params={
+                        'requestId': request_id,
+                        'responseCode': 200,
+                        'responseHeaders': headers,
+                        'body': base64.b64encode(body).decode('utf-8'),
+                    },
+                    session_id=session_id
+                )
+                return
+
+            await self.cdp_client.send.Fetch.continueRequest(params={'requestId': request_id}, session_id=session_id)
+        except Exception as e:
+            # A paused request that is never resolved hangs the page until the run times out
+            logger.warning(f"Error handling paused request {request_id}, continuing it: {e}")
+            try:
+                await self.cdp_client.send.Fetch.continueRequest(params={'requestId': request_id}, session_id=session_id)
+            except Exception as continue_error:
+                logger.debug(f"Could not continue paused request {request_id}: {continue_error}")
+
+    def get_cache_path(self, url):
+        return os.path.join(STATIC_CACHE_DIR, hashlib.sha256(url.encode('utf-8')).hexdigest())
+
+    def load_from_cache(self, request):
+        if request.get('method') != 'GET':
+            return None
+        cache_path = self.get_cache_path(request['url'])
+        try:
+            if time.time() - os.path.getmtime(cache_path) > STATIC_CACHE_TTL_SECONDS:
+                return None
+            with open(f"{cache_path}.json") as file:
+                headers = json.load(file)
+            with open(cache_path, 'rb') as file:
+                return headers, file.read()
+        except (OSError, ValueError):
+            # Missing, or a corrupt header file, the request goes to the network
+            return None
+
+    async def store_in_cache(self, event, session_id):
+        request = event['request']
+        headers = event.get('responseHeaders', [])
+        cache_control = next((header['value'] for header in headers if header['name'].lower() == 'cache-control'), '')
+        if request.get('method') != 'GET' or 'no-store' in cache_control or 'private' in cache_control:
+            return
+
+        response = await self.cdp_client.send.Fetch.getResponseBody(params={'requestId': event['requestId']}, session_id=session_id)
+        body = base64.b64decode(response['body']) if response.get('base64Encoded') else response['body'].encode('utf-8')
+        if len(body) > STATIC_CACHE_MAX_ASSET_BYTES:
+            return
+
+        # The body is stored decoded, so encoding headers must not be replayed
+        kept_headers = [header for header in headers if header['name'].lower() not in ('content-encoding', 'content-length', 'transfer-encoding')]
+        cache_path = self.get_cache_path(request['url'])
+        # Worker processes share the cache, files are replaced whole so no reader sees a partial write
+        temporary_suffix = f".{os.getpid()}.tmp"
+        with open(f"{cache_path}.json{temporary_suffix}", 'w') as file:
+            json.dump(kept_headers, file)
+        with open(f"{cache_path}{temporary_suffix}", 'wb') as file:
+            file.write(body)
+        os.replace(f"{cache_path}.json{temporary_suffix}", f"{cache_path}.json")
+        os.replace(f"{cache_path}{temporary_suffix}", cache_path)
+        self.stats["cache_stores"] += 1
+
+    def save_report(self, test_run_slug):
+        """Save the run's blocked request counts and bytes saved next to its artifacts"""
+        try:
+            s3_client.put_object(
+                Bucket=S3_BUCKET_NAME,
+                Key=f"test-runs/{test_run_slug}/network.json",
+                Body=json.dumps(self.stats),
+                ContentType='application/json',
+            )
+            logger.info(f"Network profile of test run {test_run_slug} blocked {self.stats['blocked_requests']} requests "
+                        f"and served {self.stats['cache_hits']} cached assets ({self.stats['bytes_saved']} bytes)")
+        except Exception as e:
+            logger.error(f"Error saving network report for test run {test_run_slug}: {e}")
+
+
+def createNetworkInterceptor(message):
+    """
+    Create the network interceptor for a run from the message's `networkProfile`, falling back to
+    the worker's NETWORK_PROFILE
+
+    Args:
+        message (dict): The test run message
+
+    Returns:
+        NetworkInterceptor or None: The interceptor, None if no profile applies
+    """
+    profile = message.get('networkProfile') or NETWORK_PROFILE
+    if not profile:
+        return None
+    return NetworkInterceptor(profile)
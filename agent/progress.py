@@ -0,0 +1,90 @@
+from boto3 import client
+from dotenv import load_dotenv
+import os
+import base64
+import logging
+from db_operations import TestRunDB
+
+load_dotenv()
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Config
+S3_BUCKET_NAME = os.getenv('S3_BUCKET_NAME', 'flow-tester')
+PROGRESS_BATCH_SIZE = int(os.getenv('PROGRESS_BATCH_SIZE', '3'))
+
+# Initialize S3 client
+s3_client = client(
+    's3',
+    aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+    aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+    region_name=os.getenv('AWS_REGION', 'us-east-1')
+)
+
+
+class StepProgressRecorder:
+    """
+    Buffers compact per-step progress records of a running test and writes them
+    to `tests_runs_steps` in batches, so in-flight runs can be followed step by step.
+    """
+
+    def __init__(self, test_run_slug, batch_size=PROGRESS_BATCH_SIZE):
+        self.test_run_slug = test_run_slug
+        self.batch_size = batch_size
+        self.pending_steps = []
+        self.db = TestRunDB()
+
+    def build_step(self, history):
+        step_number = history.number_of_steps()
+        history_item = history.history[-1]
+        action_names = history_item.model_output.action if history_item.model_output else []
+        action_name = next(iter(action_names[0].model_dump(exclude_none=True)), None) if action_names else None
+        metadata = history_item.metadata
+
+        # Uploaded now so progress views can show it, save_result_screenshots later writes the same key
+        screenshot_key = None
+        screenshot = history.screenshots(n_last=1)
+        if screenshot and screenshot[0]:
+            screenshot_key = f"test-runs/{self.test_run_slug}/screenshots/{step_number}.png"
+            try:
+                s3_client.put_object(
+                    Bucket=S3_BUCKET_NAME,
+                    Key=screenshot_key,
+                    Body=base64.b64decode(screenshot[0]),
+                    ContentType='image/png',
+                )
+            except Exception as e:
+                logger.error(f"Error uploading progress screenshot for test run {self.test_run_slug}: {e}")
+                screenshot_key = None
+
+        return {
+            'step_number': step_number,
+            'action_name': action_name,
+            'url': history_item.state.url,
+            'duration_seconds': metadata.duration_seconds if metadata else None,
+            'screenshot_key': screenshot_key,
+        }
+
+    async def on_step_end(self, agent):
+        """Hook for `agent.run(on_step_end=...)`, records the step that just finished"""
+        try:
+            self.pending_steps.append(self.build_step(agent.history))
+        except Exception as e:
+            logger.error(f"Error recording progress for test run {self.test_run_slug}: {e}")
+            return
+
+        if len(self.pending_steps) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered steps in a single batched insert"""
+        if not self.pending_steps:
+            return
+        if self.db.insert_test_run_steps(self.test_run_slug, self.pending_steps):
+            self.pending_steps = []
+
+    def close(self):
+        self.flush()
+        self.db.disconnect()
@@ -0,0 +1,106 @@
+from boto3 import client
+from dotenv import load_dotenv
+import os
+import json
+import time
+import logging
+
+load_dotenv()
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Config
+S3_BUCKET_NAME = os.getenv('S3_BUCKET_NAME', 'flow-tester')
+
+# Initialize S3 client
+s3_client = client(
+    's3',
+    aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+    aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+    region_name=os.getenv('AWS_REGION', 'us-east-1')
+)
+
+
+def mean(values):
+    return sum(values) / len(values) if values else None
+
+
+class PromptCacheRecorder:
+    """
+    Records how much of each model request's prompt the provider served from its prompt
+    cache, and how long cached and uncached requests took. Anthropic caches the system
+    prompt browser_use marks with cache control, OpenAI and Gemini cache repeated prompt
+    prefixes implicitly, so the static part of a run's prompt belongs in the system prompt.
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def install(self, agent):
+        """
+        Wrap the agent's model so every request's usage and latency is recorded. Behind a hedged model
+        each of its models is wrapped, so a request is recorded under the model that served it, with
+        its own latency, and a hedge that lost is not recorded
+        """
+        for llm in getattr(agent.llm, 'llms', [agent.llm]):
+            self.wrap(llm)
+
+    def wrap(self, llm):
+        ainvoke = llm.ainvoke
+
+        async def recorded_ainvoke(messages, output_format=None):
+            start_time = time.time()
+            response = await ainvoke(messages, output_format)
+            usage = response.usage
+            if usage:
+                self.calls.append({
+                    "model": llm.model,
+                    "duration_seconds": time.time() - start_time,
+                    "prompt_tokens": usage.prompt_tokens,
+                    "cached_tokens": usage.prompt_cached_tokens or 0,
+                    "cache_creation_tokens": usage.prompt_cache_creation_tokens or 0,
+                })
+            return response
+
+        llm.ainvoke = recorded_ainvoke
+
+    def get_report(self):
+        prompt_tokens = sum(call["prompt_tokens"] for call in self.calls)
+        cached_tokens = sum(call["cached_tokens"] for call in self.calls)
+        cached_calls = [call for call in self.calls if call["cached_tokens"]]
+        uncached_calls = [call for call in self.calls if not call["cached_tokens"]]
+        return {
+            "calls": len(self.calls),
+            "cached_calls": len(cached_calls),
+            "prompt_tokens": prompt_tokens,
+            "cached_tokens": cached_tokens,
+            # Anthropic only, writing the cache costs more than uncached input
+            "cache_creation_tokens": sum(call["cache_creation_tokens"] for call in self.calls),
+            "cached_share": cached_tokens / prompt_tokens if prompt_tokens else None,
+            "mean_cached_call_seconds": mean([call["duration_seconds"] for call in cached_calls]),
+            "mean_uncached_call_seconds": mean([call["duration_seconds"] for call in uncached_calls]),
+            "models": sorted({call["model"] for call in self.calls}),
+        }
+
+    def save_report(self, artifacts_prefix):
+        """
+        Save the run's prompt cache usage as `{artifacts_prefix}/prompt-cache.json`
+
+        Args:
+            artifacts_prefix (str): Where the run keeps its artifacts, e.g. `test-runs/<slug>`
+        """
+        report = self.get_report()
+        try:
+            s3_client.put_object(
+                Bucket=S3_BUCKET_NAME,
+                Key=f"{artifacts_prefix}/prompt-cache.json",
+                Body=json.dumps(report),
+                ContentType='application/json',
+            )
+            if report["prompt_tokens"]:
+                logger.info(f"{report['cached_tokens']} of {report['prompt_tokens']} prompt tokens of {artifacts_prefix} "
+                            f"were served from the provider's prompt cache")
+        except Exception as e:
+            logger.error(f"Error saving prompt cache report to {artifacts_prefix}: {e}")
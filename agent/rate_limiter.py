@@ -0,0 +1,228 @@
+from browser_use.llm.messages import ContentPartImageParam
+from boto3 import client
+from dotenv import load_dotenv
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+from db_operations import RateLimitDB
+
+load_dotenv()
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Config
+S3_BUCKET_NAME = os.getenv('S3_BUCKET_NAME', 'flow-tester')
+# Limits per "provider/model" or per "provider", e.g. '{"openai/gpt-4.1": {"rpm": 500, "tpm": 200000}, "anthropic": {"rpm": 50}}'
+LLM_RATE_LIMITS = json.loads(os.getenv('LLM_RATE_LIMITS', '{}'))
+# "local" limits this worker process only, "postgres" shares the buckets with every worker
+RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'local')
+# Wait times are also sent to CloudWatch when a namespace is set
+CLOUDWATCH_NAMESPACE = os.getenv('CLOUDWATCH_NAMESPACE')
+# Rough token cost of one screenshot, used until the provider reports the real usage
+ESTIMATED_IMAGE_TOKENS = 1500
+CHARS_PER_TOKEN = 4
+
+# Initialize S3 client
+s3_client = client(
+    's3',
+    aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+    aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+    region_name=os.getenv('AWS_REGION', 'us-east-1')
+)
+
+
+class LocalTokenBucket:
+    """Token bucket for one worker process, shared by the event loops of all its runs"""
+
+    def __init__(self, capacity, refill_per_second):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.level = capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, amount):
+        with self.lock:
+            now = time.monotonic()
+            self.level = min(self.capacity, self.level + (now - self.updated_at) * self.refill_per_second) - amount
+            self.updated_at = now
+            return self.level
+
+
+class PostgresTokenBucket:
+    """Token bucket stored in Postgres, so every worker draws from the same capacity"""
+
+    db = None
+    db_lock = threading.Lock()
+
+    def __init__(self, bucket_key, capacity, refill_per_second):
+        self.bucket_key = bucket_key
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+
+    def reserve(self, amount):
+        # One connection per worker process, reservations are short single statements
+        with PostgresTokenBucket.db_lock:
+            if PostgresTokenBucket.db is None:
+                PostgresTokenBucket.db = RateLimitDB()
+            level = PostgresTokenBucket.db.reserve_capacity(self.bucket_key, self.capacity, self.refill_per_second, amount)
+        if level is None:
+            # Failing open: an unreachable database must not stop every run
+            return self.capacity
+        return level
+
+
+buckets = {}
+buckets_lock = threading.Lock()
+
+
+def get_bucket(bucket_key, per_minute):
+    with buckets_lock:
+        if bucket_key not in buckets:
+            if RATE_LIMIT_BACKEND == 'postgres':
+                buckets[bucket_key] = PostgresTokenBucket(bucket_key, per_minute, per_minute / 60)
+            else:
+                buckets[bucket_key] = LocalTokenBucket(per_minute, per_minute / 60)
+        return buckets[bucket_key]
+
+
+def get_rate_limits(provider, model):
+    """
+    Find the limits of a model, its own or else its provider's
+
+    Returns:
+        tuple: The LLM_RATE_LIMITS key that matched and its limits, (None, None) if none did
+    """
+    for limits_key in (f"{provider}/{model}", provider):
+        if LLM_RATE_LIMITS.get(limits_key):
+            return limits_key, LLM_RATE_LIMITS[limits_key]
+    return None, None
+
+
+def estimate_tokens(messages):
+    tokens = 0
+    for message in messages:
+        content = getattr(message, 'content', None)
+        if isinstance(content, str):
+            tokens += len(content) // CHARS_PER_TOKEN
+        elif isinstance(content, list):
+            for part in content:
+                if isinstance(part, ContentPartImageParam):
+                    tokens += ESTIMATED_IMAGE_TOKENS
+                else:
+                    tokens += len(getattr(part, 'text', '') or '') // CHARS_PER_TOKEN
+    return tokens
+
+
+class RateLimitedChatModel:
+    """
+    Chat model that waits for request-per-minute and token-per-minute capacity of its
+    limits before each call, so concurrent runs queue instead of getting 429s. The buckets are
+    keyed by the limits entry, so the models under a provider-wide entry share its capacity.
+    """
+
+    _verified_api_keys = False
+
+    def __init__(self, llm, limits, limits_key):
+        self.llm = llm
+        self.model = llm.model
+        self.rpm_bucket = get_bucket(f"{limits_key}:rpm", limits['rpm']) if limits.get('rpm') else None
+        self.tpm_bucket = get_bucket(f"{limits_key}:tpm", limits['tpm']) if limits.get('tpm') else None
+        self.stats = {"calls": 0, "waited_calls": 0, "wait_seconds": 0, "max_wait_seconds": 0}
+
+    @property
+    def provider(self):
+        return self.llm.provider
+
+    @property
+    def name(self):
+        return self.llm.name
+
+    @property
+    def model_name(self):
+        return self.model
+
+    async def acquire(self, estimated_tokens):
+        wait_seconds = 0
+        for bucket, amount in ((self.rpm_bucket, 1), (self.tpm_bucket, estimated_tokens)):
+            if bucket:
+                level = await asyncio.to_thread(bucket.reserve, amount)
+                if level < 0:
+                    wait_seconds = max(wait_seconds, -level / bucket.refill_per_second)
+        if wait_seconds > 0:
+            await asyncio.sleep(wait_seconds)
+        return wait_seconds
+
+    async def ainvoke(self, messages, output_format=None):
+        estimated_tokens = estimate_tokens(messages)
+        wait_seconds = await self.acquire(estimated_tokens)
+        self.stats["calls"] += 1
+        if wait_seconds > 0:
+            self.stats["waited_calls"] += 1
+            self.stats["wait_seconds"] += wait_seconds
+            self.stats["max_wait_seconds"] = max(self.stats["max_wait_seconds"], wait_seconds)
+            logger.info(f"Waited {wait_seconds:.1f}s for {self.provider}/{self.model} rate limit capacity")
+
+        result = await self.llm.ainvoke(messages, output_format)
+        if self.tpm_bucket and result.usage:
+            # Settle the estimate against the tokens the provider actually counted
+            await asyncio.to_thread(self.tpm_bucket.reserve, result.usage.total_tokens - estimated_tokens)
+        return result
+
+
+def rateLimited(llm):
+    """Wrap a chat model in its model's or provider's rate limits, if any are configured"""
+    limits_key, limits = get_rate_limits(llm.provider, llm.model)
+    if not limits:
+        return llm
+    return RateLimitedChatModel(llm, limits, limits_key)
+
+
+def save_rate_limit_report(test_run_slug, llm):
+    """
+    Save how long a run waited for rate limit capacity per model, and send the wait
+    times to CloudWatch when CLOUDWATCH_NAMESPACE is set
+
+    Args:
+        test_run_slug (str): The slug identifier of the test run
+        llm: The run's chat model, a single model or a `HedgedChatModel` of several
+    """
+    rate_limited_llms = [model for model in getattr(llm, 'llms', [llm]) if isinstance(model, RateLimitedChatModel)]
+    if not rate_limited_llms:
+        return
+
+    report = {f"{model.provider}/{model.model}": model.stats for model in rate_limited_llms}
+    try:
+        s3_client.put_object(
+            Bucket=S3_BUCKET_NAME,
+            Key=f"test-runs/{test_run_slug}/rate-limits.json",
+            Body=json.dumps(report),
+            ContentType='application/json',
+        )
+    except Exception as e:
+        logger.error(f"Error saving rate limit report for test run {test_run_slug}: {e}")
+
+    if CLOUDWATCH_NAMESPACE:
+        try:
+            client('cloudwatch', region_name=os.getenv('AWS_REGION', 'us-east-1')).put_metric_data(
+                Namespace=CLOUDWATCH_NAMESPACE,
+                MetricData=[
+                    {
+                        'MetricName': 'RateLimitWaitSeconds',
+                        'Dimensions': [
+                            {'Name': 'Provider', 'Value': model.provider},
+                            {'Name': 'Model', 'Value': model.model},
+                        ],
+                        'Value': model.stats["wait_seconds"],
+                        'Unit': 'Seconds',
+                    }
+                    for model in rate_limited_llms
+                ]
+            )
+        except Exception as e:
+            logger.error(f"Error sending rate limit metrics for test run {test_run_slug}: {e}")
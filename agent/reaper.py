@@ -0,0 +1,145 @@
+from boto3 import client
+from dotenv import load_dotenv
+import os
+import uuid
+import time
+import logging
+from db_operations import reap_stale_test_runs, fail_test_runs
+from claim_check import encode_message_body
+
+load_dotenv()
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Config
+QUEUE_URL = os.getenv('REAPER_QUEUE_URL', 'https://sqs.us-west-2.amazonaws.com/746664778706/flow-tester-test-runs-queue')
+REGION = 'us-west-2'
+# A running run is stale when not updated for this long. It is past RUN_MAX_SECONDS, so live runs are never taken,
+# and past the scheduler's processing visibility, so SQS redelivers the original message first
+REAPER_RUNNING_TIMEOUT_SECONDS = int(os.getenv('REAPER_RUNNING_TIMEOUT_SECONDS', '5400'))
+# Pending runs may just be waiting behind a backlog, requeueing them early would run them twice
+REAPER_PENDING_TIMEOUT_SECONDS = int(os.getenv('REAPER_PENDING_TIMEOUT_SECONDS', '7200'))
+# Times a run is requeued before it is failed, a run that kills its worker every time stops there
+REAPER_MAX_REQUEUES = int(os.getenv('REAPER_MAX_REQUEUES', '1'))
+REAPER_BATCH_SIZE = int(os.getenv('REAPER_BATCH_SIZE', '500'))
+REAPER_INTERVAL_SECONDS = int(os.getenv('REAPER_INTERVAL_SECONDS', '300'))
+CLOUDWATCH_NAMESPACE = os.getenv('CLOUDWATCH_NAMESPACE')
+# SQS takes at most 10 messages per batch send
+SQS_BATCH_SIZE = 10
+
+# Initialize SQS client
+sqs = client('sqs', region_name=REGION)
+
+
+def get_requeue_message(run):
+    """Rebuild the queue message of a test run, as the runs route sends it"""
+    return {
+        "taskType": "test-run",
+        "testRunSlug": run['slug'],
+        "testVersionSlug": run['version_slug'],
+        "testSlug": run['test_slug'],
+        "projectSlug": run['project_slug'],
+        "organizationSlug": run['organization_slug'],
+        "createdAt": run['created_at'].isoformat(),
+        "userEmail": run['user_email'],
+        "task": run['description'],
+        "modelSlug": run['model_slug'],
+        "modelProvider": run['model_provider'],
+        "reapCount": run['reap_count'],
+        "storageStateMode": run['storage_state_mode'],
+        "performanceBudget": run['performance_budget'],
+    }
+
+
+def requeue_runs(runs):
+    """
+    Send the queue messages of runs in batches
+
+    Returns:
+        list: Slugs of the runs whose message could not be sent
+    """
+    failed_slugs = []
+    for start in range(0, len(runs), SQS_BATCH_SIZE):
+        batch = runs[start:start + SQS_BATCH_SIZE]
+        entries = {}
+        for run in batch:
+            try:
+                entries[uuid.uuid4().hex] = (run['slug'], encode_message_body(get_requeue_message(run)))
+            except Exception as e:
+                logger.error(f"Could not build the message of test run {run['slug']}: {e}")
+                failed_slugs.append(run['slug'])
+        if not entries:
+            continue
+        try:
+            response = sqs.send_message_batch(
+                QueueUrl=QUEUE_URL,
+                Entries=[{"Id": entry_id, "MessageBody": body} for entry_id, (slug, body) in entries.items()]
+            )
+            for failure in response.get('Failed', []):
+                logger.error(f"Could not requeue test run {entries[failure['Id']][0]}: {failure.get('Message')}")
+                failed_slugs.append(entries[failure['Id']][0])
+        except Exception as e:
+            logger.error(f"Could not requeue {len(entries)} test runs: {e}")
+            failed_slugs.extend(slug for slug, body in entries.values())
+    return failed_slugs
+
+
+def send_metrics(metrics):
+    if not CLOUDWATCH_NAMESPACE:
+        return
+    try:
+        client('cloudwatch', region_name=os.getenv('AWS_REGION', 'us-east-1')).put_metric_data(
+            Namespace=CLOUDWATCH_NAMESPACE,
+            MetricData=[
+                {'MetricName': name, 'Value': value, 'Unit': 'Count'}
+                for name, value in metrics.items()
+            ]
+        )
+    except Exception as e:
+        logger.error(f"Error sending reaper metrics: {e}")
+
+
+def reap_once():
+    """
+    Take back the test runs whose worker died, requeue those that may retry and fail the rest
+
+    Returns:
+        dict or None: Counts of reaped, requeued and failed runs, None if the database could not be read
+    """
+    reaped = reap_stale_test_runs(REAPER_RUNNING_TIMEOUT_SECONDS, REAPER_PENDING_TIMEOUT_SECONDS, REAPER_MAX_REQUEUES, REAPER_BATCH_SIZE)
+    if reaped is None:
+        return None
+
+    # The reap statement already moved retryable runs back to pending and failed the others
+    retryable = [run for run in reaped if run['status'] == 'pending']
+    failed_slugs = requeue_runs(retryable)
+    if failed_slugs and fail_test_runs(failed_slugs, 'stale:requeue_failed') is None:
+        logger.error(f"Could not fail {len(failed_slugs)} test runs that were not requeued, they stay pending")
+
+    metrics = {
+        "StaleRunsReaped": len(reaped),
+        "StaleRunsReapedRunning": sum(1 for run in reaped if run['previous_status'] == 'running'),
+        "StaleRunsReapedPending": sum(1 for run in reaped if run['previous_status'] == 'pending'),
+        "StaleRunsRequeued": len(retryable) - len(failed_slugs),
+        "StaleRunsFailed": len(reaped) - len(retryable) + len(failed_slugs),
+    }
+    if reaped:
+        logger.info(f"Reaped {metrics['StaleRunsReaped']} stale test runs: {metrics['StaleRunsRequeued']} requeued, "
+                    f"{metrics['StaleRunsFailed']} failed")
+    send_metrics(metrics)
+    return metrics
+
+
+def reaper():
+    while True:
+        start_time = time.time()
+        metrics = reap_once()
+        # A full batch means more stale runs are waiting, take them right away
+        if metrics is None or metrics["StaleRunsReaped"] < REAPER_BATCH_SIZE:
+            time.sleep(max(0, REAPER_INTERVAL_SECONDS - (time.time() - start_time)))
+
+
+if __name__ == "__main__":
+    reaper()
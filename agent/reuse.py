@@ -0,0 +1,184 @@
+from boto3 import client
+from dotenv import load_dotenv
+from datetime import datetime, timezone
+from urllib.request import Request, urlopen
+import os
+import re
+import json
+import hashlib
+import logging
+from agent import load_json_from_s3_key, load_run_index_from_s3
+
+load_dotenv()
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Config
+S3_BUCKET_NAME = os.getenv('S3_BUCKET_NAME', 'flow-tester')
+# Reuse is off unless a max age is set here or per message with `reuseMaxAgeSeconds`
+REUSE_MAX_AGE_SECONDS = int(os.getenv('REUSE_MAX_AGE_SECONDS', '0'))
+FINGERPRINT_TIMEOUT_SECONDS = 5
+
+# Initialize S3 client
+s3_client = client(
+    's3',
+    aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+    aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+    region_name=os.getenv('AWS_REGION', 'us-east-1')
+)
+
+URL_PATTERN = re.compile(r'https?://[^\s"\'<>)\]]+')
+
+
+def extract_start_url(task):
+    """
+    Find the URL a test starts from, which is the first URL in its description
+
+    Args:
+        task (str): The test description
+
+    Returns:
+        str or None: The start URL if the description contains one, None otherwise
+    """
+    match = URL_PATTERN.search(task or '')
+    return match.group(0).rstrip('.,;') if match else None
+
+
+def get_url_fingerprint(url):
+    """
+    Get a cheap fingerprint of the main document at a URL, preferring validators
+    (ETag, Last-Modified) from a HEAD request over hashing the body
+
+    Args:
+        url (str): The URL to fingerprint
+
+    Returns:
+        str or None: The fingerprint, None if the URL could not be fetched
+    """
+    headers = {'User-Agent': 'FlowTester/1.0'}
+    try:
+        with urlopen(Request(url, headers=headers, method='HEAD'), timeout=FINGERPRINT_TIMEOUT_SECONDS) as response:
+            etag = response.headers.get('ETag')
+            # Weak ETags change with compression settings but still identify the content
+            if etag:
+                return f"etag:{etag}"
+            last_modified = response.headers.get('Last-Modified')
+            if last_modified:
+                return f"last-modified:{last_modified}"
+    except Exception as e:
+        logger.info(f"HEAD request failed for {url}, falling back to GET: {e}")
+
+    try:
+        with urlopen(Request(url, headers=headers), timeout=FINGERPRINT_TIMEOUT_SECONDS) as response:
+            return f"sha256:{hashlib.sha256(response.read()).hexdigest()}"
+    except Exception as e:
+        logger.warning(f"Could not fingerprint {url}: {e}")
+        return None
+
+
+def get_reuse_max_age_seconds(message):
+    return int(message.get('reuseMaxAgeSeconds') or REUSE_MAX_AGE_SECONDS)
+
+
+def decide_reuse(message, previous_run):
+    """
+    Decide whether a test run can reuse the results of the latest succeeded run of the same
+    version, which requires that run to be recent and the start URL to be unchanged since
+
+    Args:
+        message (dict): The test run message
+        previous_run (dict): The latest succeeded run of the message's version, None if it has none
+
+    Returns:
+        dict: The decision with `reused` (bool), `reason`, the current `start_url` and `fingerprint`
+            and, for a reused run, when the run whose results it serves was executed
+    """
+    max_age_seconds = get_reuse_max_age_seconds(message)
+    decision = {
+        "reused": False,
+        "reason": None,
+        "start_url": None,
+        "fingerprint": None,
+        "reused_from": None,
+        "executed_at": None,
+        "time_saved_seconds": 0,
+    }
+    if max_age_seconds <= 0:
+        decision["reason"] = "disabled"
+        return decision
+
+    decision["start_url"] = extract_start_url(message.get('task'))
+    if not decision["start_url"]:
+        decision["reason"] = "no_start_url"
+        return decision
+    decision["fingerprint"] = get_url_fingerprint(decision["start_url"])
+    if not decision["fingerprint"]:
+        decision["reason"] = "fingerprint_failed"
+        return decision
+
+    if not previous_run:
+        decision["reason"] = "no_previous_run"
+        return decision
+
+    previous_decision = load_json_from_s3_key(f"test-runs/{previous_run['slug']}/reuse.json")
+    # A reused run is succeeded with a fresh updated_at, its age is that of the run that actually executed
+    if previous_decision and previous_decision.get('reused'):
+        if not previous_decision.get('executed_at'):
+            decision["reason"] = "previous_run_reused"
+            return decision
+        executed_at = datetime.fromisoformat(previous_decision['executed_at'])
+    else:
+        executed_at = previous_run['updated_at']
+
+    age_seconds = (datetime.now(timezone.utc) - executed_at).total_seconds()
+    if age_seconds > max_age_seconds:
+        decision["reason"] = "previous_run_too_old"
+        return decision
+
+    if not previous_decision or previous_decision.get('fingerprint') != decision["fingerprint"]:
+        decision["reason"] = "start_url_changed"
+        return decision
+
+    previous_index = load_run_index_from_s3(previous_run['slug'])
+    decision["reused"] = True
+    decision["reason"] = "unchanged"
+    decision["reused_from"] = previous_run['slug']
+    decision["executed_at"] = executed_at.isoformat()
+    decision["time_saved_seconds"] = previous_index.get('total_duration_seconds', 0) if previous_index else 0
+    return decision
+
+
+def save_reuse_decision(test_run_slug, decision):
+    """Record the reuse decision of a test run next to its artifacts"""
+    s3_client.put_object(
+        Bucket=S3_BUCKET_NAME,
+        Key=f"test-runs/{test_run_slug}/reuse.json",
+        Body=json.dumps(decision),
+        ContentType='application/json',
+    )
+
+
+def copy_reused_results(test_run_slug, decision):
+    """
+    Point a reused test run at the artifacts of the run it reuses by copying its result
+    documents server-side, screenshot and step keys keep referring to the original run
+    """
+    previous_slug = decision["reused_from"]
+    file_names = ["run.json", "index.json"]
+    try:
+        response = s3_client.list_objects_v2(Bucket=S3_BUCKET_NAME, Prefix=f"test-runs/{previous_slug}/steps/")
+        file_names += [item['Key'].split(f"test-runs/{previous_slug}/", 1)[1] for item in response.get('Contents', [])]
+    except Exception as e:
+        logger.warning(f"Could not list step chunks of test run {previous_slug}: {e}")
+
+    for file_name in file_names:
+        try:
+            s3_client.copy_object(
+                Bucket=S3_BUCKET_NAME,
+                CopySource={'Bucket': S3_BUCKET_NAME, 'Key': f"test-runs/{previous_slug}/{file_name}"},
+                Key=f"test-runs/{test_run_slug}/{file_name}",
+            )
+        except Exception as e:
+            logger.warning(f"Could not copy {file_name} from test run {previous_slug}: {e}")
@@ -0,0 +1,216 @@
+from boto3 import client
+from dotenv import load_dotenv
+import os
+import json
+import time
+import logging
+from db_operations import SchedulerDB
+
+load_dotenv()
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Config
+TASK_TYPE_WEIGHTS = json.loads(os.getenv('SCHEDULER_TASK_TYPE_WEIGHTS', '{"test-run": 4, "suite-run": 2, "website-analysis": 1}'))
+# Organizations default to weight 1, e.g. '{"acme": 2}'
+ORGANIZATION_WEIGHTS = json.loads(os.getenv('SCHEDULER_ORGANIZATION_WEIGHTS', '{}'))
+MAX_RUNNING_PER_ORGANIZATION = int(os.getenv('SCHEDULER_MAX_RUNNING_PER_ORGANIZATION', '5'))
+# Per organization caps, e.g. '{"acme": 20}'
+ORGANIZATION_MAX_RUNNING = json.loads(os.getenv('SCHEDULER_ORGANIZATION_MAX_RUNNING', '{}'))
+# Running messages older than this are no longer counted, their worker is presumed dead
+RUNNING_TTL_SECONDS = int(os.getenv('SCHEDULER_RUNNING_TTL_SECONDS', '7200'))
+# Candidates are hidden from other workers this long while one is picked
+PEEK_VISIBILITY_SECONDS = 30
+# Messages received from each queue per poll. SQS cannot peek, every receive counts towards a queue's
+# redrive maxReceiveCount, so only a few candidates are received to choose from
+CANDIDATES_PER_QUEUE = min(int(os.getenv('SCHEDULER_CANDIDATES_PER_QUEUE', '3')), 10)
+# Candidates of organizations at their cap are received again after this long, not right away,
+# so a capped organization's messages are not dead-lettered after maxReceiveCount quick polls
+CAPPED_RELEASE_SECONDS = int(os.getenv('SCHEDULER_CAPPED_RELEASE_SECONDS', '60'))
+PROCESSING_VISIBILITY_SECONDS = int(os.getenv('SCHEDULER_PROCESSING_VISIBILITY_SECONDS', '3600'))
+CLOUDWATCH_NAMESPACE = os.getenv('CLOUDWATCH_NAMESPACE')
+
+# Outcomes of Scheduler.run_once
+PROCESSED = 'processed'
+# The queues are empty
+EMPTY = 'empty'
+# Messages are queued, but every one belongs to an organization at its concurrency cap
+CAPPED = 'capped'
+
+
+def get_organization(message):
+    return message.get('organizationSlug') or message.get('organizationDomain') or 'unknown'
+
+
+class Scheduler:
+    """
+    Picks the next message from several SQS queues by weighted fair sharing: every
+    (organization, task type) flow is charged its processing time divided by its weight,
+    the candidate whose flow has been charged least runs next, and organizations at their
+    concurrency cap are skipped. Candidates that are not picked go back to their queue, right away
+    unless their organization is capped. A candidate on its queue's last receive before the
+    dead-letter queue runs next whatever its flow or cap, releasing it would dead-letter it.
+    """
+
+    def __init__(self, sqs, queues):
+        self.sqs = sqs
+        # [{"url": ..., "weight": ...}], a queue's weight multiplies the weight of its messages
+        self.queues = queues
+        self.db = SchedulerDB()
+        self.max_receive_counts = {queue['url']: self.get_max_receive_count(queue['url']) for queue in queues}
+
+    def get_max_receive_count(self, queue_url):
+        """The maxReceiveCount of the queue's redrive policy, None if it has none"""
+        try:
+            attributes = self.sqs.get_queue_attributes(QueueUrl=queue_url, AttributeNames=['RedrivePolicy'])['Attributes']
+        except Exception as e:
+            logger.warning(f"Could not read the redrive policy of {queue_url}: {e}")
+            return None
+        if 'RedrivePolicy' not in attributes:
+            return None
+        max_receive_count = int(json.loads(attributes['RedrivePolicy'])['maxReceiveCount'])
+        logger.info(f"{queue_url} dead-letters messages after {max_receive_count} receives, a message held back by its "
+                    f"organization's cap runs over the cap after about {max_receive_count * CAPPED_RELEASE_SECONDS}s")
+        return max_receive_count
+
+    def receive_candidates(self):
+        candidates = []
+        for queue in self.queues:
+            response = self.sqs.receive_message(
+                QueueUrl=queue['url'],
+                MaxNumberOfMessages=CANDIDATES_PER_QUEUE,
+                AttributeNames=['SentTimestamp', 'ApproximateReceiveCount'],
+                VisibilityTimeout=PEEK_VISIBILITY_SECONDS
+            )
+            for sqs_message in response.get('Messages', []):
+                try:
+                    message = json.loads(sqs_message['Body'])
+                except json.JSONDecodeError:
+                    message = {}
+                organization = get_organization(message)
+                task_type = message.get('taskType', 'unknown')
+                max_receive_count = self.max_receive_counts.get(queue['url'])
+                candidates.append({
+                    "queue_url": queue['url'],
+                    "sqs_message": sqs_message,
+                    "organization": organization,
+                    "task_type": task_type,
+                    "flow_key": f"{organization}:{task_type}",
+                    "weight": float(queue.get('weight', 1)) * float(ORGANIZATION_WEIGHTS.get(organization, 1)) * float(TASK_TYPE_WEIGHTS.get(task_type, 1)),
+                    "wait_seconds": time.time() - int(sqs_message['Attributes']['SentTimestamp']) / 1000,
+                    "last_receive": bool(max_receive_count) and int(sqs_message['Attributes'].get('ApproximateReceiveCount', 1)) >= max_receive_count,
+                    "capped": False,
+                })
+        return candidates
+
+    def pick(self, candidates):
+        """
+        Pick the candidate of the least-served flow whose organization is under its cap, oldest first on ties.
+        Candidates on their last receive come first, the others of capped organizations are marked `capped`.
+        """
+        flows = self.db.get_flows({candidate["flow_key"] for candidate in candidates})
+        running_counts = self.db.get_running_counts({candidate["organization"] for candidate in candidates}, RUNNING_TTL_SECONDS)
+        if flows is None or running_counts is None:
+            # Without the shared state the queue order is the fairest thing left
+            return max(candidates, key=lambda candidate: (candidate["last_receive"], candidate["wait_seconds"])), 0
+        virtual_times, floor = flows
+
+        for candidate in candidates:
+            cap = int(ORGANIZATION_MAX_RUNNING.get(candidate["organization"], MAX_RUNNING_PER_ORGANIZATION))
+            candidate["capped"] = running_counts.get(candidate["organization"], 0) >= cap
+
+        last_receives = [candidate for candidate in candidates if candidate["last_receive"]]
+        if last_receives:
+            chosen = max(last_receives, key=lambda candidate: candidate["wait_seconds"])
+            logger.warning(f"Message {chosen['sqs_message']['MessageId']} of {chosen['organization']} is on its last receive "
+                           f"before the dead-letter queue, running it ahead of its flow and cap")
+            return chosen, floor
+
+        eligible = [candidate for candidate in candidates if not candidate["capped"]]
+        if not eligible:
+            return None, floor
+        return min(
+            eligible,
+            key=lambda candidate: (max(virtual_times.get(candidate["flow_key"], floor), floor), -candidate["wait_seconds"])
+        ), floor
+
+    def release(self, candidates):
+        for candidate in candidates:
+            try:
+                self.sqs.change_message_visibility(
+                    QueueUrl=candidate["queue_url"],
+                    ReceiptHandle=candidate["sqs_message"]['ReceiptHandle'],
+                    VisibilityTimeout=CAPPED_RELEASE_SECONDS if candidate["capped"] else 0
+                )
+            except Exception as e:
+                logger.warning(f"Could not release message {candidate['sqs_message']['MessageId']}: {e}")
+
+    def report_queue_wait(self, candidate):
+        logger.info(f"Starting {candidate['task_type']} message of {candidate['organization']} "
+                    f"after {candidate['wait_seconds']:.1f}s in the queue")
+        if not CLOUDWATCH_NAMESPACE:
+            return
+        try:
+            client('cloudwatch', region_name=os.getenv('AWS_REGION', 'us-east-1')).put_metric_data(
+                Namespace=CLOUDWATCH_NAMESPACE,
+                MetricData=[{
+                    'MetricName': 'QueueWaitSeconds',
+                    'Dimensions': [
+                        {'Name': 'Organization', 'Value': candidate["organization"]},
+                        {'Name': 'TaskType', 'Value': candidate["task_type"]},
+                    ],
+                    'Value': candidate["wait_seconds"],
+                    'Unit': 'Seconds',
+                }]
+            )
+        except Exception as e:
+            logger.error(f"Error sending queue wait metric: {e}")
+
+    def run_once(self, process_message):
+        """
+        Receive candidates from every queue, process the one picked and delete it when it succeeds
+
+        Args:
+            process_message (Callable): Processes a message body, raises if processing failed
+
+        Returns:
+            str: PROCESSED if a message was processed (successfully or not), EMPTY if there was nothing
+                to run, CAPPED if only messages of organizations at their cap were queued
+        """
+        candidates = self.receive_candidates()
+        if not candidates:
+            return EMPTY
+
+        chosen, floor = self.pick(candidates)
+        self.release([candidate for candidate in candidates if candidate is not chosen])
+        if not chosen:
+            logger.info(f"All {len(candidates)} queued messages belong to organizations at their concurrency cap")
+            return CAPPED
+
+        sqs_message = chosen["sqs_message"]
+        self.sqs.change_message_visibility(
+            QueueUrl=chosen["queue_url"],
+            ReceiptHandle=sqs_message['ReceiptHandle'],
+            VisibilityTimeout=PROCESSING_VISIBILITY_SECONDS
+        )
+        self.db.start_message(sqs_message['MessageId'], chosen["organization"], chosen["flow_key"], chosen["wait_seconds"])
+        # Not held open while the message runs, which can take longer than an idle connection lives
+        self.db.disconnect()
+        self.report_queue_wait(chosen)
+
+        start_time = time.time()
+        try:
+            process_message(sqs_message['Body'])
+            self.sqs.delete_message(QueueUrl=chosen["queue_url"], ReceiptHandle=sqs_message['ReceiptHandle'])
+            logger.info(f"Message {sqs_message['MessageId']} deleted from queue (marked as Done)")
+        except Exception as e:
+            logger.error(f"Error processing message {sqs_message['MessageId']}: {e}")
+        finally:
+            db = SchedulerDB()
+            try:
+                db.finish_message(sqs_message['MessageId'], chosen["flow_key"], (time.time() - start_time) / chosen["weight"], floor)
+            finally:
+                db.disconnect()
+        return PROCESSED
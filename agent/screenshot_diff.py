@@ -0,0 +1,122 @@
+from dotenv import load_dotenv
+from PIL import Image
+import numpy as np
+import io
+import os
+
+load_dotenv()
+
+# Config
+# A pixel changed when one of its channels moved more than this, which absorbs anti-aliasing and compression noise
+PIXEL_TOLERANCE = int(os.getenv('VISUAL_DIFF_PIXEL_TOLERANCE', '24'))
+# A step changed when more than this fraction of its unmasked pixels changed
+CHANGED_THRESHOLD = float(os.getenv('VISUAL_DIFF_CHANGED_THRESHOLD', '0.01'))
+HASH_SIZE = 8
+HEATMAP_MAX_WIDTH = 640
+
+
+def get_dct_matrix(size):
+    """Orthonormal DCT-II matrix, so a 2D DCT is `D @ image @ D.T`"""
+    n = np.arange(size)
+    matrix = np.cos(np.pi * (2 * n[None, :] + 1) * n[:, None] / (2 * size)) * np.sqrt(2 / size)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+DCT_MATRIX = get_dct_matrix(HASH_SIZE * 4)
+
+
+def get_perceptual_hash(image):
+    """64-bit pHash: the signs of the lowest DCT frequencies of a 32x32 grayscale thumbnail against their median"""
+    # reducing_gap shrinks the screenshot in cheap integer steps before the final LANCZOS pass
+    thumbnail = image.convert('L').resize((HASH_SIZE * 4, HASH_SIZE * 4), Image.Resampling.LANCZOS, reducing_gap=2.0)
+    pixels = np.asarray(thumbnail, dtype=np.float64)
+    frequencies = (DCT_MATRIX @ pixels @ DCT_MATRIX.T)[:HASH_SIZE, :HASH_SIZE].flatten()
+    return frequencies[1:] > np.median(frequencies[1:])
+
+
+def get_ignore_mask(shape, masks):
+    """Boolean mask of the pixels inside the ignored rectangles, e.g. clocks, ads or carousels"""
+    ignore = np.zeros(shape, dtype=bool)
+    for mask in masks or []:
+        x, y = max(0, int(mask['x'])), max(0, int(mask['y']))
+        ignore[y:y + int(mask['height']), x:x + int(mask['width'])] = True
+    return ignore
+
+
+def get_changed_pixels(current, baseline):
+    """Pixels where a channel moved more than PIXEL_TOLERANCE, on uint8 arrays without widening them"""
+    difference = np.maximum(current, baseline)
+    difference -= np.minimum(current, baseline)
+    # Channel by channel, a reduction over the 3-wide channel axis is several times slower
+    changed = difference[:, :, 0] > PIXEL_TOLERANCE
+    changed |= difference[:, :, 1] > PIXEL_TOLERANCE
+    changed |= difference[:, :, 2] > PIXEL_TOLERANCE
+    return changed
+
+
+def shrink_mask(mask, size):
+    """Resize a boolean mask to the heatmap size, a pixel stays set if any pixel it covers was set"""
+    mask_image = Image.fromarray(mask.view(np.uint8) * np.uint8(255))
+    if mask_image.size != size:
+        mask_image = mask_image.resize(size, Image.Resampling.BOX).point(lambda value: 255 if value else 0)
+    return mask_image
+
+
+def draw_heatmap(baseline_image, changed, ignore):
+    """Dimmed grayscale baseline with the changed pixels in red, drawn at its saved size instead of full size"""
+    height, width = changed.shape
+    scale = min(1, HEATMAP_MAX_WIDTH / width)
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    gray = baseline_image.crop((0, 0, width, height)).convert('L')
+    if gray.size != size:
+        gray = gray.resize(size, Image.Resampling.BOX)
+    dimmed = gray.point(lambda value: round(value * 0.4 + 153 * 0.6))
+    heatmap = Image.merge('RGB', (dimmed, dimmed, dimmed))
+    heatmap.paste((255, 0, 0), mask=shrink_mask(changed, size))
+    if ignore.any():
+        heatmap = Image.composite(heatmap.point(lambda value: value // 2), heatmap, shrink_mask(ignore, size))
+    heatmap_buffer = io.BytesIO()
+    heatmap.save(heatmap_buffer, format='PNG', compress_level=1)
+    return heatmap_buffer.getvalue()
+
+
+def diff_screenshots(job):
+    """
+    Compare one screenshot with its baseline. NumPy and PIL release the GIL for the heavy parts,
+    so several steps are compared at once on threads of the worker process
+
+    Args:
+        job (dict): `step`, `baseline_step`, `current` and `baseline` PNG bytes and the ignore `masks`
+
+    Returns:
+        dict: The diff scores of the step and the `heatmap` PNG bytes
+    """
+    current_image = Image.open(io.BytesIO(job["current"])).convert('RGB')
+    baseline_image = Image.open(io.BytesIO(job["baseline"])).convert('RGB')
+    current = np.asarray(current_image)
+    baseline = np.asarray(baseline_image)
+
+    # Pixels outside the overlap of differently sized screenshots all count as changed
+    height = min(current.shape[0], baseline.shape[0])
+    width = min(current.shape[1], baseline.shape[1])
+    changed = get_changed_pixels(current[:height, :width], baseline[:height, :width])
+    ignore = get_ignore_mask((height, width), job["masks"])
+    changed &= ~ignore
+    total_area = max(current.shape[0], baseline.shape[0]) * max(current.shape[1], baseline.shape[1])
+    outside_overlap = total_area - height * width
+    compared_pixels = total_area - int(ignore.sum())
+    changed_pixels = int(np.count_nonzero(changed)) + outside_overlap
+
+    hash_distance = int(np.count_nonzero(get_perceptual_hash(current_image) != get_perceptual_hash(baseline_image)))
+
+    changed_ratio = changed_pixels / compared_pixels if compared_pixels else 0
+    return {
+        "step": job["step"],
+        "baseline_step": job["baseline_step"],
+        "changed_ratio": changed_ratio,
+        "changed": changed_ratio > CHANGED_THRESHOLD,
+        "hash_distance": hash_distance,
+        "size_changed": current.shape != baseline.shape,
+        "heatmap": draw_heatmap(baseline_image, changed, ignore),
+    }
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Browser Execution Profile Benchmark for FlowTester
+
+This script compares the headed browser on an Xvfb display (the current worker setup)
+against headless mode, with and without the low-resource Chromium flags, on a local
+fixture site. Every run replays the same agent-like steps without an LLM: navigate to a
+page, then capture the DOM state and screenshot the agent would send to the model.
+
+For each profile it reports the median over runs of:
+- CPU seconds used by the browser processes (and, for headed profiles, Xvfb when this script starts it)
+- Peak RSS of those processes, summed (shared pages are counted once per process)
+- Median and p95 step latency
+
+Usage:
+    python scripts/benchmark_browser_modes.py [--runs 3] [--steps 20]
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import psutil
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from browser_use import Browser
+from browser_profile import get_browser_options
+
+PROFILES = [
+    ("headed (Xvfb)", "headed", False),
+    ("headed (Xvfb), low-resource", "headed", True),
+    ("headless", "headless", False),
+    ("headless, low-resource", "headless", True),
+]
+FIXTURE_PAGES = 5
+XVFB_DISPLAY = ":98"
+
+
+def write_fixture_site(directory):
+    """Write a small multi-page site with forms, tables, images and animation, linked like a shop checkout"""
+    for page in range(FIXTURE_PAGES):
+        rows = "\n".join(
+            f"<tr><td>Item {page}-{row}</td><td><input name='qty-{row}' value='1'></td><td><button>Add</button></td></tr>"
+            for row in range(60)
+        )
+        images = "\n".join(
+            f"<img width='120' height='80' alt='Product {image}' src=\"data:image/svg+xml;utf8,"
+            f"<svg xmlns='http://www.w3.org/2000/svg' width='120' height='80'><rect width='120' height='80' fill='%23{(page * 40 + image * 13) % 999:03d}'/></svg>\">"
+            for image in range(24)
+        )
+        with open(os.path.join(directory, f"page-{page}.html"), "w") as file:
+            file.write(f"""<!DOCTYPE html>
+<html>
+<head>
+<title>Fixture page {page}</title>
+<style>
+  body {{ font-family: sans-serif; margin: 24px; }}
+  .spinner {{ width: 24px; height: 24px; border: 4px solid #ccc; border-top-color: #333; border-radius: 50%; animation: spin 1s linear infinite; }}
+  @keyframes spin {{ to {{ transform: rotate(360deg); }} }}
+  table {{ border-collapse: collapse; }} td {{ border: 1px solid #ddd; padding: 4px; }}
+</style>
+</head>
+<body>
+<nav>{" ".join(f"<a href='page-{link}.html'>Page {link}</a>" for link in range(FIXTURE_PAGES))}</nav>
+<h1>Fixture page {page}</h1>
+<div class="spinner"></div>
+<form>
+  <label>Email <input type="email" name="email"></label>
+  <label>Password <input type="password" name="password"></label>
+  <select name="country"><option>Germany</option><option>France</option><option>Spain</option></select>
+  <button type="submit">Sign in</button>
+</form>
+<div>{images}</div>
+<table>{rows}</table>
+<script>
+  setInterval(() => {{ document.title = 'Fixture page {page} ' + new Date().toISOString(); }}, 500);
+</script>
+</body>
+</html>""")
+
+
+class QuietRequestHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_fixture_site(directory):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(QuietRequestHandler, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def get_process_tree():
+    return psutil.Process(os.getpid()).children(recursive=True)
+
+
+def get_cpu_seconds(processes):
+    total = 0
+    for process in processes:
+        try:
+            cpu_times = process.cpu_times()
+            total += cpu_times.user + cpu_times.system
+        except psutil.NoSuchProcess:
+            pass
+    return total
+
+
+def get_rss_bytes(processes):
+    total = 0
+    for process in processes:
+        try:
+            total += process.memory_info().rss
+        except psutil.NoSuchProcess:
+            pass
+    return total
+
+
+async def run_profile(mode, low_resource, base_url, steps):
+    """Run the fixture steps once with a profile and measure the browser processes"""
+    browser = Browser(**get_browser_options(mode, low_resource), user_data_dir=None, keep_alive=True, enable_default_extensions=False)
+    await browser.start()
+    try:
+        # Processes that exit during the run take their CPU time with them, so the tree is re-read each step
+        processes = {process.pid: process for process in get_process_tree()}
+        cpu_at_start = get_cpu_seconds(processes.values())
+        peak_rss = 0
+        latencies = []
+        for step in range(steps):
+            start = time.perf_counter()
+            await browser.navigate_to(f"{base_url}/page-{step % FIXTURE_PAGES}.html")
+            await browser.get_browser_state_summary(include_screenshot=True)
+            latencies.append(time.perf_counter() - start)
+
+            for process in get_process_tree():
+                processes.setdefault(process.pid, process)
+            peak_rss = max(peak_rss, get_rss_bytes(processes.values()))
+        cpu_seconds = get_cpu_seconds(processes.values()) - cpu_at_start
+    finally:
+        await browser.kill()
+
+    latencies.sort()
+    return {
+        "cpu_seconds": cpu_seconds,
+        "peak_rss_mb": peak_rss / (1024 * 1024),
+        "median_step_seconds": statistics.median(latencies),
+        "p95_step_seconds": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+    }
+
+
+def start_xvfb():
+    """Start a virtual display like scripts/startup.sh, so it is measured as part of the headed profiles"""
+    if not shutil.which("Xvfb"):
+        return None
+    xvfb = subprocess.Popen(["Xvfb", XVFB_DISPLAY, "-screen", "0", "1280x800x24"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    os.environ["DISPLAY"] = XVFB_DISPLAY
+    time.sleep(1)
+    return xvfb
+
+
+def stop_xvfb(xvfb):
+    if xvfb:
+        xvfb.terminate()
+        xvfb.wait()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark headed and headless browser profiles")
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--steps', type=int, default=20)
+    args = parser.parse_args()
+
+    fixture_dir = tempfile.mkdtemp(prefix='fixture-site-')
+    write_fixture_site(fixture_dir)
+    server, base_url = serve_fixture_site(fixture_dir)
+
+    if not shutil.which("Xvfb"):
+        print("Xvfb not found, headed profiles use the current display and its cost is not measured")
+
+    results = []
+    xvfb = None
+    try:
+        for label, mode, low_resource in PROFILES:
+            # Only the headed profiles run with Xvfb, it would otherwise be counted in the headless process tree
+            if mode == "headed":
+                xvfb = start_xvfb()
+            if mode == "headed" and not os.environ.get("DISPLAY"):
+                print(f"Skipping {label}: no display")
+                continue
+            try:
+                runs = [await run_profile(mode, low_resource, base_url, args.steps) for _ in range(args.runs)]
+            finally:
+                stop_xvfb(xvfb)
+                xvfb = None
+            results.append((label, {key: statistics.median(run[key] for run in runs) for key in runs[0]}))
+    finally:
+        server.shutdown()
+        stop_xvfb(xvfb)
+        shutil.rmtree(fixture_dir, ignore_errors=True)
+
+    print(f"\n{args.runs} runs of {args.steps} steps per profile, medians")
+    print("-" * 86)
+    print(f"{'Profile':30} {'CPU seconds':>12} {'Peak RSS MB':>12} {'Step p50 s':>12} {'Step p95 s':>12}")
+    for label, result in results:
+        print(f"{label:30} {result['cpu_seconds']:12.2f} {result['peak_rss_mb']:12.0f} "
+              f"{result['median_step_seconds']:12.3f} {result['p95_step_seconds']:12.3f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""
+Queue Load Generator for FlowTester
+
+This script replays a JSONL log of queue messages (`taskType`, `task`, `modelProvider`,
+`modelSlug`, slugs, ...) as load, to size the worker fleet before a traffic spike. Each line
+is a message, or `{"timestamp": ..., "message": {...}}`; a message's own `sentAt` or
+`timestamp` is used when there is no wrapper. Timestamps are ISO 8601 or epoch seconds.
+
+Arrivals follow either a fixed rate (`--rate`, evenly spaced or Poisson) cycling through the
+log, or the log's own timestamps compressed by `--speedup`. Every replayed message gets
+slugs unique to the load test, so its artifacts do not overwrite the recorded run's.
+
+Real workers only run a test run they can claim, which needs a pending `tests_runs` row.
+`--seed-runs` inserts one per replayed test run before sending, on the version of its message
+or of the recorded run (e.g. the runs of `scripts/db_fixture.py seed`); without it, real-worker
+loads of test runs are refused rather than skipped by every worker.
+
+Targets:
+- local: an in-memory queue served by `--workers` worker processes, each running one message
+  like a real worker; `--fake-worker` sleeps a log-normal service time instead, to size the
+  fleet without browsers or models
+- sqs:   the real queue, observed through the scheduler's running messages in the database,
+  so the fleet's workers must be consuming it
+
+`--fake-llm` sends the messages to the `fake` model provider, which needs ALLOW_FAKE_LLM=true
+on the workers, so real browsers run without paying for the model.
+
+Reports queue wait, end-to-end latency and worker saturation (busy workers / workers).
+
+Usage:
+    python scripts/load_generator.py messages.jsonl --rate 2 --count 200 --workers 8 --fake-worker
+    python scripts/load_generator.py messages.jsonl --speedup 60 --target sqs --queue-url https://... --fleet-size 20 --fake-llm --seed-runs
+"""
+
+import argparse
+import copy
+import json
+import multiprocessing
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from boto3 import client
+from dotenv import load_dotenv
+from claim_check import encode_message_body
+from db_operations import SchedulerDB, create_pending_test_runs
+from fake_llm import sample_latency
+from scheduler import RUNNING_TTL_SECONDS
+
+load_dotenv()
+
+REGION = 'us-west-2'
+SLUG_FIELDS = ['testRunSlug', 'analysisSlug', 'suiteRunSlug', 'setupTestRunSlug']
+
+
+def parse_timestamp(value):
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        # Epoch milliseconds, e.g. SQS SentTimestamp
+        return value / 1000 if value > 1e11 else float(value)
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+
+
+def load_messages(path):
+    """Read the log as a list of (timestamp or None, message)"""
+    entries = []
+    with open(path) as file:
+        for line in file:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if isinstance(entry.get('message'), dict):
+                entries.append((parse_timestamp(entry.get('timestamp')), entry['message']))
+            else:
+                entries.append((parse_timestamp(entry.get('sentAt') or entry.get('timestamp')), entry))
+    return entries
+
+
+def get_schedule(entries, args):
+    """Arrival offsets in seconds from the start, with the message sent at each"""
+    if args.speedup:
+        timed = sorted(((timestamp, message) for timestamp, message in entries if timestamp is not None), key=lambda entry: entry[0])
+        if not timed:
+            raise SystemExit("--speedup needs timestamps in the log")
+        first = timed[0][0]
+        return [((timestamp - first) / args.speedup, message) for timestamp, message in timed]
+
+    schedule = []
+    offset = 0
+    for index in range(args.count or len(entries)):
+        schedule.append((offset, entries[index % len(entries)][1]))
+        offset += random.expovariate(args.rate) if args.arrival == 'poisson' else 1 / args.rate
+    return schedule
+
+
+def prepare_message(message, load_id, index, fake_llm):
+    message = copy.deepcopy(message)
+    message.pop('sentAt', None)
+    message.pop('timestamp', None)
+    for test_message in [message] + message.get('tests', []):
+        for field in SLUG_FIELDS:
+            if test_message.get(field):
+                test_message[field] = f"{test_message[field]}-load-{load_id}-{index}"
+        if fake_llm:
+            test_message.pop('backupModels', None)
+            if 'modelProvider' in test_message:
+                test_message['modelProvider'] = 'fake'
+    return message
+
+
+def get_test_runs(message, prepared):
+    """The test runs a prepared message claims, with the recorded run and the version and model to create them with"""
+    test_runs = []
+    for recorded, test_message in zip([message] + message.get('tests', []), [prepared] + prepared.get('tests', [])):
+        if test_message.get('testRunSlug'):
+            test_runs.append({
+                "slug": test_message['testRunSlug'],
+                "source_slug": recorded['testRunSlug'],
+                "version_slug": test_message.get('testVersionSlug'),
+                # Suite tests run on the suite's model
+                "model_slug": test_message.get('modelSlug') or prepared.get('modelSlug'),
+                "model_provider": test_message.get('modelProvider') or prepared.get('modelProvider'),
+            })
+    return test_runs
+
+
+def seed_test_runs(test_runs):
+    """Create the pending test runs of the load, refusing to start when some could not be created"""
+    created = create_pending_test_runs(test_runs)
+    if created is None:
+        raise SystemExit("Could not create the pending test runs, see the database error above")
+    missing = sorted({test_run["slug"] for test_run in test_runs} - set(created))
+    if missing:
+        raise SystemExit(f"{len(missing)} test runs have no version to create them on, e.g. {missing[0]}: "
+                         f"their messages need a testVersionSlug or a recorded testRunSlug that exists in the database")
+    print(f"Created {len(created)} pending test runs")
+
+
+def percentile(values, quantile):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * quantile))] if values else float('nan')
+
+
+def run_message(body):
+    """Run one message in a worker process, imported there so the generator does not load the agent"""
+    from consumer import process_tracked_message
+    process_tracked_message(body)
+
+
+class LocalTarget:
+    """In-memory queue served by a fixed number of workers"""
+
+    def __init__(self, workers, fake_worker, service_seconds, service_p95_seconds):
+        self.workers = workers
+        self.fake_worker = fake_worker
+        self.service_seconds = service_seconds
+        self.service_p95_seconds = service_p95_seconds
+        self.queue = queue.Queue()
+        self.jobs = []
+        self.busy = 0
+        self.lock = threading.Lock()
+        # A fresh process per message, like a worker instance that exits after its job
+        self.pool = None if fake_worker else multiprocessing.get_context('spawn').Pool(workers, maxtasksperchild=1)
+        self.threads = [threading.Thread(target=self.serve, daemon=True) for _ in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def send(self, message):
+        self.queue.put((time.time(), message))
+
+    def serve(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            sent_at, message = item
+            job = {"sent_at": sent_at, "started_at": time.time(), "task_type": message.get('taskType')}
+            with self.lock:
+                self.busy += 1
+            try:
+                if self.fake_worker:
+                    time.sleep(sample_latency(self.service_seconds, self.service_p95_seconds))
+                else:
+                    self.pool.apply(run_message, (json.dumps(message),))
+                job["succeeded"] = True
+            except Exception as e:
+                print(f"Message failed: {e}")
+                job["succeeded"] = False
+            finally:
+                job["finished_at"] = time.time()
+                with self.lock:
+                    self.busy -= 1
+                    self.jobs.append(job)
+                self.queue.task_done()
+
+    def sample(self):
+        with self.lock:
+            return self.busy, self.queue.qsize()
+
+    def drain(self, timeout):
+        deadline = time.time() + timeout
+        while time.time() < deadline and self.queue.unfinished_tasks:
+            time.sleep(0.5)
+        for _ in self.threads:
+            self.queue.put(None)
+        if self.pool:
+            self.pool.terminate()
+
+
+class SQSTarget:
+    """The real queue, followed through the scheduler's running messages"""
+
+    def __init__(self, queue_url, fleet_size, poll_seconds):
+        self.sqs = client('sqs', region_name=REGION)
+        self.queue_url = queue_url
+        self.workers = fleet_size
+        self.poll_seconds = poll_seconds
+        self.db = SchedulerDB()
+        self.sent = {}
+        self.jobs = []
+        self.running = {}
+        self.lock = threading.Lock()
+
+    def send(self, message):
+        sent_at = time.time()
+        response = self.sqs.send_message(QueueUrl=self.queue_url, MessageBody=encode_message_body(message))
+        with self.lock:
+            self.sent[response['MessageId']] = {"sent_at": sent_at, "task_type": message.get('taskType')}
+
+    def poll(self):
+        """Track our messages through the running set: appearing is a start, disappearing a finish"""
+        running = self.db.get_running_messages(RUNNING_TTL_SECONDS)
+        if running is None:
+            return None
+        now = time.time()
+        with self.lock:
+            for message_id, started_at in running.items():
+                if message_id in self.sent and message_id not in self.running:
+                    self.running[message_id] = started_at.timestamp()
+            for message_id in [message_id for message_id in self.running if message_id not in running]:
+                job = self.sent.pop(message_id)
+                # Finishes are seen at poll resolution, starts come from the database
+                self.jobs.append({**job, "started_at": self.running.pop(message_id), "finished_at": now, "succeeded": None})
+        return len(running)
+
+    def sample(self):
+        busy = self.poll()
+        attributes = self.sqs.get_queue_attributes(QueueUrl=self.queue_url, AttributeNames=['ApproximateNumberOfMessages'])
+        return busy or 0, int(attributes['Attributes']['ApproximateNumberOfMessages'])
+
+    def drain(self, timeout):
+        deadline = time.time() + timeout
+        # The sampler keeps polling the running set while this waits
+        while time.time() < deadline and self.sent:
+            time.sleep(self.poll_seconds)
+        if self.sent:
+            print(f"{len(self.sent)} messages were not seen finishing, including any that started and finished between polls")
+        self.db.disconnect()
+
+
+def sample_saturation(target, samples, stop_event, interval):
+    while not stop_event.wait(interval):
+        try:
+            busy, queued = target.sample()
+        except Exception as e:
+            print(f"Could not sample the target: {e}")
+            continue
+        samples.append({"at": time.time(), "busy": busy, "queued": queued})
+
+
+def get_report(target, samples, started_at, sent_count):
+    jobs = target.jobs
+    queue_waits = [job["started_at"] - job["sent_at"] for job in jobs]
+    latencies = [job["finished_at"] - job["sent_at"] for job in jobs]
+    duration = (max(job["finished_at"] for job in jobs) if jobs else time.time()) - started_at
+    saturations = [min(sample["busy"] / target.workers, 1) for sample in samples]
+    return {
+        "sent": sent_count,
+        "completed": len(jobs),
+        "failed": sum(1 for job in jobs if job["succeeded"] is False),
+        "duration_seconds": duration,
+        "throughput_per_minute": len(jobs) / duration * 60 if duration > 0 else 0,
+        "queue_wait_seconds": {name: percentile(queue_waits, quantile) for name, quantile in [("p50", 0.5), ("p95", 0.95), ("p99", 0.99), ("max", 1)]},
+        "end_to_end_seconds": {name: percentile(latencies, quantile) for name, quantile in [("p50", 0.5), ("p95", 0.95), ("p99", 0.99), ("max", 1)]},
+        "workers": target.workers,
+        "mean_saturation": sum(saturations) / len(saturations) if saturations else None,
+        # Share of the run every worker was busy, messages arriving then had to queue
+        "saturated_share": sum(1 for saturation in saturations if saturation >= 1) / len(saturations) if saturations else None,
+        "max_queued": max((sample["queued"] for sample in samples), default=0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded queue messages as load and measure queue wait, latency and saturation")
+    parser.add_argument('log', help="JSONL file of queue messages")
+    arrivals = parser.add_mutually_exclusive_group(required=True)
+    arrivals.add_argument('--rate', type=float, help="Messages per second, cycling through the log")
+    arrivals.add_argument('--speedup', type=float, help="Replay the log's timestamps this many times faster")
+    parser.add_argument('--arrival', choices=['poisson', 'uniform'], default='poisson', help="Spacing of --rate arrivals")
+    parser.add_argument('--count', type=int, help="Messages to send with --rate, defaults to the log's length")
+    parser.add_argument('--target', choices=['local', 'sqs'], default='local')
+    parser.add_argument('--workers', type=int, default=4, help="Local workers")
+    parser.add_argument('--fake-worker', action='store_true', help="Local workers sleep instead of running the browser and model")
+    parser.add_argument('--service-seconds', type=float, default=90, help="Median fake worker service time")
+    parser.add_argument('--service-p95-seconds', type=float, default=240, help="95th percentile fake worker service time")
+    parser.add_argument('--fake-llm', action='store_true', help="Use the fake model provider, workers need ALLOW_FAKE_LLM=true")
+    parser.add_argument('--seed-runs', action='store_true', help="Insert a pending tests_runs row for every replayed test run, real workers skip test runs without one")
+    parser.add_argument('--queue-url', help="Queue to send to with --target sqs")
+    parser.add_argument('--fleet-size', type=int, help="Workers consuming the queue with --target sqs, for saturation")
+    parser.add_argument('--poll-seconds', type=float, default=1)
+    parser.add_argument('--drain-timeout', type=float, default=3600, help="Seconds to wait for the last messages to finish")
+    parser.add_argument('--seed', type=int, help="Random seed for Poisson arrivals and fake service times")
+    parser.add_argument('--json', help="Also write the report to this file")
+    args = parser.parse_args()
+
+    if args.target == 'sqs' and not (args.queue_url and args.fleet_size):
+        parser.error("--target sqs needs --queue-url and --fleet-size")
+    if args.fake_worker and args.target != 'local':
+        parser.error("--fake-worker only applies to --target local")
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    schedule = get_schedule(load_messages(args.log), args)
+    if not schedule:
+        raise SystemExit(f"No messages in {args.log}")
+    load_id = time.strftime('%Y%m%d%H%M%S')
+    schedule = [(offset, message, prepare_message(message, load_id, index, args.fake_llm)) for index, (offset, message) in enumerate(schedule)]
+    test_runs = [test_run for _, message, prepared in schedule for test_run in get_test_runs(message, prepared)]
+    if test_runs and not args.fake_worker:
+        if not args.seed_runs:
+            parser.error(f"{len(test_runs)} replayed test runs have no tests_runs row, workers would skip every one of them: pass --seed-runs")
+        seed_test_runs(test_runs)
+    if args.target == 'local':
+        target = LocalTarget(args.workers, args.fake_worker, args.service_seconds, args.service_p95_seconds)
+    else:
+        target = SQSTarget(args.queue_url, args.fleet_size, args.poll_seconds)
+    print(f"Sending {len(schedule)} messages over {schedule[-1][0]:.0f}s to {args.target} with {target.workers} workers")
+
+    samples = []
+    stop_event = threading.Event()
+    sampler = threading.Thread(target=sample_saturation, args=(target, samples, stop_event, args.poll_seconds), daemon=True)
+    started_at = time.time()
+    sampler.start()
+    for offset, _, prepared in schedule:
+        delay = started_at + offset - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        target.send(prepared)
+    print(f"Sent {len(schedule)} messages in {time.time() - started_at:.0f}s, waiting for them to finish")
+    target.drain(args.drain_timeout)
+    stop_event.set()
+    sampler.join()
+
+    report = get_report(target, samples, started_at, len(schedule))
+    print(f"\n{report['completed']}/{report['sent']} messages completed in {report['duration_seconds']:.0f}s "
+          f"({report['throughput_per_minute']:.1f}/min), {report['failed']} failed")
+    print("-" * 64)
+    print(f"{'':18} {'p50 s':>10} {'p95 s':>10} {'p99 s':>10} {'max s':>10}")
+    for label, name in [("Queue wait", "queue_wait_seconds"), ("End-to-end", "end_to_end_seconds")]:
+        print(f"{label:18} " + " ".join(f"{report[name][key]:10.1f}" for key in ["p50", "p95", "p99", "max"]))
+    if report["mean_saturation"] is not None:
+        print(f"\nWorkers: {report['workers']}, mean saturation {report['mean_saturation']:.0%}, "
+              f"all busy {report['saturated_share']:.0%} of the time, up to {report['max_queued']} messages queued")
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump({"args": vars(args), **report}, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
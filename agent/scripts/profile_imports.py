@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Worker Import-Time Profile for FlowTester
+
+This script imports the worker entry point (`consumer` by default) in a fresh
+interpreter with `python -X importtime` and reports where the startup time goes:
+the slowest imports by cumulative time and the total self time per top-level package.
+Provider SDKs and the agent modules load on first use, so they should not show up here
+unless a module imports them eagerly again.
+
+Usage:
+    python scripts/profile_imports.py [--module consumer] [--top 25]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+AGENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def profile_imports(module):
+    """
+    Import a module in a fresh interpreter and parse its import times
+
+    Returns:
+        tuple: (wall-clock seconds, [(module, self_us, cumulative_us)])
+    """
+    start_time = time.time()
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=AGENT_DIR,
+        capture_output=True,
+        text=True
+    )
+    wall_seconds = time.time() - start_time
+    if completed.returncode != 0:
+        print(completed.stderr)
+        raise SystemExit(f"Importing {module} failed")
+
+    imports = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        imports.append((name.strip(), int(self_us), int(cumulative_us)))
+    return wall_seconds, imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile the import time of the worker")
+    parser.add_argument('--module', default='consumer')
+    parser.add_argument('--top', type=int, default=25)
+    args = parser.parse_args()
+
+    wall_seconds, imports = profile_imports(args.module)
+
+    packages = {}
+    for name, self_us, _ in imports:
+        package = name.split('.')[0]
+        packages[package] = packages.get(package, 0) + self_us
+
+    print(f"\nImporting {args.module} took {wall_seconds:.2f}s wall-clock ({len(imports)} modules)")
+    print("-" * 70)
+    print(f"{'Slowest imports':50} {'Cumulative s':>12}")
+    for name, _, cumulative_us in sorted(imports, key=lambda item: item[2], reverse=True)[:args.top]:
+        print(f"{name:50} {cumulative_us / 1e6:12.3f}")
+
+    print("-" * 70)
+    print(f"{'Top-level package':50} {'Self s':>12}")
+    for package, self_us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"{package:50} {self_us / 1e6:12.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Run History Analytics for FlowTester
+
+This script answers "which tests are flaky and which got slower" from the run history.
+It reads the finished runs from `tests_runs` and each run's small artifacts
+(`index.json`, `budget.json`, `reuse.json`) from S3 concurrently, keeps them as
+columnar NumPy arrays, and computes per test (or per version) over a time window:
+- pass rate and flip rate (how often a result differs from the previous run's)
+- p50/p95 duration, and the p50 change against the window before it
+- mean steps and token cost
+
+Runs are cached in an .npz file, so a re-run only downloads the runs finished since
+the last one. Runs that reused the results of another run are left out.
+
+Usage:
+    python scripts/run_analytics.py [--days 7] [--by test|version] [--sort flip_rate] [--json report.json]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from boto3 import client
+from dotenv import load_dotenv
+from db_operations import get_finished_test_runs
+
+load_dotenv()
+
+AGENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+S3_BUCKET_NAME = os.getenv('S3_BUCKET_NAME', 'flow-tester')
+DEFAULT_CACHE_PATH = os.path.join(AGENT_DIR, 'analytics-cache', 'runs.npz')
+# Runs are re-read when they finished this close to the last sync, a status can land after the sync's query
+SYNC_OVERLAP = timedelta(hours=1)
+
+s3_client = client(
+    's3',
+    aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+    aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+    region_name=os.getenv('AWS_REGION', 'us-east-1')
+)
+
+COLUMNS = {
+    "run_id": np.int64,
+    "test_slug": str,
+    "version_slug": str,
+    "passed": bool,
+    "created_at": np.float64,
+    "duration_seconds": np.float64,
+    "steps": np.float64,
+    "tokens": np.float64,
+    "cost": np.float64,
+}
+
+
+def load_cache(cache_path):
+    if not os.path.exists(cache_path):
+        return {name: np.array([], dtype=dtype) for name, dtype in COLUMNS.items()}, None
+    with np.load(cache_path) as cache:
+        columns = {name: cache[name] for name in COLUMNS}
+        synced_at = datetime.fromtimestamp(float(cache["synced_at"]), timezone.utc)
+    return columns, synced_at
+
+
+def save_cache(cache_path, columns, synced_at):
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    # np.savez appends .npz to names without it, write to a name that already has it
+    temporary_path = f"{cache_path}.tmp.npz"
+    np.savez(temporary_path, synced_at=synced_at.timestamp(), **columns)
+    os.replace(temporary_path, cache_path)
+
+
+def get_json(key):
+    try:
+        return json.loads(s3_client.get_object(Bucket=S3_BUCKET_NAME, Key=key)['Body'].read())
+    except Exception:
+        return None
+
+
+def load_run_artifacts(run):
+    """Read the duration, steps and usage of a run from its artifacts, None if it reused another run"""
+    reuse = get_json(f"test-runs/{run['slug']}/reuse.json")
+    if reuse and reuse.get("reused"):
+        return None
+    index = get_json(f"test-runs/{run['slug']}/index.json")
+    budget = get_json(f"test-runs/{run['slug']}/budget.json")
+    usage = (budget or {}).get("usage")
+    if index is None or usage is None:
+        # Runs saved before the index and budget reports only have the full run document
+        run_data = get_json(f"test-runs/{run['slug']}/run.json") or {}
+        index = index or {
+            "total_duration_seconds": run_data.get("total_duration_seconds"),
+            "number_of_steps": len(run_data.get("screenshots") or []) or None,
+        }
+        run_usage = run_data.get("usage") or {}
+        usage = usage or {"tokens": run_usage.get("total_tokens"), "cost": run_usage.get("total_cost")}
+    return {
+        "run_id": run["id"],
+        "test_slug": run["test_slug"],
+        "version_slug": run["version_slug"],
+        "passed": run["status"] == "succeeded",
+        "created_at": run["created_at"].timestamp(),
+        "duration_seconds": index.get("total_duration_seconds"),
+        "steps": index.get("number_of_steps"),
+        "tokens": usage.get("tokens"),
+        "cost": usage.get("cost"),
+    }
+
+
+def sync_runs(cache_path, workers):
+    """Add the runs finished since the last sync to the cache and return every cached run"""
+    columns, synced_at = load_cache(cache_path)
+    sync_started_at = datetime.now(timezone.utc)
+
+    runs = get_finished_test_runs(synced_at - SYNC_OVERLAP if synced_at else None)
+    if runs is None:
+        raise SystemExit("Could not read the test runs from the database")
+    seen_ids = set(columns["run_id"].tolist())
+    new_runs = [run for run in runs if run["id"] not in seen_ids]
+
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        rows = [row for row in executor.map(load_run_artifacts, new_runs) if row]
+    print(f"Synced {len(new_runs)} new runs ({len(new_runs) - len(rows)} reused) in {time.time() - start_time:.1f}s, "
+          f"{len(columns['run_id']) + len(rows)} runs cached")
+
+    if rows:
+        columns = {
+            name: np.concatenate([
+                columns[name],
+                np.array([np.nan if row[name] is None else row[name] for row in rows], dtype=dtype)
+            ])
+            for name, dtype in COLUMNS.items()
+        }
+    save_cache(cache_path, columns, sync_started_at)
+    return columns
+
+
+def get_group_percentiles(groups, values, number_of_groups, quantiles):
+    """
+    Percentiles of `values` per group with linear interpolation, in one sort instead of a loop per group
+
+    Returns:
+        np.ndarray: (number_of_groups, len(quantiles)), NaN for groups without values
+    """
+    valid = ~np.isnan(values)
+    groups, values = groups[valid], values[valid]
+    order = np.lexsort((values, groups))
+    groups, values = groups[order], values[order]
+
+    counts = np.bincount(groups, minlength=number_of_groups)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    percentiles = np.full((number_of_groups, len(quantiles)), np.nan)
+    has_values = counts > 0
+    for column, quantile in enumerate(quantiles):
+        position = starts[has_values] + quantile * (counts[has_values] - 1)
+        lower = np.floor(position).astype(np.int64)
+        upper = np.ceil(position).astype(np.int64)
+        percentiles[has_values, column] = values[lower] + (values[upper] - values[lower]) * (position - lower)
+    return percentiles
+
+
+def get_group_means(groups, values, number_of_groups):
+    valid = ~np.isnan(values)
+    sums = np.bincount(groups[valid], weights=values[valid], minlength=number_of_groups)
+    counts = np.bincount(groups[valid], minlength=number_of_groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return sums / counts
+
+
+def compute_metrics(columns, group_by, window_start, previous_window_start):
+    in_window = columns["created_at"] >= window_start
+    in_previous_window = (columns["created_at"] >= previous_window_start) & ~in_window
+
+    keys = columns[f"{group_by}_slug"]
+    names, groups = np.unique(keys, return_inverse=True)
+    number_of_groups = len(names)
+
+    window_groups = groups[in_window]
+    runs = np.bincount(window_groups, minlength=number_of_groups)
+    passes = np.bincount(window_groups, weights=columns["passed"][in_window], minlength=number_of_groups)
+
+    # A flip is a run whose result differs from the previous run of the same group
+    order = np.lexsort((columns["created_at"][in_window], window_groups))
+    ordered_groups = window_groups[order]
+    ordered_passed = columns["passed"][in_window][order]
+    is_flip = (ordered_groups[1:] == ordered_groups[:-1]) & (ordered_passed[1:] != ordered_passed[:-1])
+    flips = np.bincount(ordered_groups[1:][is_flip], minlength=number_of_groups)
+
+    durations = get_group_percentiles(window_groups, columns["duration_seconds"][in_window], number_of_groups, (0.5, 0.95))
+    previous_durations = get_group_percentiles(groups[in_previous_window], columns["duration_seconds"][in_previous_window], number_of_groups, (0.5,))
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        metrics = {
+            "runs": runs,
+            "pass_rate": passes / runs,
+            "flip_rate": flips / np.maximum(runs - 1, 1),
+            "p50_duration_seconds": durations[:, 0],
+            "p95_duration_seconds": durations[:, 1],
+            "p50_change": durations[:, 0] / previous_durations[:, 0] - 1,
+            "mean_steps": get_group_means(window_groups, columns["steps"][in_window], number_of_groups),
+            "mean_tokens": get_group_means(window_groups, columns["tokens"][in_window], number_of_groups),
+            "mean_cost": get_group_means(window_groups, columns["cost"][in_window], number_of_groups),
+        }
+    has_runs = runs > 0
+    return names[has_runs], {name: values[has_runs] for name, values in metrics.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Flakiness and latency analytics over the run history")
+    parser.add_argument('--days', type=float, default=7, help="Window to report on, compared with the window before it")
+    parser.add_argument('--by', choices=['test', 'version'], default='test')
+    parser.add_argument('--sort', default='flip_rate', choices=['runs', 'pass_rate', 'flip_rate', 'p50_duration_seconds', 'p95_duration_seconds', 'p50_change', 'mean_cost'])
+    parser.add_argument('--top', type=int, default=30)
+    parser.add_argument('--cache', default=DEFAULT_CACHE_PATH)
+    parser.add_argument('--workers', type=int, default=32)
+    parser.add_argument('--json', help="Also write every group's metrics to this file")
+    args = parser.parse_args()
+
+    columns = sync_runs(args.cache, args.workers)
+    now = time.time()
+    names, metrics = compute_metrics(columns, args.by, now - args.days * 86400, now - 2 * args.days * 86400)
+
+    order = np.argsort(np.nan_to_num(metrics[args.sort], nan=-np.inf))[::-1]
+    print(f"\n{len(names)} {args.by}s with runs in the last {args.days:g} days, by {args.sort}")
+    print("-" * 118)
+    print(f"{args.by.capitalize():36} {'Runs':>5} {'Pass':>6} {'Flip':>6} {'p50 s':>8} {'p95 s':>8} {'p50 Δ':>7} {'Steps':>6} {'Tokens':>9} {'Cost $':>8}")
+    for index in order[:args.top]:
+        print(f"{names[index][:36]:36} {metrics['runs'][index]:5d} {metrics['pass_rate'][index]:6.0%} {metrics['flip_rate'][index]:6.0%} "
+              f"{metrics['p50_duration_seconds'][index]:8.1f} {metrics['p95_duration_seconds'][index]:8.1f} {metrics['p50_change'][index]:+7.0%} "
+              f"{metrics['mean_steps'][index]:6.1f} {metrics['mean_tokens'][index]:9.0f} {metrics['mean_cost'][index]:8.3f}")
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump([
+                {args.by: str(names[index]), **{name: (None if np.isnan(values[index]) else float(values[index])) for name, values in metrics.items()}}
+                for index in order
+            ], file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,20 @@
 #!/bin/bash
 
-Xvfb :99 -screen 0 1280x800x24 &
-export DISPLAY=:99
+# Headless workers need no virtual display
+BROWSER_MODE=${BROWSER_MODE:-$(grep -s '^BROWSER_MODE=' ~/flow-tester/agent/.env | cut -d= -f2)}
+if [ "$BROWSER_MODE" != "headless" ]; then
+    Xvfb :99 -screen 0 1280x800x24 &
+    export DISPLAY=:99
+fi
 
 cd ~/flow-tester/agent
 git pull origin main
 
-~/flow-tester/agent/.venv/bin/python ~/flow-tester/agent/consumer.py
+# With WORKER_PROCESSES set, the supervisor runs that many workers to use every core
+WORKER_PROCESSES=${WORKER_PROCESSES:-$(grep -s '^WORKER_PROCESSES=' ~/flow-tester/agent/.env | cut -d= -f2)}
+if [ -n "$WORKER_PROCESSES" ]; then
+    ~/flow-tester/agent/.venv/bin/python ~/flow-tester/agent/supervisor.py
+else
+    ~/flow-tester/agent/.venv/bin/python ~/flow-tester/agent/consumer.py
+fi
 sudo shutdown -h now
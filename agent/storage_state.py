@@ -0,0 +1,134 @@
+from boto3 import client
+from dotenv import load_dotenv
+from datetime import datetime, timezone, timedelta
+import os
+import re
+import json
+import logging
+
+load_dotenv()
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Config
+S3_BUCKET_NAME = os.getenv('S3_BUCKET_NAME', 'flow-tester')
+STORAGE_STATE_TTL_SECONDS = int(os.getenv('STORAGE_STATE_TTL_SECONDS', '86400'))
+# A run from the snapshot whose first page matches this was sent to log in, the snapshot's session has expired
+LOGIN_URL_PATTERN = re.compile(os.getenv('LOGIN_URL_PATTERN', r'log-?in|sign-?in|/auth'), re.IGNORECASE)
+
+# Initialize S3 client
+s3_client = client(
+    's3',
+    aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+    aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+    region_name=os.getenv('AWS_REGION', 'us-east-1')
+)
+
+
+def get_storage_state_key(organization_slug, project_slug):
+    return f"projects/{organization_slug}/{project_slug}/storage-state.json"
+
+
+def load_project_storage_state(organization_slug, project_slug):
+    """
+    Load the authenticated storage state snapshot of a project from S3
+
+    Args:
+        organization_slug (str): The slug identifier of the organization
+        project_slug (str): The slug identifier of the project
+
+    Returns:
+        dict or None: The storage state (cookies and origins) if found and not expired, None otherwise
+    """
+    try:
+        response = s3_client.get_object(
+            Bucket=S3_BUCKET_NAME,
+            Key=get_storage_state_key(organization_slug, project_slug)
+        )
+        snapshot = json.loads(response['Body'].read().decode('utf-8'))
+
+        if datetime.fromisoformat(snapshot['expires_at']) <= datetime.now(timezone.utc):
+            logger.info(f"Storage state snapshot of project {project_slug} has expired")
+            return None
+
+        logger.info(f"Loaded storage state snapshot of project {project_slug} captured at {snapshot['captured_at']}")
+        return snapshot['storage_state']
+
+    except s3_client.exceptions.NoSuchKey:
+        return None
+    except Exception as e:
+        logger.error(f"Error loading storage state snapshot of project {project_slug}: {e}")
+        return None
+
+
+def save_project_storage_state(organization_slug, project_slug, storage_state, ttl_seconds=STORAGE_STATE_TTL_SECONDS):
+    """
+    Save the authenticated storage state snapshot of a project to S3 with an expiry
+
+    Args:
+        organization_slug (str): The slug identifier of the organization
+        project_slug (str): The slug identifier of the project
+        storage_state (dict): The cookies and origins captured from the browser
+        ttl_seconds (int): How long the snapshot can be used
+    """
+    captured_at = datetime.now(timezone.utc)
+    snapshot = {
+        "captured_at": captured_at.isoformat(),
+        "expires_at": (captured_at + timedelta(seconds=ttl_seconds)).isoformat(),
+        "storage_state": storage_state,
+    }
+    try:
+        s3_client.put_object(
+            Bucket=S3_BUCKET_NAME,
+            Key=get_storage_state_key(organization_slug, project_slug),
+            Body=json.dumps(snapshot),
+            ContentType='application/json',
+        )
+        logger.info(f"Saved storage state snapshot of project {project_slug} "
+                    f"({len(storage_state.get('cookies', []))} cookies, {len(storage_state.get('origins', []))} origins)")
+    except Exception as e:
+        logger.error(f"Error saving storage state snapshot of project {project_slug}: {e}")
+
+
+def delete_project_storage_state(organization_slug, project_slug):
+    """Delete the storage state snapshot of a project, so no other run starts from an expired session"""
+    try:
+        s3_client.delete_object(
+            Bucket=S3_BUCKET_NAME,
+            Key=get_storage_state_key(organization_slug, project_slug)
+        )
+        logger.info(f"Deleted storage state snapshot of project {project_slug}")
+    except Exception as e:
+        logger.error(f"Error deleting storage state snapshot of project {project_slug}: {e}")
+
+
+class LoggedOutDetector:
+    """
+    Checks the first page a 'use' run lands on. A login page there means the run is logged out: the
+    snapshot it started from no longer holds a session, or there was none. The snapshot is deleted
+    right away and the run goes on to log in from its description, a run that then succeeds refreshes
+    the snapshot. Only the first page counts, a test that logs out later leaves the snapshot alone.
+    """
+
+    def __init__(self, organization_slug, project_slug, had_snapshot):
+        self.organization_slug = organization_slug
+        self.project_slug = project_slug
+        self.had_snapshot = had_snapshot
+        self.first_url = None
+        self.logged_out = False
+
+    async def on_step_end(self, agent):
+        if self.first_url is not None:
+            return
+        # The replay of a resumed run and a blank start page have no URL to go by yet
+        urls = [url for url in agent.history.urls() if url and not url.startswith('about:')]
+        if not urls:
+            return
+        self.first_url = urls[0]
+        if LOGIN_URL_PATTERN.search(self.first_url):
+            self.logged_out = True
+            logger.warning(f"Run of project {self.project_slug} started logged out on {self.first_url}")
+            if self.had_snapshot:
+                delete_project_storage_state(self.organization_slug, self.project_slug)
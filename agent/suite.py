@@ -0,0 +1,173 @@
+from browser_use.browser.events import SaveStorageStateEvent
+from dotenv import load_dotenv
+import os
+import time
+import shutil
+import asyncio
+import logging
+import tempfile
+from agent import processTask, createBrowser
+from warmup import wait_for_prewarmed_browser
+from db_operations import get_latest_successful_runs_by_versions
+
+load_dotenv()
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Config
+SUITE_MAX_CONCURRENCY = int(os.getenv('SUITE_MAX_CONCURRENCY', '3'))
+
+
+def getTestMessage(suite_message, test):
+    """
+    Build the `test-run` message of one test in a suite, inheriting the suite's model and slugs
+
+    Args:
+        suite_message (dict): The `suite-run` message
+        test (dict): One entry of the suite's `tests`
+
+    Returns:
+        dict: The message to pass to `processTask`
+    """
+    return {
+        "taskType": "test-run",
+        "projectSlug": suite_message.get('projectSlug'),
+        "organizationSlug": suite_message.get('organizationSlug'),
+        "modelProvider": suite_message['modelProvider'],
+        "modelSlug": suite_message['modelSlug'],
+        **test,
+    }
+
+
+async def runSetupTest(test_message, storage_state_path, on_test_finished):
+    """
+    Run the suite's setup test and capture its cookies and localStorage
+
+    Args:
+        test_message (dict): The `test-run` message of the setup test
+        storage_state_path (str): Where to save the captured storage state
+        on_test_finished (Callable): Sync callback `(test_message, result)` reporting the test
+
+    Returns:
+        dict: The suite report entry of the setup test
+    """
+    start_time = time.time()
+    # Kept alive so the storage state can still be read after the agent finishes
+    setup_browser = createBrowser(storage_state=storage_state_path, user_data_dir=None, keep_alive=True)
+    try:
+        result = await processTask(test_message, task_browser=setup_browser)
+        await setup_browser.event_bus.dispatch(SaveStorageStateEvent(path=storage_state_path))
+        is_failed = await asyncio.to_thread(on_test_finished, test_message, result)
+        return {"testRunSlug": test_message['testRunSlug'], "failed": is_failed, "duration_seconds": time.time() - start_time}
+    finally:
+        await setup_browser.kill()
+
+
+async def runSuiteTest(test_message, storage_state_path, semaphore, on_test_finished, on_test_error, on_test_started=None):
+    """
+    Run one test of a suite in its own browser, starting from the shared storage state if there is one
+
+    Args:
+        test_message (dict): The `test-run` message of the test
+        storage_state_path (str): The storage state captured by the setup test, if any
+        semaphore (asyncio.Semaphore): Bounds how many browsers run at the same time
+        on_test_finished (Callable): Sync callback `(test_message, result)` reporting the test
+        on_test_error (Callable): Sync callback `(test_message, error)` reporting a test that raised
+        on_test_started (Callable): Sync callback `(test_message)` run when the test gets its browser,
+            returns False if the test must not run
+
+    Returns:
+        dict: The suite report entry of the test
+    """
+    async with semaphore:
+        start_time = time.time()
+        if on_test_started and not await asyncio.to_thread(on_test_started, test_message):
+            return {"testRunSlug": test_message['testRunSlug'], "failed": False, "skipped": True, "duration_seconds": 0}
+        browser_options = {"user_data_dir": None}
+        if storage_state_path and os.path.exists(storage_state_path):
+            # Every browser writes cookie changes back to its storage_state file, so each gets a copy
+            test_storage_state_path = f"{storage_state_path}.{test_message['testRunSlug']}.json"
+            shutil.copyfile(storage_state_path, test_storage_state_path)
+            browser_options["storage_state"] = test_storage_state_path
+
+        try:
+            result = await processTask(test_message, task_browser=createBrowser(**browser_options))
+            is_failed = await asyncio.to_thread(on_test_finished, test_message, result)
+        except Exception as e:
+            logger.error(f"Suite test {test_message['testRunSlug']} failed with error: {e}")
+            await asyncio.to_thread(on_test_error, test_message, e)
+            is_failed = True
+
+        return {"testRunSlug": test_message['testRunSlug'], "failed": is_failed, "duration_seconds": time.time() - start_time}
+
+
+async def processSuite(message, on_test_finished, on_test_error, on_test_started=None):
+    """
+    Run all tests of a `suite-run` message on this worker, concurrently in separate browsers.
+    The test marked `setup` (or `setupTestRunSlug`) runs first and the cookies and
+    localStorage it ends with are loaded into the browsers of every other test.
+
+    browser_use sessions have no browser context of their own, sessions attached to one Chromium
+    share its cookies and tabs, so each test gets its own browser process to stay isolated.
+
+    Args:
+        message (dict): The `suite-run` message
+        on_test_finished (Callable): Sync callback `(test_message, result, baseline_run)` saving and
+            reporting a finished test, returns True if the test failed
+        on_test_error (Callable): Sync callback `(test_message, error)` reporting a test that raised
+        on_test_started (Callable): Sync callback `(test_message)` run when a test other than the setup
+            test starts, e.g. to refresh its status, returns False if the test must not run
+
+    Returns:
+        dict: Suite report with every test's status and duration and the suite wall-clock time
+    """
+    start_time = time.time()
+    test_messages = [getTestMessage(message, test) for test in message['tests']]
+    setup_slug = message.get('setupTestRunSlug') or next((test['testRunSlug'] for test in message['tests'] if test.get('setup')), None)
+    setup_message = next((test for test in test_messages if test['testRunSlug'] == setup_slug), None)
+    other_messages = [test for test in test_messages if test is not setup_message]
+
+    # One query for the baselines of every test, instead of one connection and lookup per test
+    version_slugs = [test['testVersionSlug'] for test in test_messages if test.get('testVersionSlug')]
+    baseline_runs = await asyncio.to_thread(get_latest_successful_runs_by_versions, version_slugs) or {}
+
+    def report_test(test_message, result):
+        return on_test_finished(test_message, result, baseline_runs.get(test_message.get('testVersionSlug')))
+
+    # Before the first browser is created, creating one does not wait for the pre-warmed browser
+    await wait_for_prewarmed_browser()
+    semaphore = asyncio.Semaphore(int(message.get('maxConcurrency') or SUITE_MAX_CONCURRENCY))
+    state_dir = tempfile.mkdtemp(prefix='suite-')
+    storage_state_path = None
+    reports = []
+    try:
+        if setup_message:
+            storage_state_path = os.path.join(state_dir, 'storage_state.json')
+            try:
+                reports.append(await runSetupTest(setup_message, storage_state_path, report_test))
+            except Exception as e:
+                logger.error(f"Suite setup test {setup_slug} failed with error: {e}")
+                await asyncio.to_thread(on_test_error, setup_message, e)
+                reports.append({"testRunSlug": setup_slug, "failed": True, "duration_seconds": time.time() - start_time})
+            if reports[0]["failed"]:
+                # The other tests still run, they just have to log in by themselves
+                logger.warning(f"Suite setup test {setup_slug} failed, running the suite without shared storage state")
+                storage_state_path = None
+
+        reports += await asyncio.gather(*[
+            runSuiteTest(test_message, storage_state_path, semaphore, report_test, on_test_error, on_test_started)
+            for test_message in other_messages
+        ])
+    finally:
+        shutil.rmtree(state_dir, ignore_errors=True)
+
+    return {
+        "suiteRunSlug": message.get('suiteRunSlug'),
+        "setupTestRunSlug": setup_slug,
+        "tests": reports,
+        "failed_tests": sum(1 for report in reports if report["failed"]),
+        "wall_clock_seconds": time.time() - start_time,
+        "sum_test_seconds": sum(report["duration_seconds"] for report in reports),
+    }
@@ -0,0 +1,182 @@
+from boto3 import client
+from dotenv import load_dotenv
+import os
+import sys
+import time
+import queue
+import signal
+import logging
+import multiprocessing
+
+load_dotenv()
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Config
+# Worker processes on this instance, each with its own event loop, browser and interpreter lock; 0 uses one per core
+WORKER_PROCESSES = int(os.getenv('WORKER_PROCESSES', '0')) or os.cpu_count()
+# How long workers get to finish their message after SIGTERM before they are killed
+WORKER_DRAIN_TIMEOUT_SECONDS = int(os.getenv('WORKER_DRAIN_TIMEOUT_SECONDS', '3600'))
+# Exit once every worker found the queues empty, so the instance can shut down, instead of polling again
+SUPERVISOR_EXIT_WHEN_IDLE = os.getenv('SUPERVISOR_EXIT_WHEN_IDLE', 'true').lower() == 'true'
+WORKER_IDLE_BACKOFF_SECONDS = float(os.getenv('WORKER_IDLE_BACKOFF_SECONDS', '20'))
+# Crashed workers restart after 1s, doubling per consecutive crash up to this
+WORKER_CRASH_BACKOFF_MAX_SECONDS = float(os.getenv('WORKER_CRASH_BACKOFF_MAX_SECONDS', '60'))
+SUPERVISOR_METRICS_SECONDS = int(os.getenv('SUPERVISOR_METRICS_SECONDS', '60'))
+CLOUDWATCH_NAMESPACE = os.getenv('CLOUDWATCH_NAMESPACE')
+# Exit code of a worker that found the queues empty. Workers whose queued messages all belong to
+# organizations at their cap keep polling instead, so they never count as idle
+IDLE_EXIT_CODE = 3
+
+
+def run_worker(index, events):
+    """Worker process: run the consumer, reporting every message to the supervisor"""
+    # Ctrl-C reaches the whole process group, the supervisor decides how its workers stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Imported in the worker so each process loads the agent, and its clients, for itself
+    import consumer
+    signal.signal(signal.SIGTERM, lambda signum, frame: consumer.draining.set())
+
+    processed = consumer.worker(on_job_finished=lambda duration, succeeded: events.put({
+        "worker": index,
+        "duration_seconds": duration,
+        "succeeded": succeeded,
+    }))
+    sys.exit(0 if processed else IDLE_EXIT_CODE)
+
+
+class Supervisor:
+    """
+    Runs WORKER_PROCESSES consumer processes so jobs use every core instead of one
+    interpreter's, restarts workers that exit or crash, drains them on SIGTERM and
+    aggregates their job metrics
+    """
+
+    def __init__(self, processes=WORKER_PROCESSES):
+        self.processes = processes
+        # Spawned rather than forked, the parent's SDK clients and threads must not be shared
+        self.context = multiprocessing.get_context('spawn')
+        self.events = self.context.Queue()
+        self.workers = {}
+        self.restart_at = {}
+        self.consecutive_crashes = {}
+        self.idle = set()
+        self.drain_started_at = None
+        self.reset_metrics()
+
+    def reset_metrics(self):
+        self.metrics_started_at = time.time()
+        self.metrics = {"jobs": 0, "failed_jobs": 0, "busy_seconds": 0.0, "restarts": 0, "crashes": 0}
+
+    def start_worker(self, index):
+        process = self.context.Process(target=run_worker, args=(index, self.events), name=f"worker-{index}")
+        process.start()
+        self.workers[index] = process
+        self.restart_at.pop(index, None)
+
+    def drain(self, signum=None, frame=None):
+        if self.drain_started_at is not None:
+            return
+        logger.info(f"Draining {len(self.workers)} workers, they finish their current message and exit")
+        self.drain_started_at = time.time()
+        self.restart_at.clear()
+        for process in self.workers.values():
+            if process.is_alive():
+                process.terminate()
+
+    def collect_events(self, timeout):
+        try:
+            event = self.events.get(timeout=timeout)
+            while True:
+                self.metrics["jobs"] += 1
+                self.metrics["failed_jobs"] += 0 if event["succeeded"] else 1
+                self.metrics["busy_seconds"] += event["duration_seconds"]
+                self.consecutive_crashes[event["worker"]] = 0
+                event = self.events.get_nowait()
+        except queue.Empty:
+            pass
+
+    def reap_workers(self):
+        for index, process in list(self.workers.items()):
+            if process.is_alive():
+                continue
+            process.join()
+            del self.workers[index]
+            if process.exitcode == IDLE_EXIT_CODE:
+                self.idle.add(index)
+                delay = WORKER_IDLE_BACKOFF_SECONDS
+            elif process.exitcode == 0:
+                self.idle.discard(index)
+                delay = 0
+            else:
+                self.idle.discard(index)
+                self.metrics["crashes"] += 1
+                self.consecutive_crashes[index] = self.consecutive_crashes.get(index, 0) + 1
+                delay = min(2 ** (self.consecutive_crashes[index] - 1), WORKER_CRASH_BACKOFF_MAX_SECONDS)
+                logger.warning(f"Worker {index} exited with code {process.exitcode}, restarting in {delay:.0f}s")
+            if self.drain_started_at is None:
+                self.restart_at[index] = time.time() + delay
+
+    def restart_workers(self):
+        now = time.time()
+        for index, restart_at in list(self.restart_at.items()):
+            if restart_at <= now:
+                self.metrics["restarts"] += 1
+                self.start_worker(index)
+
+    def report_metrics(self, force=False):
+        elapsed = time.time() - self.metrics_started_at
+        if not force and elapsed < SUPERVISOR_METRICS_SECONDS:
+            return
+        utilization = min(self.metrics["busy_seconds"] / (elapsed * self.processes), 1) if elapsed > 0 else 0
+        logger.info(f"Last {elapsed:.0f}s: {self.metrics['jobs']} jobs ({self.metrics['failed_jobs']} failed), "
+                    f"{utilization:.0%} of {self.processes} workers busy, {self.metrics['restarts']} restarts, "
+                    f"{self.metrics['crashes']} crashes")
+        if CLOUDWATCH_NAMESPACE:
+            try:
+                client('cloudwatch', region_name=os.getenv('AWS_REGION', 'us-east-1')).put_metric_data(
+                    Namespace=CLOUDWATCH_NAMESPACE,
+                    MetricData=[
+                        {'MetricName': 'WorkerJobs', 'Value': self.metrics["jobs"], 'Unit': 'Count'},
+                        {'MetricName': 'WorkerFailedJobs', 'Value': self.metrics["failed_jobs"], 'Unit': 'Count'},
+                        {'MetricName': 'WorkerCrashes', 'Value': self.metrics["crashes"], 'Unit': 'Count'},
+                        {'MetricName': 'WorkerUtilization', 'Value': utilization * 100, 'Unit': 'Percent'},
+                        {'MetricName': 'WorkerProcesses', 'Value': len(self.workers), 'Unit': 'Count'},
+                    ]
+                )
+            except Exception as e:
+                logger.error(f"Error sending supervisor metrics: {e}")
+        self.reset_metrics()
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.drain)
+        signal.signal(signal.SIGINT, self.drain)
+        logger.info(f"Starting {self.processes} worker processes")
+        for index in range(self.processes):
+            self.start_worker(index)
+
+        while True:
+            self.collect_events(timeout=1)
+            self.reap_workers()
+            if self.drain_started_at is not None:
+                if not self.workers:
+                    break
+                if time.time() - self.drain_started_at > WORKER_DRAIN_TIMEOUT_SECONDS:
+                    logger.warning(f"Killing {len(self.workers)} workers still running after {WORKER_DRAIN_TIMEOUT_SECONDS}s")
+                    for process in self.workers.values():
+                        process.kill()
+            elif SUPERVISOR_EXIT_WHEN_IDLE and not self.workers and len(self.idle) == self.processes:
+                logger.info("Every worker found the queues empty, exiting")
+                break
+            else:
+                self.restart_workers()
+            self.report_metrics()
+
+        self.collect_events(timeout=0)
+        self.report_metrics(force=True)
+
+
+if __name__ == "__main__":
+    Supervisor().run()
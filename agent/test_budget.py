@@ -0,0 +1,66 @@
+import asyncio
+from types import SimpleNamespace
+
+import budget
+import db_operations
+from budget import RunBudget
+
+
+class HungAgent:
+    """An agent whose step never ends, like one waiting on a hung LLM call"""
+
+    def __init__(self):
+        self.stopped = False
+        self.state = SimpleNamespace(n_steps=3)
+        self.history = SimpleNamespace(is_done=lambda: False)
+
+    async def run(self, max_steps, **run_options):
+        await asyncio.sleep(60)
+
+    def stop(self):
+        self.stopped = True
+
+
+def test_run_stops_then_cancels_a_step_that_outlives_the_wall_clock_budget(monkeypatch):
+    monkeypatch.setattr(budget, "RUN_STOP_GRACE_SECONDS", 0.05)
+    run_budget = RunBudget({"maxSteps": 10, "maxSeconds": 0.05})
+    agent = HungAgent()
+
+    result = asyncio.run(run_budget.run(agent))
+
+    assert result is agent.history
+    assert agent.stopped
+    assert run_budget.get_failure_reason() == "budget_exceeded:max_seconds"
+
+
+def test_find_exceeded_budget_reports_the_first_limit_reached():
+    run_budget = RunBudget({"maxSteps": 10, "maxSeconds": 60, "maxTokens": 5000, "maxCost": 0.5})
+
+    run_budget.usage = {"steps": 3, "seconds": 20, "tokens": 4000, "cost": 0.1}
+    assert run_budget.find_exceeded_budget() is None
+
+    run_budget.usage = {"steps": 3, "seconds": 20, "tokens": 5000, "cost": 0.6}
+    assert run_budget.find_exceeded_budget() == "max_tokens"
+
+    run_budget.usage = {"steps": 10, "seconds": 61, "tokens": 5000, "cost": 0.6}
+    assert run_budget.find_exceeded_budget() == "max_steps"
+
+
+def test_find_exceeded_budget_ignores_unset_limits():
+    run_budget = RunBudget({"maxCost": 0.5})
+    run_budget.usage = {"steps": 500, "seconds": 3600, "tokens": 10 ** 7, "cost": 0.49}
+
+    assert run_budget.find_exceeded_budget() is None
+
+
+def test_analysis_report_records_the_failure_reason_on_the_analysis(monkeypatch):
+    recorded = []
+    monkeypatch.setattr(db_operations.AnalysisDB, "update_analysis_failure_reason", lambda self, slug, reason: recorded.append((slug, reason)) or True)
+    monkeypatch.setattr(db_operations, "DB_URL", "postgresql://localhost/test")
+    monkeypatch.setattr(budget, "s3_client", SimpleNamespace(put_object=lambda **kwargs: None))
+    run_budget = RunBudget({"maxSteps": 2})
+    run_budget.exceeded = "max_steps"
+
+    run_budget.save_analysis_report("analysis-1")
+
+    assert recorded == [("analysis-1", "budget_exceeded:max_steps")]
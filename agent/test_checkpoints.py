@@ -0,0 +1,61 @@
+from checkpoints import build_checkpoint
+from agent import prepareInitialActions
+
+
+class FakeHistory:
+    """
+    The parts of browser_use's AgentHistoryList a checkpoint reads, one list of actions and a URL per step
+    """
+
+    def __init__(self, steps):
+        self.steps = steps
+
+    def model_actions(self):
+        return [{**action, "interacted_element": None} for actions, url in self.steps for action in actions]
+
+    def number_of_steps(self):
+        return len(self.steps)
+
+    def urls(self):
+        return [url for actions, url in self.steps]
+
+
+def click(index):
+    return {"click_element_by_index": {"index": index}}
+
+
+def resume(checkpoint, new_steps):
+    """
+    Run the history of a run resumed from `checkpoint`: the replay as its first step, then `new_steps`
+    """
+    initial_actions = prepareInitialActions(checkpoint["model_actions"])
+    replayed_actions_count = (len(initial_actions) + 1) // 2
+    history = FakeHistory([(initial_actions, checkpoint["urls"][-1])] + new_steps)
+    return build_checkpoint(history, resumed_from=checkpoint, replayed_actions_count=replayed_actions_count)
+
+
+def test_build_checkpoint_drops_interacted_elements():
+    checkpoint = build_checkpoint(FakeHistory([([click(1)], "https://a.test/"), ([click(2)], "https://a.test/2")]))
+
+    assert checkpoint == {
+        "number_of_steps": 2,
+        "model_actions": [click(1), click(2)],
+        "urls": ["https://a.test/", "https://a.test/2"],
+    }
+
+
+def test_build_checkpoint_resumed_twice_keeps_original_actions_and_steps():
+    first = build_checkpoint(FakeHistory([
+        ([click(1)], "https://a.test/"),
+        ([click(2), click(3)], "https://a.test/2"),
+        ([click(4)], "https://a.test/3"),
+    ]))
+    second = resume(first, [([click(5)], "https://a.test/4"), ([click(6)], "https://a.test/5")])
+    third = resume(second, [([click(7)], "https://a.test/6")])
+
+    assert second["number_of_steps"] == 5
+    assert second["model_actions"] == [click(i) for i in range(1, 7)]
+    assert third["number_of_steps"] == 6
+    assert third["model_actions"] == [click(i) for i in range(1, 8)]
+    assert third["urls"][-1] == "https://a.test/6"
+    assert not any("wait" in action for action in third["model_actions"])
@@ -0,0 +1,56 @@
+import io
+import json
+
+import claim_check
+from claim_check import encode_message_body, decode_message_body, ROUTING_FIELDS
+
+
+class FakeS3:
+    """Objects kept in memory by key"""
+
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[Key] = Body
+
+    def get_object(self, Bucket, Key):
+        return {'Body': io.BytesIO(self.objects[Key])}
+
+
+def make_message(task_size):
+    return {
+        "taskType": "test-run",
+        "testRunSlug": "run-1",
+        "organizationSlug": "acme",
+        "projectSlug": "shop",
+        "task": "x" * task_size,
+    }
+
+
+def test_small_message_is_sent_inline(monkeypatch):
+    s3 = FakeS3()
+    monkeypatch.setattr(claim_check, "s3_client", s3)
+    message = make_message(100)
+
+    body = encode_message_body(message, inline_max_bytes=1024)
+
+    assert json.loads(body) == message
+    assert s3.objects == {}
+    assert decode_message_body(body) == body
+
+
+def test_large_message_round_trips_through_a_claim_check_with_routing_fields_inline(monkeypatch):
+    s3 = FakeS3()
+    monkeypatch.setattr(claim_check, "s3_client", s3)
+    message = make_message(10000)
+
+    body = encode_message_body(message, inline_max_bytes=1024)
+    claim = json.loads(body)
+
+    assert len(body) < 1024
+    assert {field: claim[field] for field in ROUTING_FIELDS if field in claim} == {field: message[field] for field in ROUTING_FIELDS if field in message}
+    assert "task" not in claim
+    assert claim["claimCheck"]["key"] in s3.objects
+    assert claim["claimCheck"]["size"] == len(json.dumps(message))
+    assert json.loads(decode_message_body(body)) == message
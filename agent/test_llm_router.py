@@ -0,0 +1,152 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from browser_use.llm.exceptions import ModelProviderError
+from browser_use.llm.views import ChatInvokeCompletion, ChatInvokeUsage
+from browser_use.tokens.service import TokenCost
+
+import llm_router
+from llm_router import CircuitBreaker, HedgedChatModel
+from prompt_cache import PromptCacheRecorder
+
+
+class ScriptedChatModel:
+    """Chat model that answers after `delay_seconds`, or raises `error`"""
+
+    def __init__(self, provider, model, delay_seconds=0, error=None, prompt_tokens=100, cached_tokens=0):
+        self.provider = provider
+        self.model = model
+        self.delay_seconds = delay_seconds
+        self.error = error
+        self.prompt_tokens = prompt_tokens
+        self.cached_tokens = cached_tokens
+        self.calls = 0
+
+    async def ainvoke(self, messages, output_format=None):
+        self.calls += 1
+        await asyncio.sleep(self.delay_seconds)
+        if self.error:
+            raise self.error
+        usage = ChatInvokeUsage(
+            prompt_tokens=self.prompt_tokens,
+            prompt_cached_tokens=self.cached_tokens,
+            prompt_cache_creation_tokens=None,
+            prompt_image_tokens=None,
+            completion_tokens=10,
+            total_tokens=self.prompt_tokens + 10,
+        )
+        return ChatInvokeCompletion(completion=f"answer from {self.model}", usage=usage)
+
+
+@pytest.fixture(autouse=True)
+def circuit_breakers(monkeypatch):
+    """Breakers are shared per worker process, each test starts with closed ones"""
+    breakers = {}
+    monkeypatch.setattr(llm_router, "circuit_breakers", breakers)
+    return breakers
+
+
+def make_agent(llm):
+    """The parts of browser_use's Agent a hedged model uses, with the agent's own usage tracking"""
+    token_cost_service = TokenCost(include_cost=False)
+    token_cost_service.register_llm(llm)
+    return SimpleNamespace(llm=llm, token_cost_service=token_cost_service, state=SimpleNamespace(n_steps=1))
+
+
+def test_hedged_answer_keeps_its_usage_and_is_counted_once_under_the_serving_model():
+    primary = ScriptedChatModel("openai", "primary", delay_seconds=1)
+    backup = ScriptedChatModel("google", "backup", prompt_tokens=250)
+    hedged = HedgedChatModel([primary, backup], hedge_after_seconds=0.01)
+    agent = make_agent(hedged)
+    hedged.install(agent)
+
+    result = asyncio.run(agent.llm.ainvoke([]))
+
+    assert result.completion == "answer from backup"
+    assert result.usage.prompt_tokens == 250
+    assert [(entry.model, entry.usage.prompt_tokens) for entry in agent.token_cost_service.usage_history] == [("backup", 250)]
+
+
+def test_circuit_breaker_opens_after_consecutive_failures_and_half_opens_after_the_cooldown(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(llm_router.time, "time", lambda: now[0])
+    breaker = CircuitBreaker(failure_threshold=2, cooldown_seconds=60)
+
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert not breaker.is_open()
+    breaker.record_failure()
+    assert breaker.is_open()
+
+    now[0] += 60
+    assert not breaker.is_open()
+    # A failed probe opens it again right away
+    breaker.record_failure()
+    assert breaker.is_open()
+
+
+def test_fast_primary_wins_without_hedging():
+    primary = ScriptedChatModel("openai", "primary")
+    backup = ScriptedChatModel("google", "backup")
+    hedged = HedgedChatModel([primary, backup], hedge_after_seconds=0.5)
+
+    result = asyncio.run(hedged.ainvoke([]))
+
+    assert result.completion == "answer from primary"
+    assert backup.calls == 0
+    assert hedged.calls[0]["served_by"] == {"provider": "openai", "model": "primary"}
+    assert not hedged.calls[0]["hedged"]
+
+
+def test_rate_limited_primary_falls_back_and_counts_against_its_breaker(circuit_breakers):
+    primary = ScriptedChatModel("openai", "primary", error=ModelProviderError("rate limited", status_code=429))
+    backup = ScriptedChatModel("google", "backup")
+    hedged = HedgedChatModel([primary, backup])
+
+    result = asyncio.run(hedged.ainvoke([]))
+
+    assert result.completion == "answer from backup"
+    assert hedged.calls[0]["errors"] == [{"provider": "openai", "model": "primary", "status_code": 429}]
+    assert circuit_breakers["openai"].consecutive_failures == 1
+
+
+def test_bad_request_is_raised_without_falling_back():
+    primary = ScriptedChatModel("openai", "primary", error=ModelProviderError("bad request", status_code=400))
+    backup = ScriptedChatModel("google", "backup")
+    hedged = HedgedChatModel([primary, backup])
+
+    with pytest.raises(ModelProviderError):
+        asyncio.run(hedged.ainvoke([]))
+    assert backup.calls == 0
+
+
+def test_open_breaker_skips_its_provider(circuit_breakers):
+    circuit_breakers["openai"] = CircuitBreaker(failure_threshold=1)
+    circuit_breakers["openai"].record_failure()
+    primary = ScriptedChatModel("openai", "primary")
+    backup = ScriptedChatModel("google", "backup")
+
+    result = asyncio.run(HedgedChatModel([primary, backup]).ainvoke([]))
+
+    assert result.completion == "answer from backup"
+    assert primary.calls == 0
+
+
+def test_prompt_cache_recorder_records_hedged_calls_under_the_model_that_served_them():
+    primary = ScriptedChatModel("openai", "primary", delay_seconds=1)
+    backup = ScriptedChatModel("google", "backup", prompt_tokens=250, cached_tokens=200)
+    hedged = HedgedChatModel([primary, backup], hedge_after_seconds=0.01)
+    agent = make_agent(hedged)
+    hedged.install(agent)
+    recorder = PromptCacheRecorder()
+    recorder.install(agent)
+
+    asyncio.run(agent.llm.ainvoke([]))
+
+    assert [(call["model"], call["prompt_tokens"], call["cached_tokens"]) for call in recorder.calls] == [("backup", 250, 200)]
+    assert recorder.calls[0]["duration_seconds"] < 1
+    assert recorder.get_report()["models"] == ["backup"]
+    # The token cost service still counts the answer once
+    assert len(agent.token_cost_service.usage_history) == 1
@@ -0,0 +1,48 @@
+import sys
+
+import pytest
+
+from scripts import load_generator
+from scripts.load_generator import prepare_message, get_test_runs
+
+
+SUITE_MESSAGE = {
+    "taskType": "suite-run",
+    "suiteRunSlug": "suite-1",
+    "modelSlug": "gpt-4.1",
+    "modelProvider": "openai",
+    "sentAt": "2026-10-19T08:00:00Z",
+    "tests": [
+        {"testRunSlug": "run-1", "testVersionSlug": "version-1", "setup": True},
+        {"testRunSlug": "run-2"},
+    ],
+}
+
+
+def test_replayed_suite_claims_new_runs_copied_from_the_recorded_ones():
+    prepared = prepare_message(SUITE_MESSAGE, "20261019", 7, fake_llm=True)
+
+    assert prepared["suiteRunSlug"] == "suite-1-load-20261019-7"
+    assert "sentAt" not in prepared
+    assert get_test_runs(SUITE_MESSAGE, prepared) == [
+        {"slug": "run-1-load-20261019-7", "source_slug": "run-1", "version_slug": "version-1", "model_slug": "gpt-4.1", "model_provider": "fake"},
+        {"slug": "run-2-load-20261019-7", "source_slug": "run-2", "version_slug": None, "model_slug": "gpt-4.1", "model_provider": "fake"},
+    ]
+
+
+def test_real_worker_load_without_seeded_runs_is_refused(tmp_path, monkeypatch, capsys):
+    log = tmp_path / "messages.jsonl"
+    log.write_text('{"taskType": "test-run", "testRunSlug": "run-1", "task": "Open https://shop.test/"}\n')
+    monkeypatch.setattr(sys, "argv", ["load_generator.py", str(log), "--rate", "1", "--workers", "1"])
+    monkeypatch.setattr(load_generator, "LocalTarget", lambda *args: pytest.fail("started the load without runs to claim"))
+
+    with pytest.raises(SystemExit):
+        load_generator.main()
+    assert "--seed-runs" in capsys.readouterr().err
+
+
+def test_seeding_stops_when_a_run_has_no_version(monkeypatch):
+    monkeypatch.setattr(load_generator, "create_pending_test_runs", lambda test_runs: ["run-1-load-1-0"])
+
+    with pytest.raises(SystemExit, match="run-2-load-1-0"):
+        load_generator.seed_test_runs([{"slug": "run-1-load-1-0"}, {"slug": "run-2-load-1-0"}])
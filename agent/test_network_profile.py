@@ -0,0 +1,39 @@
+import asyncio
+from types import SimpleNamespace
+
+from cdp_use.cdp.registry import EventRegistry
+from network_profile import NetworkInterceptor
+
+
+def make_interceptor(registry):
+    interceptor = NetworkInterceptor({"blockTrackers": True})
+    interceptor.browser_session = SimpleNamespace(event_bus=SimpleNamespace(handlers={}))
+    interceptor.cdp_client = SimpleNamespace(_event_registry=registry)
+    return interceptor
+
+
+def test_register_handler_chains_to_the_previous_handler_and_detach_restores_it():
+    registry = EventRegistry()
+    calls = []
+
+    def previous(event, session_id=None):
+        calls.append(("previous", session_id))
+
+    registry.register("Target.attachedToTarget", previous)
+    interceptor = make_interceptor(registry)
+    interceptor.register_handler("Target.attachedToTarget", lambda event, session_id=None: calls.append(("profile", session_id)))
+
+    asyncio.run(registry.handle_event("Target.attachedToTarget", {}, "session"))
+    assert calls == [("previous", "session"), ("profile", "session")]
+
+    interceptor.detach()
+    assert registry._handlers["Target.attachedToTarget"] is previous
+
+
+def test_detach_unregisters_handlers_that_had_no_predecessor():
+    registry = EventRegistry()
+    interceptor = make_interceptor(registry)
+    interceptor.register_handler("Fetch.requestPaused", interceptor.on_request_paused, chain=False)
+
+    interceptor.detach()
+    assert "Fetch.requestPaused" not in registry.get_registered_methods()
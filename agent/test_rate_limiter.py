@@ -0,0 +1,25 @@
+import rate_limiter
+from rate_limiter import LocalTokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+def test_local_token_bucket_refills_at_its_rate_up_to_its_capacity(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter.time, "monotonic", clock.monotonic)
+    bucket = LocalTokenBucket(capacity=60, refill_per_second=1)
+
+    assert bucket.reserve(50) == 10
+    assert bucket.reserve(20) == -10
+
+    clock.now += 15
+    assert bucket.reserve(1) == 4
+
+    clock.now += 3600
+    assert bucket.reserve(0) == 60
@@ -0,0 +1,82 @@
+import io
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import reuse
+from reuse import decide_reuse
+
+
+class FakeResponse(io.BytesIO):
+    def __init__(self, headers, body=b""):
+        super().__init__(body)
+        self.headers = headers
+
+
+def serve(monkeypatch, headers, body=b"<html>shop</html>"):
+    """Answer every request to the start URL with `headers`, HEAD without a body"""
+    requests = []
+
+    def urlopen(request, timeout):
+        requests.append(request.get_method())
+        return FakeResponse(headers, b"" if request.get_method() == 'HEAD' else body)
+
+    monkeypatch.setattr(reuse, "urlopen", urlopen)
+    return requests
+
+
+@pytest.fixture
+def previous_run(monkeypatch):
+    """A run succeeded an hour ago whose reuse decision recorded `fingerprint`"""
+    documents = {"test-runs/previous/index.json": {"total_duration_seconds": 42}}
+
+    def make(fingerprint):
+        documents["test-runs/previous/reuse.json"] = {"reused": False, "fingerprint": fingerprint}
+        return {"slug": "previous", "updated_at": datetime.now(timezone.utc) - timedelta(hours=1)}
+
+    monkeypatch.setattr(reuse, "load_json_from_s3_key", documents.get)
+    monkeypatch.setattr(reuse, "load_run_index_from_s3", lambda slug: documents.get(f"test-runs/{slug}/index.json"))
+    return make
+
+
+MESSAGE = {"task": "Open https://shop.test/cart. and check out", "reuseMaxAgeSeconds": 86400}
+
+
+def test_unchanged_etag_reuses_the_previous_run(monkeypatch, previous_run):
+    requests = serve(monkeypatch, {"ETag": 'W/"v1"', "Last-Modified": "Mon, 19 Oct 2026 08:00:00 GMT"})
+
+    decision = decide_reuse(MESSAGE, previous_run('etag:W/"v1"'))
+
+    assert requests == ["HEAD"]
+    assert decision["start_url"] == "https://shop.test/cart"
+    assert decision["reused"] and decision["reason"] == "unchanged"
+    assert decision["reused_from"] == "previous"
+    assert decision["time_saved_seconds"] == 42
+
+
+def test_changed_last_modified_runs_again(monkeypatch, previous_run):
+    serve(monkeypatch, {"Last-Modified": "Mon, 19 Oct 2026 09:00:00 GMT"})
+
+    decision = decide_reuse(MESSAGE, previous_run("last-modified:Mon, 19 Oct 2026 08:00:00 GMT"))
+
+    assert decision["fingerprint"] == "last-modified:Mon, 19 Oct 2026 09:00:00 GMT"
+    assert not decision["reused"] and decision["reason"] == "start_url_changed"
+
+
+def test_without_validators_the_body_hash_is_compared(monkeypatch, previous_run):
+    requests = serve(monkeypatch, {})
+    fingerprint = reuse.get_url_fingerprint("https://shop.test/cart")
+
+    decision = decide_reuse(MESSAGE, previous_run(fingerprint))
+
+    assert fingerprint.startswith("sha256:")
+    assert requests == ["HEAD", "GET"] * 2
+    assert decision["reused"]
+
+
+def test_previous_run_older_than_the_max_age_runs_again(monkeypatch, previous_run):
+    serve(monkeypatch, {"ETag": '"v1"'})
+    run = previous_run('etag:"v1"')
+    run["updated_at"] -= timedelta(days=2)
+
+    assert decide_reuse(MESSAGE, run)["reason"] == "previous_run_too_old"
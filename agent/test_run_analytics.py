@@ -0,0 +1,23 @@
+import numpy as np
+
+from scripts.run_analytics import get_group_percentiles
+
+
+def test_group_percentiles_match_numpy_percentile_per_group():
+    rng = np.random.default_rng(0)
+    groups = rng.integers(0, 5, size=500)
+    values = rng.exponential(30, size=500)
+    values[rng.random(500) < 0.1] = np.nan
+    # Group 3 has no values and group 4 a single one
+    values[groups == 3] = np.nan
+    values[groups == 4] = np.nan
+    values[np.flatnonzero(groups == 4)[0]] = 12.5
+
+    percentiles = get_group_percentiles(groups, values, 6, [0.5, 0.95])
+
+    for group in range(6):
+        group_values = values[(groups == group) & ~np.isnan(values)]
+        if len(group_values):
+            np.testing.assert_allclose(percentiles[group], np.percentile(group_values, [50, 95]))
+        else:
+            assert np.isnan(percentiles[group]).all()
@@ -0,0 +1,136 @@
+import json
+import time
+
+import pytest
+
+import db_operations
+import scheduler
+from scheduler import Scheduler, PROCESSED, CAPPED
+
+
+class FakeSQS:
+    """One SQS queue with a redrive policy, received messages stay in `messages` until deleted"""
+
+    def __init__(self, messages, max_receive_count=None):
+        self.messages = messages
+        self.max_receive_count = max_receive_count
+        self.visibility = {}
+        self.deleted = []
+
+    def get_queue_attributes(self, QueueUrl, AttributeNames):
+        if not self.max_receive_count:
+            return {'Attributes': {}}
+        return {'Attributes': {'RedrivePolicy': json.dumps({'maxReceiveCount': self.max_receive_count, 'deadLetterTargetArn': 'arn'})}}
+
+    def receive_message(self, QueueUrl, MaxNumberOfMessages, AttributeNames, VisibilityTimeout):
+        return {'Messages': self.messages[:MaxNumberOfMessages]}
+
+    def change_message_visibility(self, QueueUrl, ReceiptHandle, VisibilityTimeout):
+        self.visibility[ReceiptHandle] = VisibilityTimeout
+
+    def delete_message(self, QueueUrl, ReceiptHandle):
+        self.deleted.append(ReceiptHandle)
+
+
+class FakeSchedulerDB:
+    def __init__(self, virtual_times=None, floor=0, running_counts=None):
+        self.virtual_times = virtual_times or {}
+        self.floor = floor
+        self.running_counts = running_counts or {}
+        self.finished = []
+
+    def get_flows(self, flow_keys):
+        return self.virtual_times, self.floor
+
+    def get_running_counts(self, organizations, running_ttl_seconds):
+        return self.running_counts
+
+    def start_message(self, message_id, organization, flow_key, wait_seconds):
+        pass
+
+    def finish_message(self, message_id, flow_key, virtual_cost, floor):
+        self.finished.append((flow_key, virtual_cost, floor))
+
+    def disconnect(self):
+        pass
+
+
+def sqs_message(message_id, organization, task_type="test-run", waited_seconds=0, receive_count=1):
+    return {
+        'MessageId': message_id,
+        'ReceiptHandle': f"receipt-{message_id}",
+        'Body': json.dumps({"organizationSlug": organization, "taskType": task_type}),
+        'Attributes': {
+            'SentTimestamp': str(int((time.time() - waited_seconds) * 1000)),
+            'ApproximateReceiveCount': str(receive_count),
+        },
+    }
+
+
+@pytest.fixture
+def make_scheduler(monkeypatch):
+    monkeypatch.setattr(db_operations, "DB_URL", "postgresql://localhost/test")
+    monkeypatch.setattr(scheduler, "MAX_RUNNING_PER_ORGANIZATION", 2)
+
+    def make(messages, max_receive_count=None, **db_state):
+        fake_db = FakeSchedulerDB(**db_state)
+        monkeypatch.setattr(scheduler, "SchedulerDB", lambda: fake_db)
+        test_scheduler = Scheduler(FakeSQS(messages, max_receive_count), [{"url": "queue", "weight": 1}])
+        return test_scheduler, test_scheduler.sqs
+
+    return make
+
+
+def test_capped_candidates_are_released_later_and_the_others_right_away(make_scheduler, monkeypatch):
+    monkeypatch.setattr(scheduler, "CANDIDATES_PER_QUEUE", 10)
+    test_scheduler, sqs = make_scheduler(
+        [sqs_message("1", "capped", waited_seconds=20), sqs_message("2", "free", waited_seconds=10), sqs_message("3", "free")],
+        virtual_times={"free:test-run": 5},
+        running_counts={"capped": 2},
+    )
+
+    assert test_scheduler.run_once(lambda body: None) == PROCESSED
+    assert sqs.deleted == ["receipt-2"]
+    assert sqs.visibility["receipt-1"] == scheduler.CAPPED_RELEASE_SECONDS
+    assert sqs.visibility["receipt-3"] == 0
+
+
+def test_last_receive_before_the_dead_letter_queue_runs_over_the_cap(make_scheduler):
+    test_scheduler, sqs = make_scheduler(
+        [sqs_message("1", "capped", receive_count=5)],
+        max_receive_count=5,
+        running_counts={"capped": 2},
+    )
+
+    assert test_scheduler.run_once(lambda body: None) == PROCESSED
+    assert sqs.deleted == ["receipt-1"]
+
+
+def test_capped_organizations_only(make_scheduler):
+    test_scheduler, sqs = make_scheduler([sqs_message("1", "capped", receive_count=2)], max_receive_count=5, running_counts={"capped": 2})
+
+    assert test_scheduler.run_once(lambda body: None) == CAPPED
+    assert sqs.visibility["receipt-1"] == scheduler.CAPPED_RELEASE_SECONDS
+
+
+def test_least_served_flow_goes_first_even_when_its_message_is_younger(make_scheduler):
+    test_scheduler, sqs = make_scheduler(
+        [sqs_message("1", "busy", waited_seconds=60), sqs_message("2", "quiet", waited_seconds=5)],
+        virtual_times={"busy:test-run": 50, "quiet:test-run": 10},
+        floor=0,
+    )
+
+    assert test_scheduler.run_once(lambda body: None) == PROCESSED
+    assert sqs.deleted == ["receipt-2"]
+
+
+def test_idle_flows_restart_at_the_floor_instead_of_their_old_virtual_time(make_scheduler):
+    # "returning" was idle since virtual time 1, it competes from the floor and does not get to catch up
+    test_scheduler, sqs = make_scheduler(
+        [sqs_message("1", "returning", waited_seconds=5), sqs_message("2", "steady", waited_seconds=60)],
+        virtual_times={"returning:test-run": 1, "steady:test-run": 40},
+        floor=40,
+    )
+
+    assert test_scheduler.run_once(lambda body: None) == PROCESSED
+    assert sqs.deleted == ["receipt-2"]
@@ -0,0 +1,34 @@
+import asyncio
+from types import SimpleNamespace
+
+import storage_state
+from storage_state import LoggedOutDetector
+
+
+def make_agent(urls):
+    return SimpleNamespace(history=SimpleNamespace(urls=lambda: urls))
+
+
+def run_steps(detector, steps):
+    for urls in steps:
+        asyncio.run(detector.on_step_end(make_agent(urls)))
+
+
+def test_logged_out_detector_deletes_snapshot_when_the_first_page_is_a_login_page(monkeypatch):
+    deleted = []
+    monkeypatch.setattr(storage_state, "delete_project_storage_state", lambda *args: deleted.append(args))
+    detector = LoggedOutDetector("acme", "shop", had_snapshot=True)
+
+    run_steps(detector, [["about:blank"], ["about:blank", "https://shop.test/login?next=/cart"]])
+
+    assert detector.logged_out
+    assert deleted == [("acme", "shop")]
+
+
+def test_logged_out_detector_ignores_a_later_logout():
+    detector = LoggedOutDetector("acme", "shop", had_snapshot=True)
+
+    run_steps(detector, [["https://shop.test/account"], ["https://shop.test/account", "https://shop.test/login"]])
+
+    assert detector.first_url == "https://shop.test/account"
+    assert not detector.logged_out
@@ -0,0 +1,59 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+from screenshot_diff import diff_screenshots, get_perceptual_hash
+from visual_diff import align_steps
+
+
+def make_page(seed, width=320, height=240):
+    """A page-like screenshot: light background with a few dark blocks placed by `seed`"""
+    rng = np.random.default_rng(seed)
+    pixels = np.full((height, width, 3), 245, dtype=np.uint8)
+    for _ in range(6):
+        x, y = rng.integers(0, width - 60), rng.integers(0, height - 40)
+        pixels[y:y + 40, x:x + 60] = rng.integers(0, 120, size=3)
+    return Image.fromarray(pixels)
+
+
+def to_png(image):
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def hash_distance(first, second):
+    return int(np.count_nonzero(get_perceptual_hash(first) != get_perceptual_hash(second)))
+
+
+def test_align_steps_skips_an_extra_step_instead_of_shifting_the_rest():
+    baseline = ["https://shop.test/", "https://shop.test/cart", "https://shop.test/checkout"]
+    current = ["https://shop.test/?session=1", "https://shop.test/cookies", "https://shop.test/cart#top", "https://shop.test/checkout"]
+
+    assert align_steps(current, baseline) == [(1, 1), (3, 2), (4, 3)]
+
+
+def test_perceptual_hash_distance_is_small_for_noise_and_large_for_another_page():
+    page = make_page(1)
+    noisy = np.asarray(page).astype(np.int16) + np.random.default_rng(0).integers(-8, 9, size=(240, 320, 3))
+    noisy = Image.fromarray(np.clip(noisy, 0, 255).astype(np.uint8))
+
+    assert hash_distance(page, page) == 0
+    assert hash_distance(page, noisy) <= 4
+    assert hash_distance(page, make_page(2)) > 10
+
+
+def test_diff_screenshots_ignores_masked_changes():
+    baseline = make_page(1)
+    current = np.array(baseline)
+    current[10:30, 10:50] = 0
+    job = {"step": 2, "baseline_step": 1, "current": to_png(Image.fromarray(current)), "baseline": to_png(baseline), "masks": []}
+
+    diff = diff_screenshots(job)
+    masked = diff_screenshots({**job, "masks": [{"x": 0, "y": 0, "width": 60, "height": 40}]})
+
+    assert diff["changed_ratio"] == 20 * 40 / (320 * 240)
+    assert diff["changed"] and not diff["size_changed"]
+    assert masked["changed_ratio"] == 0 and not masked["changed"]
+    assert Image.open(io.BytesIO(diff["heatmap"])).size == (320, 240)
@@ -0,0 +1,65 @@
+import asyncio
+from types import SimpleNamespace
+
+from browser_use.agent.views import ActionResult
+
+from web_vitals import WebVitalsRecorder
+
+
+class Action:
+    def __init__(self, name):
+        self.name = name
+
+    def model_dump(self, exclude_none=False):
+        return {self.name: {}}
+
+
+def make_agent(action_names, done):
+    """An agent after a step that ran `action_names`, the last of them finishing the run when `done`"""
+    results = [ActionResult() for _ in action_names[:-1]] + [ActionResult(is_done=True, success=True) if done else ActionResult()]
+    history_item = SimpleNamespace(model_output=SimpleNamespace(action=[Action(name) for name in action_names]), result=results)
+    agent = SimpleNamespace(stopped=False, history=SimpleNamespace(history=[history_item], is_done=lambda: done))
+    agent.stop = lambda: setattr(agent, "stopped", True)
+    return agent
+
+
+def make_recorder(load_ms):
+    recorder = WebVitalsRecorder({"maxLoadSeconds": 2})
+
+    async def read_vitals(agent):
+        return {"url": "https://shop.test/checkout", "new_document": True, "load_ms": load_ms}
+
+    recorder.read_vitals = read_vitals
+    return recorder
+
+
+def test_slow_step_stops_the_run():
+    recorder = make_recorder(load_ms=3500)
+    agent = make_agent(["click_element_by_index"], done=False)
+
+    asyncio.run(recorder.on_step_end(agent))
+
+    assert agent.stopped
+    assert recorder.get_failure_reason() == "performance_budget_exceeded:max_load_seconds"
+
+
+def test_slow_step_that_finished_the_run_still_fails_it():
+    recorder = make_recorder(load_ms=3500)
+    agent = make_agent(["click_element_by_index", "done"], done=True)
+
+    asyncio.run(recorder.on_step_end(agent))
+
+    assert not agent.stopped
+    assert recorder.violations == [{"metric": "max_load_seconds", "value": 3.5, "limit": 2.0}]
+    assert recorder.get_failure_reason() == "performance_budget_exceeded:max_load_seconds"
+    assert agent.history.history[-1].result[-1].success is False
+
+
+def test_step_within_budget_passes():
+    recorder = make_recorder(load_ms=1500)
+    agent = make_agent(["click_element_by_index", "done"], done=True)
+
+    asyncio.run(recorder.on_step_end(agent))
+
+    assert recorder.get_failure_reason() is None
+    assert agent.history.history[-1].result[-1].success is True
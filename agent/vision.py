@@ -0,0 +1,215 @@
+from browser_use.llm.messages import ContentPartImageParam, ImageURL
+from boto3 import client
+from dotenv import load_dotenv
+from PIL import Image, ImageOps
+import io
+import os
+import json
+import time
+import base64
+import hashlib
+import logging
+
+load_dotenv()
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Config
+S3_BUCKET_NAME = os.getenv('S3_BUCKET_NAME', 'flow-tester')
+# Default policy for runs whose message has no `visionPolicy`, e.g. '{"maxWidth": 800, "jpegQuality": 60}'
+VISION_POLICY = json.loads(os.getenv('VISION_POLICY', 'null'))
+DEFAULT_CROP_MARGIN = 300
+# Anthropic's estimate for image input, close enough to compare policies against each other
+PIXELS_PER_IMAGE_TOKEN = 750
+
+# Initialize S3 client
+s3_client = client(
+    's3',
+    aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+    aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+    region_name=os.getenv('AWS_REGION', 'us-east-1')
+)
+
+
+def estimate_image_tokens(width, height):
+    return round(width * height / PIXELS_PER_IMAGE_TOKEN)
+
+
+class VisionPayloadReducer:
+    """
+    Shrinks the screenshot the agent sends to the model at every step. Only the copy in the
+    model input is changed, the screenshots saved with the run stay full size.
+
+    Policy keys (all optional):
+        maxWidth (int): Downscale screenshots wider than this, keeping the aspect ratio
+        grayscale (bool): Drop colour
+        jpegQuality (int): Send JPEG at this quality instead of PNG
+        cropToActiveElement (bool): Crop to the region around the element the last action used
+        cropMargin (int): CSS pixels kept around that element, defaults to 300
+        skipUnchangedDom (bool): Send no screenshot when the URL and DOM are the same as the last step
+    """
+
+    def __init__(self, policy):
+        self.policy = policy
+        self.crop_margin = int(policy.get('cropMargin') or DEFAULT_CROP_MARGIN)
+        self.last_dom_fingerprint = None
+        self.agent = None
+        self.stats = {
+            "policy": policy,
+            "images_sent": 0,
+            "images_skipped": 0,
+            "images_cropped": 0,
+            "original_bytes": 0,
+            "sent_bytes": 0,
+            "original_image_tokens": 0,
+            "sent_image_tokens": 0,
+            "processing_seconds": 0,
+        }
+
+    def install(self, agent):
+        """Wrap the agent's state message creation so every screenshot goes through the policy"""
+        self.agent = agent
+        message_manager = agent._message_manager
+        create_state_messages = message_manager.create_state_messages
+
+        def create_reduced_state_messages(browser_state_summary, *args, **kwargs):
+            is_skipped = bool(self.policy.get('skipUnchangedDom') and browser_state_summary.screenshot and self.is_dom_unchanged(browser_state_summary))
+            if is_skipped:
+                original_width, original_height = Image.open(io.BytesIO(base64.b64decode(browser_state_summary.screenshot))).size
+                self.stats["images_skipped"] += 1
+                self.stats["original_image_tokens"] += estimate_image_tokens(original_width, original_height)
+                kwargs['use_vision'] = False
+
+            result = create_state_messages(browser_state_summary, *args, **kwargs)
+            state_message = message_manager.state.history.state_message
+            if is_skipped:
+                state_message.content += "\nNo screenshot: the page is unchanged since the previous step."
+            else:
+                self.reduce_state_message(state_message, browser_state_summary)
+            return result
+
+        message_manager.create_state_messages = create_reduced_state_messages
+
+    def is_dom_unchanged(self, browser_state_summary):
+        dom_fingerprint = hashlib.sha256(
+            f"{browser_state_summary.url}\n{browser_state_summary.dom_state.llm_representation()}".encode('utf-8')
+        ).hexdigest()
+        is_unchanged = dom_fingerprint == self.last_dom_fingerprint
+        self.last_dom_fingerprint = dom_fingerprint
+        return is_unchanged
+
+    def reduce_state_message(self, state_message, browser_state_summary):
+        if not isinstance(state_message.content, list):
+            return
+        for i, part in enumerate(state_message.content):
+            if isinstance(part, ContentPartImageParam) and part.image_url.url == f"data:image/png;base64,{browser_state_summary.screenshot}":
+                state_message.content[i] = self.reduce_image_part(part, browser_state_summary)
+
+    def reduce_image_part(self, part, browser_state_summary):
+        start_time = time.time()
+        original = base64.b64decode(browser_state_summary.screenshot)
+        image = Image.open(io.BytesIO(original))
+        self.stats["images_sent"] += 1
+        self.stats["original_bytes"] += len(original)
+        self.stats["original_image_tokens"] += estimate_image_tokens(*image.size)
+
+        if self.policy.get('cropToActiveElement'):
+            crop_box = self.get_active_element_box(browser_state_summary, image.size)
+            if crop_box:
+                image = image.crop(crop_box)
+                self.stats["images_cropped"] += 1
+        max_width = self.policy.get('maxWidth')
+        if max_width and image.width > max_width:
+            image = image.resize((max_width, round(image.height * max_width / image.width)), Image.LANCZOS)
+        if self.policy.get('grayscale'):
+            image = ImageOps.grayscale(image)
+
+        buffer = io.BytesIO()
+        if self.policy.get('jpegQuality'):
+            image.convert('L' if self.policy.get('grayscale') else 'RGB').save(buffer, format='JPEG', quality=int(self.policy['jpegQuality']))
+            media_type = 'image/jpeg'
+        else:
+            image.save(buffer, format='PNG', optimize=True)
+            media_type = 'image/png'
+        reduced = buffer.getvalue()
+
+        self.stats["sent_bytes"] += len(reduced)
+        self.stats["sent_image_tokens"] += estimate_image_tokens(*image.size)
+        self.stats["processing_seconds"] += time.time() - start_time
+        return ContentPartImageParam(
+            image_url=ImageURL(
+                url=f"data:{media_type};base64,{base64.b64encode(reduced).decode('utf-8')}",
+                media_type=media_type,
+                detail=part.image_url.detail,
+            )
+        )
+
+    def get_active_element_box(self, browser_state_summary, image_size):
+        """Find the element the last action interacted with on the current page and return its surroundings in screenshot pixels"""
+        if not self.agent.history.history:
+            return None
+        interacted_elements = self.agent.history.history[-1].state.interacted_element or []
+        backend_node_ids = {element.backend_node_id for element in interacted_elements if element}
+        node = next(
+            (node for node in browser_state_summary.dom_state.selector_map.values()
+             if node.backend_node_id in backend_node_ids and node.absolute_position),
+            None
+        )
+        if not node:
+            return None
+
+        # Element positions are CSS pixels relative to the viewport, the screenshot is in device pixels
+        page_info = browser_state_summary.page_info
+        scale = image_size[0] / page_info.viewport_width if page_info and page_info.viewport_width else 1
+        bounds = node.absolute_position
+        box = (
+            max(0, int((bounds.x - self.crop_margin) * scale)),
+            max(0, int((bounds.y - self.crop_margin) * scale)),
+            min(image_size[0], int((bounds.x + bounds.width + self.crop_margin) * scale)),
+            min(image_size[1], int((bounds.y + bounds.height + self.crop_margin) * scale)),
+        )
+        # Off-screen elements leave nothing to crop to
+        if box[2] - box[0] < 2 or box[3] - box[1] < 2:
+            return None
+        return box
+
+    def save_report(self, test_run_slug, result):
+        """Save the run's image savings with its token usage, duration and outcome for tuning the policy"""
+        report = {
+            **self.stats,
+            "estimated_image_tokens_saved": self.stats["original_image_tokens"] - self.stats["sent_image_tokens"],
+            "prompt_tokens": result.usage.total_prompt_tokens if result and result.usage else None,
+            "number_of_steps": result.number_of_steps() if result else None,
+            "total_duration_seconds": result.total_duration_seconds() if result else None,
+            "is_successful": result.is_successful() if result else None,
+        }
+        try:
+            s3_client.put_object(
+                Bucket=S3_BUCKET_NAME,
+                Key=f"test-runs/{test_run_slug}/vision.json",
+                Body=json.dumps(report),
+                ContentType='application/json',
+            )
+            logger.info(f"Vision policy of test run {test_run_slug} sent {self.stats['sent_bytes']} of "
+                        f"{self.stats['original_bytes']} screenshot bytes and skipped {self.stats['images_skipped']} screenshots")
+        except Exception as e:
+            logger.error(f"Error saving vision report for test run {test_run_slug}: {e}")
+
+
+def createVisionPayloadReducer(message):
+    """
+    Create the vision payload reducer for a run from the message's `visionPolicy`, falling back to
+    the worker's VISION_POLICY
+
+    Args:
+        message (dict): The test run message
+
+    Returns:
+        VisionPayloadReducer or None: The reducer, None if no policy applies
+    """
+    policy = message.get('visionPolicy') or VISION_POLICY
+    if not policy:
+        return None
+    return VisionPayloadReducer(policy)
@@ -0,0 +1,156 @@
+from boto3 import client
+from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
+from difflib import SequenceMatcher
+from urllib.parse import urlsplit
+import os
+import json
+import time
+import base64
+import logging
+from agent import load_json_from_s3, load_run_index_from_s3
+
+load_dotenv()
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Config
+S3_BUCKET_NAME = os.getenv('S3_BUCKET_NAME', 'flow-tester')
+VISUAL_DIFF = os.getenv('VISUAL_DIFF', 'true').lower() == 'true'
+VISUAL_DIFF_WORKERS = int(os.getenv('VISUAL_DIFF_WORKERS', str(os.cpu_count() or 2)))
+
+# Initialize S3 client
+s3_client = client(
+    's3',
+    aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+    aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+    region_name=os.getenv('AWS_REGION', 'us-east-1')
+)
+
+def normalize_url(url):
+    # Query strings and fragments often carry session ids and timestamps that say nothing about the page
+    parts = urlsplit(url or '')
+    return f"{parts.netloc}{parts.path}"
+
+
+def align_steps(current_urls, baseline_urls):
+    """
+    Pair the steps of a run with the steps of its baseline that are on the same page, in order,
+    so an extra or missing step does not shift every later comparison
+
+    Returns:
+        list: (current step, baseline step) pairs, both 1-based
+    """
+    matcher = SequenceMatcher(None, [normalize_url(url) for url in current_urls], [normalize_url(url) for url in baseline_urls], autojunk=False)
+    return [
+        (block.a + offset + 1, block.b + offset + 1)
+        for block in matcher.get_matching_blocks()
+        for offset in range(block.size)
+    ]
+
+
+def load_baseline(test_run_slug, baseline_run):
+    """Load the URL and screenshot key of each step of the baseline run"""
+    if not baseline_run or baseline_run['slug'] == test_run_slug:
+        return None, []
+
+    run_index = load_run_index_from_s3(baseline_run['slug'])
+    if run_index:
+        steps = [{"url": step["url"], "screenshot": step["screenshot"]["path"]} for step in run_index["steps"]]
+    else:
+        # Runs saved before the index only have their screenshot keys, their steps are paired by position
+        run_data = load_json_from_s3(baseline_run['slug']) or {}
+        steps = [{"url": None, "screenshot": screenshot["path"]} for screenshot in run_data.get("screenshots", [])]
+    return baseline_run['slug'], steps
+
+
+def download_screenshot(key):
+    try:
+        return s3_client.get_object(Bucket=S3_BUCKET_NAME, Key=key)['Body'].read()
+    except Exception as e:
+        logger.warning(f"Could not download baseline screenshot {key}: {e}")
+        return None
+
+
+def save_visual_diff(test_run_slug, baseline_run, result, masks=None):
+    """
+    Compare the screenshots of a finished run with the matching steps of the latest succeeded run
+    of the same version, and save the scores and heatmaps next to the run's screenshots
+
+    Args:
+        test_run_slug (str): The slug identifier of the test run
+        baseline_run (dict): The latest succeeded run of the same version, as looked up before the run
+        result (AgentHistoryList): The result of the run
+        masks (list): Rectangles `{"x", "y", "width", "height"}` to ignore, in screenshot pixels
+    """
+    if not VISUAL_DIFF or not baseline_run:
+        return
+    # numpy and PIL load on the first diff, not when the worker starts
+    from screenshot_diff import diff_screenshots, PIXEL_TOLERANCE, CHANGED_THRESHOLD
+    start_time = time.time()
+    try:
+        baseline_slug, baseline_steps = load_baseline(test_run_slug, baseline_run)
+        if not baseline_steps:
+            logger.info(f"No baseline screenshots for test run {test_run_slug}, skipping the visual diff")
+            return
+
+        current_urls = [history_item.state.url for history_item in result.history]
+        if any(step["url"] is None for step in baseline_steps):
+            pairs = [(step, step) for step in range(1, min(len(current_urls), len(baseline_steps)) + 1)]
+        else:
+            pairs = align_steps(current_urls, [step["url"] for step in baseline_steps])
+
+        screenshots = result.screenshots()
+        pairs = [(step, baseline_step) for step, baseline_step in pairs if step <= len(screenshots) and screenshots[step - 1]]
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            baseline_images = list(executor.map(download_screenshot, [baseline_steps[baseline_step - 1]["screenshot"] for _, baseline_step in pairs]))
+        jobs = [
+            {
+                "step": step,
+                "baseline_step": baseline_step,
+                "current": base64.b64decode(str(screenshots[step - 1])),
+                "baseline": baseline_image,
+                "masks": masks,
+            }
+            for (step, baseline_step), baseline_image in zip(pairs, baseline_images)
+            if baseline_image
+        ]
+
+        # Diffed on threads of the worker itself: numpy and PIL release the GIL for the heavy parts,
+        # and spawned diff processes re-imported the worker's modules before their first diff
+        with ThreadPoolExecutor(max_workers=VISUAL_DIFF_WORKERS) as executor:
+            diffs = list(executor.map(diff_screenshots, jobs))
+
+        heatmaps = []
+        for diff in diffs:
+            heatmaps.append((f"test-runs/{test_run_slug}/visual-diff/{diff['step']}.png", diff.pop("heatmap")))
+            diff["heatmap"] = heatmaps[-1][0]
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            list(executor.map(
+                lambda heatmap: s3_client.put_object(Bucket=S3_BUCKET_NAME, Key=heatmap[0], Body=heatmap[1], ContentType='image/png'),
+                heatmaps
+            ))
+
+        report = {
+            "baseline_run": baseline_slug,
+            "pixel_tolerance": PIXEL_TOLERANCE,
+            "changed_threshold": CHANGED_THRESHOLD,
+            "compared_steps": len(diffs),
+            "changed_steps": [diff["step"] for diff in diffs if diff["changed"]],
+            "max_changed_ratio": max((diff["changed_ratio"] for diff in diffs), default=0),
+            "unmatched_steps": sorted(set(range(1, len(current_urls) + 1)) - {diff["step"] for diff in diffs}),
+            "duration_seconds": time.time() - start_time,
+            "steps": diffs,
+        }
+        s3_client.put_object(
+            Bucket=S3_BUCKET_NAME,
+            Key=f"test-runs/{test_run_slug}/visual-diff.json",
+            Body=json.dumps(report),
+            ContentType='application/json',
+        )
+        logger.info(f"Visual diff of test run {test_run_slug} against {baseline_slug}: "
+                    f"{len(report['changed_steps'])} of {len(diffs)} steps changed in {report['duration_seconds']:.1f}s")
+    except Exception as e:
+        logger.error(f"Error computing the visual diff of test run {test_run_slug}: {e}")
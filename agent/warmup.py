@@ -0,0 +1,184 @@
+from boto3 import client
+from dotenv import load_dotenv
+from urllib.request import urlopen
+import os
+import json
+import time
+import atexit
+import asyncio
+import shutil
+import socket
+import logging
+import tempfile
+import threading
+import subprocess
+import psutil
+from browser_profile import get_browser_options
+
+load_dotenv()
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Config
+S3_BUCKET_NAME = os.getenv('S3_BUCKET_NAME', 'flow-tester')
+# Launch Chromium and import the agent runtime while the worker polls for its first message
+WORKER_PREWARM = os.getenv('WORKER_PREWARM', 'false').lower() == 'true'
+BROWSER_LAUNCH_TIMEOUT_SECONDS = 30
+
+# Initialize S3 client
+s3_client = client(
+    's3',
+    aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+    aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+    region_name=os.getenv('AWS_REGION', 'us-east-1')
+)
+
+# Seconds from the start of the worker process to each startup phase, only the first time it happens
+PROCESS_STARTED_AT = psutil.Process().create_time()
+startup_timings = {}
+startup_report_saved = False
+
+
+def mark_startup(phase):
+    if phase not in startup_timings:
+        startup_timings[phase] = time.time() - PROCESS_STARTED_AT
+
+
+class BrowserPrewarmer:
+    """
+    Launches Chromium with the worker's execution profile in a background thread, so the
+    first run connects to a browser that is already up instead of launching one. The browser
+    is handed out once, a worker runs a single message before its instance shuts down.
+    """
+
+    def __init__(self):
+        self.thread = None
+        self.process = None
+        self.cdp_url = None
+        self.user_data_dir = None
+        self.taken = False
+
+    def start(self):
+        self.thread = threading.Thread(target=self.prewarm, daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def prewarm(self):
+        start_time = time.time()
+        try:
+            # Imported here so the heavy agent modules load in parallel with the first poll
+            import browser_use.agent.service
+            from browser_use.browser import BrowserProfile
+            from browser_use.browser.watchdogs.local_browser_watchdog import LocalBrowserWatchdog
+            mark_startup("prewarm_imports")
+
+            executable_path = LocalBrowserWatchdog._find_installed_browser_path()
+            if not executable_path:
+                logger.warning("No local browser found to pre-warm, the first run launches its own")
+                return
+            self.user_data_dir = tempfile.mkdtemp(prefix='prewarm-profile-')
+            with socket.socket() as port_socket:
+                port_socket.bind(('127.0.0.1', 0))
+                port = port_socket.getsockname()[1]
+            args = BrowserProfile(**get_browser_options(), user_data_dir=self.user_data_dir).get_args()
+            self.process = subprocess.Popen(
+                [executable_path, *args, f'--remote-debugging-port={port}'],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL
+            )
+
+            while time.time() - start_time < BROWSER_LAUNCH_TIMEOUT_SECONDS:
+                try:
+                    with urlopen(f"http://127.0.0.1:{port}/json/version", timeout=1) as response:
+                        if response.status == 200:
+                            self.cdp_url = f"http://127.0.0.1:{port}/"
+                            break
+                except OSError:
+                    time.sleep(0.1)
+            if self.cdp_url:
+                mark_startup("prewarm_browser")
+                logger.info(f"Pre-warmed browser ready after {time.time() - start_time:.1f}s")
+            else:
+                logger.warning("Pre-warmed browser did not start in time, the first run launches its own")
+        except Exception as e:
+            logger.error(f"Error pre-warming the worker: {e}")
+
+    async def wait(self):
+        """Wait for the pre-warm phase to finish without blocking the event loop"""
+        if self.thread is not None and self.thread.is_alive():
+            await asyncio.to_thread(self.thread.join, BROWSER_LAUNCH_TIMEOUT_SECONDS)
+
+    def take_cdp_url(self):
+        """
+        Hand out the CDP URL of the pre-warmed browser, None if there is none left. Browsers are created
+        from async code, so this never waits: a browser still starting up is not handed out.
+        """
+        if self.thread is None or self.taken or self.thread.is_alive():
+            return None
+        self.taken = True
+        return self.cdp_url
+
+    def close(self):
+        # Connected sessions only disconnect on kill, the process is ours to stop
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        if self.user_data_dir:
+            shutil.rmtree(self.user_data_dir, ignore_errors=True)
+
+
+browser_prewarmer = BrowserPrewarmer()
+
+
+def prewarm_worker():
+    """Start the pre-warm phase if WORKER_PREWARM is enabled"""
+    if WORKER_PREWARM:
+        browser_prewarmer.start()
+
+
+async def wait_for_prewarmed_browser():
+    """Wait until the pre-warmed browser is up or has failed to start, call before creating a run's browser"""
+    await browser_prewarmer.wait()
+
+
+def get_prewarmed_browser_options():
+    """
+    Get the `Browser` options that connect to the pre-warmed browser, if it is available
+
+    Returns:
+        dict: `cdp_url` options, empty to launch a new browser
+    """
+    cdp_url = browser_prewarmer.take_cdp_url()
+    if not cdp_url:
+        return {}
+    mark_startup("browser_handed_out")
+    return {"cdp_url": cdp_url, "is_local": True}
+
+
+def save_startup_report(test_run_slug):
+    """Save the startup phase timings of the worker with its first run"""
+    global startup_report_saved
+    if startup_report_saved:
+        return
+    startup_report_saved = True
+
+    report = {
+        "prewarm": WORKER_PREWARM,
+        "prewarmed_browser_used": browser_prewarmer.taken and browser_prewarmer.cdp_url is not None,
+        "seconds_since_process_start": startup_timings,
+    }
+    logger.info(f"Worker startup timings: {json.dumps(startup_timings)}")
+    try:
+        s3_client.put_object(
+            Bucket=S3_BUCKET_NAME,
+            Key=f"test-runs/{test_run_slug}/startup.json",
+            Body=json.dumps(report),
+            ContentType='application/json',
+        )
+    except Exception as e:
+        logger.error(f"Error saving startup report for test run {test_run_slug}: {e}")
@@ -0,0 +1,274 @@
+from boto3 import client
+from dotenv import load_dotenv
+import os
+import json
+import time
+import asyncio
+import logging
+from budget import load_project_budget
+from db_operations import update_test_run_failure_reason
+
+load_dotenv()
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Config
+S3_BUCKET_NAME = os.getenv('S3_BUCKET_NAME', 'flow-tester')
+# Record web vitals for runs without a performance budget too, runs with one always record them
+WEB_VITALS = os.getenv('WEB_VITALS', 'false').lower() == 'true'
+# Default performance budget for runs whose project and test version set none, e.g. '{"maxLoadSeconds": 5}'
+PERFORMANCE_BUDGET = json.loads(os.getenv('PERFORMANCE_BUDGET', 'null'))
+# How long a step end waits for a page that is still loading before its metrics are read, only when
+# the budget has a load threshold to check, other runs read whatever the page has so far
+WEB_VITALS_LOAD_WAIT_SECONDS = float(os.getenv('WEB_VITALS_LOAD_WAIT_SECONDS', '5'))
+SLOWEST_REQUESTS = 5
+
+# Initialize S3 client
+s3_client = client(
+    's3',
+    aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+    aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+    region_name=os.getenv('AWS_REGION', 'us-east-1')
+)
+
+# Installs buffered performance observers once per document, so entries from before the first
+# read are included, then returns the document's vitals and the requests since the last read
+READ_VITALS_SCRIPT = """
+(async () => {
+  const started = performance.now();
+  while (document.readyState !== 'complete' && performance.now() - started < %(load_wait_ms)d) {
+    await new Promise(resolve => setTimeout(resolve, 100));
+  }
+  let vitals = window.__flowTesterVitals;
+  if (!vitals) {
+    vitals = {lcp: null, cls: 0, shiftWindow: null, inp: null, resources: [], observers: [], navigationRead: false};
+    Object.defineProperty(window, '__flowTesterVitals', {value: vitals, enumerable: false});
+    const observe = (type, handle, options) => {
+      try {
+        const observer = new PerformanceObserver(list => list.getEntries().forEach(handle));
+        observer.observe({type, buffered: true, ...options});
+        vitals.observers.push([observer, handle]);
+      } catch (e) {}
+    };
+    observe('largest-contentful-paint', entry => { vitals.lcp = entry.startTime; });
+    // CLS is the largest session window of shifts less than 1s apart and at most 5s long
+    observe('layout-shift', entry => {
+      if (entry.hadRecentInput) return;
+      const current = vitals.shiftWindow;
+      if (current && entry.startTime - current.end < 1000 && entry.startTime - current.start < 5000) {
+        current.value += entry.value;
+        current.end = entry.startTime;
+      } else {
+        vitals.shiftWindow = {start: entry.startTime, end: entry.startTime, value: entry.value};
+      }
+      vitals.cls = Math.max(vitals.cls, vitals.shiftWindow.value);
+    });
+    observe('event', entry => {
+      if (entry.interactionId) vitals.inp = Math.max(vitals.inp || 0, entry.duration);
+    }, {durationThreshold: 16});
+    observe('resource', entry => { vitals.resources.push(entry); });
+  }
+  vitals.observers.forEach(([observer, handle]) => observer.takeRecords().forEach(handle));
+
+  const navigation = performance.getEntriesByType('navigation')[0];
+  const paint = performance.getEntriesByName('first-contentful-paint')[0];
+  const isNewDocument = !vitals.navigationRead;
+  vitals.navigationRead = true;
+  const requests = vitals.resources.splice(0);
+  if (isNewDocument && navigation) requests.push(navigation);
+  return {
+    url: location.href,
+    new_document: isNewDocument,
+    navigation_type: navigation ? navigation.type : null,
+    ttfb_ms: navigation ? navigation.responseStart : null,
+    dom_content_loaded_ms: navigation && navigation.domContentLoadedEventEnd ? navigation.domContentLoadedEventEnd : null,
+    // A page still loading after the wait reports the time so far, a lower bound of its load time
+    loading: document.readyState !== 'complete',
+    load_ms: navigation && navigation.loadEventEnd ? navigation.loadEventEnd : (document.readyState !== 'complete' ? performance.now() : null),
+    fcp_ms: paint ? paint.startTime : null,
+    lcp_ms: vitals.lcp,
+    cls: vitals.cls,
+    inp_ms: vitals.inp,
+    requests: requests.length,
+    transfer_bytes: requests.reduce((sum, entry) => sum + (entry.transferSize || 0), 0),
+    slowest_requests: requests
+      .sort((a, b) => b.duration - a.duration)
+      .slice(0, %(slowest_requests)d)
+      .map(entry => ({
+        url: entry.name.slice(0, 300),
+        initiator_type: entry.initiatorType,
+        duration_ms: entry.duration,
+        transfer_bytes: entry.transferSize || 0,
+      })),
+  };
+})()
+"""
+
+# Budget key, failure reason, metric and whether it is only checked on the step that loaded the document.
+# Load metrics stay the same for the rest of the document, CLS, INP and requests can grow with every step.
+BUDGET_METRICS = [
+    ("maxTtfbSeconds", "max_ttfb_seconds", "ttfb_ms", 1000, True),
+    ("maxLoadSeconds", "max_load_seconds", "load_ms", 1000, True),
+    ("maxFcpSeconds", "max_fcp_seconds", "fcp_ms", 1000, True),
+    ("maxLcpSeconds", "max_lcp_seconds", "lcp_ms", 1000, True),
+    ("maxCls", "max_cls", "cls", 1, False),
+    ("maxInpMs", "max_inp_ms", "inp_ms", 1, False),
+    ("maxRequests", "max_requests", "requests", 1, False),
+    ("maxTransferBytes", "max_transfer_bytes", "transfer_bytes", 1, False),
+]
+
+
+def get_performance_budget(message):
+    """
+    Resolve the performance budget of a run: the worker's PERFORMANCE_BUDGET, overridden by the
+    `performance` key of the project's budget, overridden by the message's `performanceBudget`,
+    which the runs route sends from the test version
+
+    Args:
+        message (dict): The task message
+
+    Returns:
+        dict: The budget keys of BUDGET_METRICS that apply, empty if none do
+    """
+    budget = dict(PERFORMANCE_BUDGET or {})
+    if message.get('organizationSlug') and message.get('projectSlug'):
+        budget.update(load_project_budget(message['organizationSlug'], message['projectSlug']).get('performance') or {})
+    budget.update(message.get('performanceBudget') or {})
+    return budget
+
+
+class WebVitalsRecorder:
+    """
+    Reads the target site's navigation timings, LCP, CLS and INP, and the requests made, from the
+    agent's page after every step that acted on it. A step that goes over the performance budget
+    stops the agent at the step boundary, like RunBudget, so the run finishes unfinished and failed.
+
+    Budget keys (all optional):
+        maxTtfbSeconds, maxLoadSeconds, maxFcpSeconds, maxLcpSeconds (float): Checked on the step that loaded a document
+        maxCls (float): Largest layout shift session window of the document
+        maxInpMs (float): Slowest interaction of the document
+        maxRequests (int), maxTransferBytes (int): Requests of the step, cross-origin sizes are 0 without Timing-Allow-Origin
+    """
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.steps = {}
+        self.exceeded = None
+        self.violations = []
+        # Waiting for the load event slows every acting step, so it is only done when a load threshold needs it
+        load_wait_seconds = WEB_VITALS_LOAD_WAIT_SECONDS if any(
+            budget.get(budget_key) for budget_key, reason, metric, scale, document_only in BUDGET_METRICS if document_only
+        ) else 0
+        self.read_timeout_seconds = load_wait_seconds + 5
+        self.script = READ_VITALS_SCRIPT % {"load_wait_ms": load_wait_seconds * 1000, "slowest_requests": SLOWEST_REQUESTS}
+
+    async def read_vitals(self, agent):
+        cdp_session = await agent.browser_session.get_or_create_cdp_session()
+        response = await asyncio.wait_for(
+            cdp_session.cdp_client.send.Runtime.evaluate(
+                params={'expression': self.script, 'returnByValue': True, 'awaitPromise': True},
+                session_id=cdp_session.session_id
+            ),
+            timeout=self.read_timeout_seconds
+        )
+        return response.get('result', {}).get('value')
+
+    def find_violations(self, vitals):
+        violations = []
+        for budget_key, reason, metric, scale, document_only in BUDGET_METRICS:
+            limit = self.budget.get(budget_key)
+            value = vitals.get(metric)
+            if not limit or value is None or (document_only and not vitals["new_document"]):
+                continue
+            if value / scale > float(limit):
+                violations.append({"metric": reason, "value": value / scale, "limit": float(limit)})
+        return violations
+
+    async def on_step_end(self, agent):
+        history_item = agent.history.history[-1] if agent.history.history else None
+        model_output = history_item.model_output if history_item else None
+        action_names = [next(iter(action.model_dump(exclude_none=True)), None) for action in model_output.action] if model_output else []
+        # Steps that only report the result neither navigate nor interact
+        if not action_names or action_names == ["done"]:
+            return
+
+        step = len(agent.history.history)
+        start_time = time.time()
+        try:
+            vitals = await self.read_vitals(agent)
+        except Exception as e:
+            logger.warning(f"Could not read web vitals after step {step}: {e}")
+            return
+        if not vitals:
+            return
+        vitals["step"] = step
+        vitals["action_names"] = action_names
+        vitals["capture_seconds"] = time.time() - start_time
+        vitals["violations"] = self.find_violations(vitals)
+        self.steps[step] = vitals
+
+        if vitals["violations"] and not self.exceeded:
+            self.violations = vitals["violations"]
+            self.exceeded = vitals["violations"][0]["metric"]
+            summary = ", ".join(f"{v['metric']} {v['value']:g} > {v['limit']:g}" for v in vitals["violations"])
+            if agent.history.is_done():
+                # The step also finished the run, nothing is left to stop but the run fails all the same
+                history_item.result[-1].success = False
+                logger.warning(f"Step {step} on {vitals['url']} exceeded its performance budget: {summary}, failing the finished run")
+            else:
+                logger.warning(f"Step {step} on {vitals['url']} exceeded its performance budget: {summary}, stopping")
+                agent.stop()
+
+    def get_failure_reason(self):
+        return f"performance_budget_exceeded:{self.exceeded}" if self.exceeded else None
+
+    def save_report(self, test_run_slug):
+        """
+        Save every measured step as `performance/{step}.json`, numbered like `screenshots/{step}.png`,
+        and a `performance.json` summary, and record the failure reason if the budget stopped the run
+        """
+        try:
+            for step, vitals in self.steps.items():
+                s3_client.put_object(
+                    Bucket=S3_BUCKET_NAME,
+                    Key=f"test-runs/{test_run_slug}/performance/{step}.json",
+                    Body=json.dumps(vitals),
+                    ContentType='application/json',
+                )
+            report = {
+                "budget": self.budget,
+                "failure_reason": self.get_failure_reason(),
+                "violations": self.violations,
+                "steps": [
+                    {key: vitals[key] for key in ("step", "url", "new_document", "load_ms", "lcp_ms", "cls", "inp_ms", "requests", "transfer_bytes")}
+                    for vitals in self.steps.values()
+                ],
+            }
+            s3_client.put_object(
+                Bucket=S3_BUCKET_NAME,
+                Key=f"test-runs/{test_run_slug}/performance.json",
+                Body=json.dumps(report),
+                ContentType='application/json',
+            )
+        except Exception as e:
+            logger.error(f"Error saving performance report for test run {test_run_slug}: {e}")
+        if self.exceeded:
+            update_test_run_failure_reason(test_run_slug, self.get_failure_reason())
+
+
+def createWebVitalsRecorder(message):
+    """
+    Create the web vitals recorder of a run, unless WEB_VITALS is off and the run has no performance budget
+
+    Args:
+        message (dict): The test run message
+
+    Returns:
+        WebVitalsRecorder or None: The recorder, None if nothing is measured
+    """
+    budget = get_performance_budget(message)
+    if not WEB_VITALS and not budget:
+        return None
+    return WebVitalsRecorder(budget)
@@ -20,6 +20,7 @@ import { stat } from "fs";
 interface AnalysisData {
   slug: string;
   status: string;
+  failureReason?: string | null;
   createdAt: string;
   updatedAt: string;
   organization: {
@@ -128,6 +129,11 @@ export default async function AnalysisPage({
               size="large"
               sx={{ fontWeight: 'bold', px: 2, py: 1 }}
             />
+            {analysis.failureReason && (
+              <Typography variant="caption" color="text.secondary" display="block">
+                Failure Reason: {analysis.failureReason}
+              </Typography>
+            )}
           </Grid>
         </Grid>
       </Box>
@@ -13,7 +13,7 @@ import Link from "next/link";
 
 import { getSession } from "@/lib/next-auth";
 import { getDBModels } from "@/lib/sequelize";
-import { getTestRunSummary } from "@/lib/s3";
+import { getTestRunIndex, getTestRunSummary } from "@/lib/s3";
 import ScreenshotsGrid from "./ScreenshotsGrid";
 
 interface TestRunData {
@@ -21,6 +21,7 @@ interface TestRunData {
   modelSlug: string;
   modelProvider: string;
   status: string;
+  failureReason?: string | null;
   createdAt: string;
   updatedAt: string;
   version: {
@@ -133,7 +134,20 @@ export default async function TestRunPage({
     return redirect(`/${organizationSlug}/${projectSlug}/runs`, RedirectType.push);
   }
 
-  const testRunSummary = await getTestRunSummary(testRunSlug);
+  // Prefer the lightweight index manifest, older runs only have the full run.json
+  const testRunIndex = await getTestRunIndex(testRunSlug);
+  const testRunSummary = testRunIndex ? null : await getTestRunSummary(testRunSlug);
+  const stepMemories: string[] = testRunIndex
+    ? testRunIndex.steps
+        .filter((step) => step.memory !== null)
+        .map((step) => step.memory as string)
+    : testRunSummary?.model_thoughts.map((thought) => thought.memory) || [];
+  const finalResult = testRunIndex
+    ? testRunIndex.final_result
+    : testRunSummary?.final_result;
+  const screenshots = testRunIndex
+    ? testRunIndex.steps.map((step) => step.screenshot)
+    : testRunSummary?.screenshots || [];
 
   return (
     <Box>
@@ -183,6 +197,16 @@ export default async function TestRunPage({
                       {capitalize(testRun.status)}
                     </Typography>
                   </Box>
+                  {testRun.failureReason && (
+                    <Box sx={{ display: 'flex' }}>
+                      <Typography variant="body1" color="text.secondary" sx={{ mr: 1 }}>
+                        Failure Reason:
+                      </Typography>
+                      <Typography variant="body1">
+                        {testRun.failureReason}
+                      </Typography>
+                    </Box>
+                  )}
                   <Box sx={{ display: 'flex' }}>
                     <Typography variant="body1" color="text.secondary" sx={{ mr: 1 }}>
                       Created:
@@ -253,11 +277,11 @@ export default async function TestRunPage({
                     Test results will be available after the test run completes.
                   </Typography>
                 ) : (
-                  testRunSummary && testRunSummary.model_thoughts.map((thought, idx) =>
+                  stepMemories.map((memory, idx) =>
                     <Box key={`thought-${idx}`} sx={{ mt: 2, display: 'flex' }}>
                       <Box sx={{ fontFamily: "monospace", fontWeight: 'bold', mr: 1, borderRadius: 1, height: 40, width: 40, border: '1px solid gray', display: 'flex', alignItems: 'center', justifyContent: 'center', flex: 'none' }}>{idx + 1}</Box>
                       <Typography variant="body2" sx={{ fontFamily: "monospace" }}>
-                        {thought.memory}
+                        {memory}
                       </Typography>
                     </Box>
                   )
@@ -277,9 +301,9 @@ export default async function TestRunPage({
                     Test results will be available after the test run completes.
                   </Typography>
                 ) : (
-                  testRunSummary &&
+                  finalResult &&
                   <Typography variant="body2" sx={{ fontFamily: "monospace" }}>
-                    {testRunSummary.final_result}
+                    {finalResult}
                   </Typography>
                 )}
               </CardContent>
@@ -295,7 +319,7 @@ export default async function TestRunPage({
                   </Typography>
                 ) : (
                   <ScreenshotsGrid 
-                    screenshots={testRunSummary?.screenshots?.filter((value, idx) => idx > 0) || []}
+                    screenshots={screenshots.filter((value, idx) => idx > 0)}
                   />
                 )}
               </CardContent>
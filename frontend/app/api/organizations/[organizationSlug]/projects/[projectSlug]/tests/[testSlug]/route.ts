@@ -78,7 +78,8 @@ export const PATCH = async (
   const user = await User.findByEmail(email);
   if (!user) return notAuthorized();
 
-  const { title, description } = await request.json();
+  const { title, description, storageStateMode, performanceBudget } =
+    await request.json();
 
   try {
     const organization = await Organization.findBySlugAndUserEmail(
@@ -120,7 +121,18 @@ export const PATCH = async (
       description,
       user,
       test,
-      true
+      true,
+      // A new version keeps the settings of the one it replaces unless the request sets them
+      {
+        storageStateMode:
+          storageStateMode !== undefined
+            ? storageStateMode
+            : currentDefaultVersion.storageStateMode,
+        performanceBudget:
+          performanceBudget !== undefined
+            ? performanceBudget
+            : currentDefaultVersion.performanceBudget,
+      }
     );
 
     return NextResponse.json({
@@ -134,6 +146,8 @@ export const PATCH = async (
         description: newDefaultVersion.description,
         number: newDefaultVersion.number,
         isDefault: newDefaultVersion.isDefault,
+        storageStateMode: newDefaultVersion.storageStateMode,
+        performanceBudget: newDefaultVersion.performanceBudget,
       },
     });
   } catch (err: any) {
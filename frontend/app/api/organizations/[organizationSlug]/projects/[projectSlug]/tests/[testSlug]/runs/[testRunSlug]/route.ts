@@ -51,6 +51,7 @@ export const GET = async (
       testRun: {
         slug: testRun.slug,
         status: testRun.status,
+        failureReason: testRun.failureReason,
         createdAt: testRun.createdAt,
         updatedAt: testRun.updatedAt,
         version: {
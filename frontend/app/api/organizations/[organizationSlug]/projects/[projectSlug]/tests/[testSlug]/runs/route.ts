@@ -1,7 +1,7 @@
 import { NextRequest, NextResponse } from "next/server";
 import { getDBModels } from "@/lib/sequelize";
 import { getToken } from "next-auth/jwt";
-import { SQSClient, SendMessageCommand } from "@aws-sdk/client-sqs";
+import { sendQueueMessage } from "@/lib/queue";
 
 const notAuthorized = () =>
   NextResponse.json({ message: "Not Authorized" }, { status: 401 });
@@ -56,7 +56,6 @@ export const GET = async (
   }
 };
 
-const sqsClient = new SQSClient({ region: "us-west-2" });
 const QUEUE_URL =
   "https://sqs.us-west-2.amazonaws.com/746664778706/flow-tester-test-runs-queue";
 
@@ -218,16 +217,18 @@ export const POST = async (
         task: targetVersion.description,
         modelSlug: modelSlug || "gemini-2.5-flash",
         modelProvider: modelProvider || "Google",
+        storageStateMode: targetVersion.storageStateMode,
+        performanceBudget: targetVersion.performanceBudget,
       };
 
-      const command = new SendMessageCommand({
-        QueueUrl: QUEUE_URL,
-        MessageBody: JSON.stringify(message),
-      });
-
-      await sqsClient.send(command);
+      await sendQueueMessage(QUEUE_URL, message);
     } catch (sqsError) {
       console.error("Failed to send SQS message:", sqsError);
+      // No worker will ever pick the run up, so it must not stay pending
+      await newTestRun.update({
+        status: "failed",
+        failureReason: "enqueue_failed",
+      });
     }
 
     return NextResponse.json({
@@ -68,7 +68,8 @@ export const PUT = async (
   if (!user) return notAuthorized();
 
   // Create test
-  const { title, description } = await request.json();
+  const { title, description, storageStateMode, performanceBudget } =
+    await request.json();
   try {
     const organization = await Organization.findBySlugAndUserEmail(
       organizationSlug,
@@ -88,7 +89,8 @@ export const PUT = async (
       description,
       user,
       test,
-      true
+      true,
+      { storageStateMode, performanceBudget }
     );
 
     return NextResponse.json({
@@ -101,6 +103,8 @@ export const PUT = async (
         description: testVersion.description,
         number: testVersion.number,
         isDefault: testVersion.isDefault,
+        storageStateMode: testVersion.storageStateMode,
+        performanceBudget: testVersion.performanceBudget,
       },
       project: {
         name: project.name,
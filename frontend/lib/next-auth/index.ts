@@ -4,12 +4,11 @@ import { type NextAuthOptions, getServerSession } from "next-auth";
 import { getDBModels } from "@/lib/sequelize";
 import { capitalCase } from "change-case";
 import { cookies } from "next/headers";
-import { SQSClient, SendMessageCommand } from "@aws-sdk/client-sqs";
+import { sendQueueMessage } from "@/lib/queue";
 import { IOrganizationInstance } from "../sequelize/models/organization";
 import { IUserInstance } from "../sequelize/models/user";
 import { IOrganizationAnalysisInstance } from "../sequelize/models/organization-analysis";
 
-const sqsClient = new SQSClient({ region: "us-west-2" });
 const QUEUE_URL =
   "https://sqs.us-west-2.amazonaws.com/746664778706/flow-tester-test-runs-queue";
 
@@ -141,12 +140,7 @@ async function createAnalysisQueueMessage(
       modelProvider: "OpenAI",
     };
 
-    const command = new SendMessageCommand({
-      QueueUrl: QUEUE_URL,
-      MessageBody: JSON.stringify(message),
-    });
-
-    await sqsClient.send(command);
+    await sendQueueMessage(QUEUE_URL, message);
   } catch (sqsError) {
     console.error("Failed to send SQS message:", sqsError);
   }
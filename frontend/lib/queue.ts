@@ -0,0 +1,69 @@
+import { S3Client, PutObjectCommand } from "@aws-sdk/client-s3";
+import { SQSClient, SendMessageCommand } from "@aws-sdk/client-sqs";
+import { gzipSync } from "zlib";
+import { ulid } from "ulid";
+
+const sqsClient = new SQSClient({ region: "us-west-2" });
+const s3Client = new S3Client({
+  region: process.env.AWS_REGION || "us-west-2",
+});
+
+const S3_BUCKET_NAME = process.env.S3_BUCKET_NAME || "flow-tester";
+// SQS rejects bodies over 256KB, larger messages are sent as a claim check to a payload in S3
+const QUEUE_INLINE_MAX_BYTES = Number(
+  process.env.QUEUE_INLINE_MAX_BYTES || 64 * 1024
+);
+const CLAIM_CHECK_PREFIX = "queue-payloads";
+// Kept inline in claim checks, the worker's scheduler reads them before fetching the payload
+const ROUTING_FIELDS = [
+  "taskType",
+  "testRunSlug",
+  "analysisSlug",
+  "suiteRunSlug",
+  "organizationSlug",
+  "organizationDomain",
+  "projectSlug",
+];
+
+/**
+ * Send a message to a worker queue, storing it gzipped in S3 and sending a claim check
+ * instead when it is larger than QUEUE_INLINE_MAX_BYTES
+ * @param queueUrl - The SQS queue URL
+ * @param message - The queue message
+ */
+export async function sendQueueMessage(
+  queueUrl: string,
+  message: Record<string, any>
+): Promise<void> {
+  let body = JSON.stringify(message);
+  const size = Buffer.byteLength(body);
+
+  if (size > QUEUE_INLINE_MAX_BYTES) {
+    const key = `${CLAIM_CHECK_PREFIX}/${ulid()}.json.gz`;
+    await s3Client.send(
+      new PutObjectCommand({
+        Bucket: S3_BUCKET_NAME,
+        Key: key,
+        Body: gzipSync(body),
+        ContentType: "application/json",
+        ContentEncoding: "gzip",
+      })
+    );
+    body = JSON.stringify({
+      ...Object.fromEntries(
+        ROUTING_FIELDS.filter((field) => field in message).map((field) => [
+          field,
+          message[field],
+        ])
+      ),
+      claimCheck: { bucket: S3_BUCKET_NAME, key, encoding: "gzip", size },
+    });
+  }
+
+  await sqsClient.send(
+    new SendMessageCommand({
+      QueueUrl: queueUrl,
+      MessageBody: body,
+    })
+  );
+}
@@ -25,6 +25,37 @@ export interface TestRunSummary {
   errors: any[];
 }
 
+export interface TestRunIndexStep {
+  step: number;
+  chunk: number;
+  status: "succeeded" | "failed" | "done";
+  action_names: string[];
+  url: string | null;
+  memory: string | null;
+  duration_seconds: number | null;
+  screenshot: { id: number; path: string };
+}
+
+export interface TestRunIndex {
+  number_of_steps: number;
+  chunk_size: number;
+  is_done: boolean;
+  is_successful: boolean | null;
+  total_duration_seconds: number;
+  final_result: any;
+  steps: TestRunIndexStep[];
+}
+
+export interface TestRunStepDetails {
+  step: number;
+  model_output: any;
+  results: any[];
+  url: string | null;
+  title: string | null;
+  step_start_time: number | null;
+  step_end_time: number | null;
+}
+
 export interface AnalysisTestCase {
   title: string;
   description: string;
@@ -85,6 +116,64 @@ export async function getTestRunSummary(testRunSlug: string): Promise<TestRunSum
   }
 }
 
+/**
+ * Load the lightweight index manifest of a test run from S3
+ * @param testRunSlug - The slug of the test run
+ * @returns Promise<TestRunIndex | null> - The index or null if the run has no index (older runs)
+ */
+export async function getTestRunIndex(testRunSlug: string): Promise<TestRunIndex | null> {
+  try {
+    const command = new GetObjectCommand({
+      Bucket: S3_BUCKET_NAME,
+      Key: `test-runs/${testRunSlug}/index.json`,
+    });
+
+    const response = await s3Client.send(command);
+    if (!response.Body) return null;
+
+    return JSON.parse(await response.Body.transformToString());
+  } catch (error: any) {
+    if (error.name === "NoSuchKey") return null;
+
+    console.error(`Error fetching test run index for ${testRunSlug}:`, error);
+    throw new Error(`Failed to fetch test run index: ${error.message}`);
+  }
+}
+
+/**
+ * Load the details of a range of steps, fetching only the chunks that cover the range
+ * @param testRunSlug - The slug of the test run
+ * @param index - The test run index manifest
+ * @param startStep - First step to load (1-based, inclusive)
+ * @param endStep - Last step to load (inclusive), defaults to the last step
+ * @returns Promise<TestRunStepDetails[]> - The step details in order
+ */
+export async function getTestRunSteps(
+  testRunSlug: string,
+  index: TestRunIndex,
+  startStep: number = 1,
+  endStep: number = index.number_of_steps
+): Promise<TestRunStepDetails[]> {
+  const firstChunk = Math.floor((startStep - 1) / index.chunk_size);
+  const lastChunk = Math.floor((endStep - 1) / index.chunk_size);
+
+  const chunks = await Promise.all(
+    Array.from({ length: lastChunk - firstChunk + 1 }, async (_, offset) => {
+      const command = new GetObjectCommand({
+        Bucket: S3_BUCKET_NAME,
+        Key: `test-runs/${testRunSlug}/steps/${firstChunk + offset}.json`,
+      });
+      const response = await s3Client.send(command);
+      if (!response.Body) return [];
+      return JSON.parse(await response.Body.transformToString()) as TestRunStepDetails[];
+    })
+  );
+
+  return chunks
+    .flat()
+    .filter((step) => step.step >= startStep && step.step <= endStep);
+}
+
 /**
  * Load analysis summary data from S3
  * @param analysisSlug - The slug of the analysis
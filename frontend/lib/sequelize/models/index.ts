@@ -8,6 +8,7 @@ import defineProjectModel, { IProjectModel } from "./project";
 import defineTestModel, { ITestModel } from "./test";
 import defineTestVersionModel, { ITestVersionModel } from "./test-version";
 import defineTestRunVersionModel, { ITestRunModel } from "./test-run";
+import defineTestRunStepModel, { ITestRunStepModel } from "./test-run-step";
 import defineResetPasswordTokenModel from "./reset-password-token";
 import defineInviteModel, { IInviteModel } from "./invite";
 import defineOrganizationAnalysisModel, { IOrganizationAnalysisModel } from "./organization-analysis";
@@ -21,6 +22,7 @@ export interface IModels {
   Test: ITestModel;
   TestVersion: ITestVersionModel;
   TestRun: ITestRunModel;
+  TestRunStep: ITestRunStepModel;
   Invite: IInviteModel;
 }
 
@@ -32,6 +34,7 @@ export default function defineModels(sequelizeConnection: Sequelize): IModels {
   const Test = defineTestModel(sequelizeConnection);
   const TestVersion = defineTestVersionModel(sequelizeConnection);
   const TestRun = defineTestRunVersionModel(sequelizeConnection);
+  const TestRunStep = defineTestRunStepModel(sequelizeConnection);
   const UsersOrganizations = defineUsersOrganizationsModel(sequelizeConnection);
   const Invite = defineInviteModel(sequelizeConnection);
 
@@ -44,6 +47,7 @@ export default function defineModels(sequelizeConnection: Sequelize): IModels {
     Test,
     TestVersion,
     TestRun,
+    TestRunStep,
     Invite,
   };
 }
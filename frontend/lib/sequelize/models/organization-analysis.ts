@@ -20,6 +20,7 @@ export interface IOrganizationAnalysisInstance extends Model {
   id: number;
   slug: string;
   status: OrganizationAnalysisStatus;
+  failureReason?: string | null;
   createdAt: Date;
   updatedAt: Date;
   deletedAt?: Date;
@@ -61,6 +62,10 @@ export default function defineOrganizationAnalysisModel(
           notEmpty: true,
         },
       },
+      failureReason: {
+        type: DataTypes.STRING,
+        field: "failure_reason",
+      },
     },
     {
       tableName: "organizations_analyses",
@@ -0,0 +1,91 @@
+import { Sequelize, DataTypes, Model, ModelStatic, Op } from "sequelize";
+import { IModels } from ".";
+import { ITestRunInstance } from "./test-run";
+
+export interface ITestRunStepInstance extends Model {
+  id: number;
+  stepNumber: number;
+  actionName?: string;
+  url?: string;
+  durationSeconds?: number;
+  screenshotKey?: string;
+  createdAt: Date;
+}
+
+export interface ITestRunStepModel extends ModelStatic<ITestRunStepInstance> {
+  associate(models: IModels): void;
+  findAllAfterStep(
+    testRun: ITestRunInstance,
+    afterStep: number
+  ): Promise<ITestRunStepInstance[]>;
+}
+
+export default function defineTestRunStepModel(
+  sequelize: Sequelize
+): ITestRunStepModel {
+  const TestRunStep = sequelize.define(
+    "TestRunStep",
+    {
+      stepNumber: {
+        type: DataTypes.INTEGER,
+        allowNull: false,
+      },
+      actionName: {
+        type: DataTypes.STRING,
+      },
+      url: {
+        type: DataTypes.TEXT,
+      },
+      durationSeconds: {
+        type: DataTypes.FLOAT,
+      },
+      screenshotKey: {
+        type: DataTypes.STRING,
+      },
+    },
+    {
+      tableName: "tests_runs_steps",
+      // Progress rows are append-only and written by the agent worker
+      paranoid: false,
+      updatedAt: false,
+      indexes: [
+        {
+          unique: true,
+          fields: ["run_id", "step_number"],
+        },
+      ],
+    }
+  ) as ITestRunStepModel;
+
+  TestRunStep.associate = function associate(models) {
+    const { TestRun } = models;
+
+    this.belongsTo(TestRun, {
+      as: "run",
+      foreignKey: {
+        name: "run_id",
+        allowNull: false,
+      },
+    });
+  };
+
+  TestRunStep.findAllAfterStep = async function findAllAfterStep(
+    testRun: ITestRunInstance,
+    afterStep: number
+  ) {
+    return this.findAll({
+      where: { run_id: testRun.id, stepNumber: { [Op.gt]: afterStep } },
+      attributes: [
+        "stepNumber",
+        "actionName",
+        "url",
+        "durationSeconds",
+        "screenshotKey",
+        "createdAt",
+      ],
+      order: [["stepNumber", "ASC"]],
+    });
+  };
+
+  return TestRunStep;
+}
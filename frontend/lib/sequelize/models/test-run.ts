@@ -18,11 +18,13 @@ export enum TestRunStatus {
   Succeeded = "succeeded",
 }
 
-interface ITestRunInstance extends Model {
+export interface ITestRunInstance extends Model {
   id: number;
   slug: string;
   status: TestRunStatus;
   resultsURL: string;
+  failureReason?: string | null;
+  reapCount: number;
   modelSlug?: string;
   modelProvider?: string;
   version: ITestVersionInstance;
@@ -79,6 +81,16 @@ export default function defineTestRunModel(
         type: DataTypes.STRING,
         field: "results_url",
       },
+      failureReason: {
+        type: DataTypes.STRING,
+        field: "failure_reason",
+      },
+      reapCount: {
+        type: DataTypes.INTEGER,
+        allowNull: false,
+        defaultValue: 0,
+        field: "reap_count",
+      },
       modelSlug: {
         type: DataTypes.STRING,
         allowNull: false,
@@ -96,6 +108,13 @@ export default function defineTestRunModel(
     },
     {
       tableName: "tests_runs",
+      indexes: [
+        {
+          name: "tests_runs_version_id_status_updated_at",
+          fields: ["version_id", "status", { name: "updated_at", order: "DESC" }],
+          where: { deleted_at: null },
+        },
+      ],
     }
   ) as ITestRunModel;
 
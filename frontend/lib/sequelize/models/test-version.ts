@@ -11,6 +11,26 @@ import { IUserInstance } from "./user";
 import { ITestInstance } from "./test";
 import { ITestRunInstance } from "./test-run";
 
+// 'use' starts runs from the project's storage state snapshot, 'capture' saves it after the run
+export type StorageStateMode = "use" | "capture";
+
+// Thresholds that fail a run when one of its steps goes over them
+export interface IPerformanceBudget {
+  maxTtfbSeconds?: number;
+  maxLoadSeconds?: number;
+  maxFcpSeconds?: number;
+  maxLcpSeconds?: number;
+  maxCls?: number;
+  maxInpMs?: number;
+  maxRequests?: number;
+  maxTransferBytes?: number;
+}
+
+export interface ITestVersionSettings {
+  storageStateMode?: StorageStateMode | null;
+  performanceBudget?: IPerformanceBudget | null;
+}
+
 export interface ITestVersionInstance extends Model {
   id: number;
   slug: string;
@@ -18,6 +38,8 @@ export interface ITestVersionInstance extends Model {
   description: string;
   number: number;
   isDefault: boolean;
+  storageStateMode: StorageStateMode | null;
+  performanceBudget: IPerformanceBudget | null;
   test: ITestInstance;
   runs: ITestRunInstance[];
   setCreatedBy(
@@ -37,7 +59,8 @@ export interface ITestVersionModel extends ModelStatic<ITestVersionInstance> {
     description: string,
     user: IUserInstance,
     test: ITestInstance,
-    isDefault: boolean
+    isDefault: boolean,
+    settings?: ITestVersionSettings
   ): Promise<ITestVersionInstance>;
   findNextVersionNumber(test: ITestInstance): Promise<number>;
   setAsDefault(versionSlug: string, test: ITestInstance): Promise<ITestVersionInstance | null>;
@@ -81,6 +104,17 @@ export default function defineTestVersionModel(
         type: DataTypes.BOOLEAN,
         defaultValue: false,
       },
+      storageStateMode: {
+        type: DataTypes.STRING,
+        field: "storage_state_mode",
+        validate: {
+          isIn: [["use", "capture"]],
+        },
+      },
+      performanceBudget: {
+        type: DataTypes.JSONB,
+        field: "performance_budget",
+      },
     },
     {
       tableName: "tests_versions",
@@ -136,11 +170,20 @@ export default function defineTestVersionModel(
     description: string,
     user: IUserInstance,
     test: ITestInstance,
-    isDefault: boolean
+    isDefault: boolean,
+    settings: ITestVersionSettings = {}
   ) {
     const number = await this.findNextVersionNumber(test);
     const slug = ulid();
-    const newTestVersion = this.build({ title, description, number, slug, isDefault });
+    const newTestVersion = this.build({
+      title,
+      description,
+      number,
+      slug,
+      isDefault,
+      storageStateMode: settings.storageStateMode || null,
+      performanceBudget: settings.performanceBudget || null,
+    });
 
     newTestVersion.setCreatedBy(user, { save: false });
     newTestVersion.setTest(test, { save: false });
@@ -16,9 +16,9 @@ async function processMessage(record) {
   const messageBody = JSON.parse(record.body);
   console.log('--------- message received ------------');
   
-  // Check if message type is "test-run" and route to FlowTesterTestRunsQueue
-  if (messageBody.taskType === "test-run") {
-    console.log('Routing test-run message to FlowTesterTestRunsQueue');
+  // Check if message type is "test-run" or "suite-run" and route to FlowTesterTestRunsQueue
+  if (messageBody.taskType === "test-run" || messageBody.taskType === "suite-run") {
+    console.log(`Routing ${messageBody.taskType} message to FlowTesterTestRunsQueue`);
     await addFlowTestRunToQueue(messageBody);
     console.log('Message successfully sent to FlowTesterTestRunsQueue');
     
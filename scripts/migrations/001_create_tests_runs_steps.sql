@@ -0,0 +1,15 @@
+-- Live per-step progress of in-flight test runs, appended by the agent worker
+CREATE TABLE IF NOT EXISTS tests_runs_steps (
+    id SERIAL PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES tests_runs (id) ON DELETE CASCADE,
+    step_number INTEGER NOT NULL,
+    action_name VARCHAR(255),
+    url TEXT,
+    duration_seconds DOUBLE PRECISION,
+    screenshot_key VARCHAR(255),
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Serves "steps after index N" reads and makes redelivered steps idempotent
+CREATE UNIQUE INDEX IF NOT EXISTS tests_runs_steps_run_id_step_number
+    ON tests_runs_steps (run_id, step_number);
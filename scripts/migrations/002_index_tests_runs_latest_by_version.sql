@@ -0,0 +1,6 @@
+-- Serves "latest succeeded run per version" lookups (single and batched DISTINCT ON)
+-- with an index scan instead of sorting every run of the version.
+-- CONCURRENTLY avoids locking tests_runs writes while the index builds; run outside a transaction.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS tests_runs_version_id_status_updated_at
+    ON tests_runs (version_id, status, updated_at DESC)
+    WHERE deleted_at IS NULL;
@@ -0,0 +1,3 @@
+-- Why a run failed when it was stopped rather than failing its test,
+-- e.g. 'budget_exceeded:max_steps' when a step, time, token or cost budget ran out.
+ALTER TABLE tests_runs ADD COLUMN IF NOT EXISTS failure_reason VARCHAR(255);
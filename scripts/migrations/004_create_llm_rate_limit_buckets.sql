@@ -0,0 +1,7 @@
+-- Token buckets shared by every agent worker, one row per (provider/model, rpm|tpm).
+-- The level goes negative while callers wait for capacity they have already reserved.
+CREATE TABLE IF NOT EXISTS llm_rate_limit_buckets (
+    bucket_key VARCHAR(255) PRIMARY KEY,
+    level DOUBLE PRECISION NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
@@ -0,0 +1,22 @@
+-- Weighted fair scheduling state shared by the agent workers.
+-- A flow is one organization and task type; its virtual time grows by processing time / weight,
+-- and the flow with the lowest virtual time is served next.
+CREATE TABLE IF NOT EXISTS scheduler_flows (
+    flow_key VARCHAR(255) PRIMARY KEY,
+    virtual_time DOUBLE PRECISION NOT NULL DEFAULT 0,
+    started_count INTEGER NOT NULL DEFAULT 0,
+    total_wait_seconds DOUBLE PRECISION NOT NULL DEFAULT 0,
+    max_wait_seconds DOUBLE PRECISION NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Messages in progress, counted against per-organization concurrency caps
+CREATE TABLE IF NOT EXISTS scheduler_running (
+    message_id VARCHAR(255) PRIMARY KEY,
+    organization VARCHAR(255) NOT NULL,
+    flow_key VARCHAR(255) NOT NULL,
+    started_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS scheduler_running_organization_started_at
+    ON scheduler_running (organization, started_at);
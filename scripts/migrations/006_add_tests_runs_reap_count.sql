@@ -0,0 +1,10 @@
+-- How often the stale run reaper took a run back from a worker that stopped updating it;
+-- runs are requeued until they reach the reaper's limit, then marked failed.
+ALTER TABLE tests_runs ADD COLUMN IF NOT EXISTS reap_count INTEGER NOT NULL DEFAULT 0;
+
+-- Lets the reaper find runs stuck in pending or running with an index scan.
+-- Only unfinished runs are indexed, so the index stays small as the run history grows.
+-- CONCURRENTLY avoids locking tests_runs writes while the index builds; run outside a transaction.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS tests_runs_unfinished_status_updated_at
+    ON tests_runs (status, updated_at)
+    WHERE status IN ('pending', 'running') AND deleted_at IS NULL;
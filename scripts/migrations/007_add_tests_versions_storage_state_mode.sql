@@ -0,0 +1,4 @@
+-- Whether runs of a test version use the project's logged-in storage state snapshot:
+-- 'use' starts from the snapshot, 'capture' marks the project's login test, whose succeeded
+-- runs save the snapshot, and NULL starts every run logged out.
+ALTER TABLE tests_versions ADD COLUMN IF NOT EXISTS storage_state_mode VARCHAR(16);
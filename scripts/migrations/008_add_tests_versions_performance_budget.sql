@@ -0,0 +1,3 @@
+-- Performance thresholds of a test version's runs, e.g. '{"maxLoadSeconds": 3, "maxCls": 0.1}'.
+-- A run whose step goes over one is failed with 'performance_budget_exceeded:<metric>'.
+ALTER TABLE tests_versions ADD COLUMN IF NOT EXISTS performance_budget JSONB;
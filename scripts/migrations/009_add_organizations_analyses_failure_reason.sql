@@ -0,0 +1,3 @@
+-- Why an analysis failed when it was stopped rather than failing its task,
+-- e.g. 'budget_exceeded:max_seconds', like tests_runs.failure_reason.
+ALTER TABLE organizations_analyses ADD COLUMN IF NOT EXISTS failure_reason VARCHAR(255);